@@ -0,0 +1,307 @@
+"""
+End-to-end latency benchmark of GET /api/ for the Flask and Django apps.
+
+A local geocoder stub (geocoder_stub.py) stands in for api-adresse with a
+fixed latency. For every target, address distribution and concurrency level
+the harness sends --requests lookups with that many in flight, then reports
+throughput and p50/p95/p99 latencies. Each run is saved as JSON under
+benchmarks/results/ so runs can be compared over time.
+
+Address distributions:
+- hot: addresses drawn from a small pool (--hot-pool), requested once before
+  measuring, as when many users check the same addresses: the cached path.
+- cold: every address is new, so every request is geocoded and computed.
+
+Start the apps with GEOCODER_URL=http://127.0.0.1:8099, or let the harness
+start both under gunicorn with --start (database settings come from the
+environment, e.g. POSTGRES_HOST):
+    python benchmarks/e2e.py run --start --concurrency 1 10 50 --requests 300
+    python benchmarks/e2e.py compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+import httpx
+
+from geocoder_stub import GeocoderStub, StubServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+DISTRIBUTIONS = ("hot", "cold")
+
+# name -> (working directory, gunicorn application, port)
+APPS = {
+    "flask": ("sample1", "app:create_app()", 5000),
+    "django": ("sample2", "network_coverage.wsgi", 8000),
+}
+
+
+def start_apps(names, geocoder_url, workers, threads):
+    """
+    Start the apps under gunicorn and wait until they accept connections.
+    """
+    env = dict(os.environ, GEOCODER_URL=geocoder_url)
+    processes = []
+    for name in names:
+        directory, application, port = APPS[name]
+        command = [
+            sys.executable, "-m", "gunicorn", application,
+            "--workers", str(workers), "--threads", str(threads),
+            "--bind", f"127.0.0.1:{port}", "--log-level", "warning",
+        ]
+        processes.append(subprocess.Popen(command, cwd=os.path.join(ROOT, directory), env=env))
+    try:
+        for name, process in zip(names, processes):
+            wait_for_port(APPS[name][2], process)
+    except Exception:
+        stop_apps(processes)
+        raise
+    return processes
+
+
+def wait_for_port(port, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App on port {port} exited with status {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"App on port {port} did not start within {timeout}s")
+
+
+def stop_apps(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait(timeout=30)
+
+
+def scenario_addresses(distribution, requests, hot_pool, run_id, rng):
+    """
+    (addresses to warm up with, addresses to measure) of one scenario.
+    """
+    if distribution == "hot":
+        pool = [f"{i} rue du benchmark 75011 Paris" for i in range(hot_pool)]
+        return pool, [rng.choice(pool) for _ in range(requests)]
+    return [], [f"{i} avenue {run_id} 75011 Paris" for i in range(requests)]
+
+
+async def drive(url, addresses, concurrency, timeout):
+    """
+    GET `url` for every address with at most `concurrency` requests in flight.
+    Returns (latencies in seconds of the answered requests, status counts,
+    transport errors, wall time). Answers below 500, such as a 404 for an
+    address without coverage, count as answered.
+    """
+    latencies = []
+    statuses = Counter()
+    errors = 0
+    queue = iter(addresses)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+
+        async def worker():
+            nonlocal errors
+            for address in queue:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url, params={"q": address})
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                statuses[response.status_code] += 1
+                if response.status_code < 500:
+                    latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, statuses, errors, time.perf_counter() - start
+
+
+def summarize(latencies, elapsed):
+    if not latencies:
+        return 0.0, {}
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+        p95, p99 = cuts[94], cuts[98]
+    else:
+        p95 = p99 = latencies[0]
+    latency_ms = {
+        "p50": statistics.median(latencies) * 1000,
+        "p95": p95 * 1000,
+        "p99": p99 * 1000,
+        "max": max(latencies) * 1000,
+        "mean": statistics.fmean(latencies) * 1000,
+    }
+    return len(latencies) / elapsed, {name: round(value, 2) for name, value in latency_ms.items()}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    targets = dict(target.split("=", 1) for target in args.target) or {
+        name: f"http://127.0.0.1:{port}/api/" for name, (_, _, port) in APPS.items()
+    }
+    rng = random.Random(args.seed)
+    run_id = time.time_ns()
+    stub = GeocoderStub(args.latency, args.jitter)
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "settings": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "hot_pool": args.hot_pool,
+            "geocoder_latency": args.latency,
+            "geocoder_jitter": args.jitter,
+            "started_apps": args.start,
+            "workers": args.workers,
+            "threads": args.threads,
+        },
+        "results": [],
+    }
+
+    with ExitStack() as stack:
+        if not args.no_stub:
+            stack.enter_context(StubServer(stub, args.stub_port))
+        if args.start:
+            processes = start_apps(
+                [name for name in targets if name in APPS],
+                f"http://127.0.0.1:{args.stub_port}",
+                args.workers,
+                args.threads,
+            )
+            stack.callback(stop_apps, processes)
+
+        print(f"{'target':8} {'dist':5} {'conc':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}  errors  geocoder calls")
+        for name, url in targets.items():
+            for distribution in args.distributions:
+                for concurrency in args.concurrency:
+                    warm_up, addresses = scenario_addresses(
+                        distribution, args.requests, args.hot_pool, f"{run_id}-{concurrency}", rng
+                    )
+                    if warm_up:
+                        asyncio.run(drive(url, warm_up, concurrency, args.timeout))
+                    calls_before = stub.calls
+                    latencies, statuses, errors, elapsed = asyncio.run(
+                        drive(url, addresses, concurrency, args.timeout)
+                    )
+                    throughput, latency_ms = summarize(latencies, elapsed)
+                    errors += sum(count for status, count in statuses.items() if status >= 500)
+                    geocoder_calls = None if args.no_stub else stub.calls - calls_before
+                    report["results"].append(
+                        {
+                            "target": name,
+                            "url": url,
+                            "distribution": distribution,
+                            "concurrency": concurrency,
+                            "requests": len(addresses),
+                            "errors": errors,
+                            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+                            "geocoder_calls": geocoder_calls,
+                            "throughput_rps": round(throughput, 2),
+                            "latency_ms": latency_ms,
+                        }
+                    )
+                    print(
+                        f"{name:8} {distribution:5} {concurrency:>5} {throughput:>8.1f} "
+                        f"{latency_ms.get('p50', 0):>6.1f}ms {latency_ms.get('p95', 0):>6.1f}ms "
+                        f"{latency_ms.get('p99', 0):>6.1f}ms  {errors:>6}  {geocoder_calls}"
+                    )
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"e2e-{datetime.now(timezone.utc).strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+def compare(args):
+    """
+    Print the throughput and p50/p99 change of every scenario present in both runs.
+    """
+    def load(path):
+        with open(path) as f:
+            results = json.load(f)["results"]
+        return {(r["target"], r["distribution"], r["concurrency"]): r for r in results}
+
+    def change(old, new):
+        return f"{old:>8.1f} -> {new:>8.1f} ({(new - old) / old * 100 if old else 0:+6.1f}%)"
+
+    old, new = load(args.old), load(args.new)
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        print(f"{key[0]} {key[1]} c={key[2]}")
+        print(f"  req/s {change(before['throughput_rps'], after['throughput_rps'])}")
+        for percentile in ("p50", "p99"):
+            print(
+                f"  {percentile}   "
+                f"{change(before['latency_ms'].get(percentile, 0), after['latency_ms'].get(percentile, 0))}"
+            )
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"{' '.join(map(str, key))}: only in {'old' if key in old else 'new'} run")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench = commands.add_parser("run", help="Run the benchmark and save the results.")
+    bench.add_argument(
+        "--target", action="append", default=[], metavar="NAME=URL",
+        help="Endpoint to drive, repeatable (default: flask on :5000 and django on :8000).",
+    )
+    bench.add_argument("--start", action="store_true", help="Start the apps under gunicorn.")
+    bench.add_argument("--workers", type=int, default=1, help="gunicorn workers per app with --start.")
+    bench.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker with --start.")
+    bench.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    bench.add_argument("--distributions", nargs="+", choices=DISTRIBUTIONS, default=list(DISTRIBUTIONS))
+    bench.add_argument("--requests", type=int, default=300, help="Measured requests per scenario.")
+    bench.add_argument("--hot-pool", type=int, default=20, help="Distinct addresses of the hot distribution.")
+    bench.add_argument("--latency", type=float, default=0.05, help="Geocoder stub latency in seconds.")
+    bench.add_argument("--jitter", type=float, default=0.0, help="Extra random geocoder latency, up to this.")
+    bench.add_argument("--stub-port", type=int, default=8099)
+    bench.add_argument("--no-stub", action="store_true", help="Use a geocoder stub started separately.")
+    bench.add_argument("--timeout", type=float, default=60)
+    bench.add_argument("--seed", type=int, default=0)
+    bench.add_argument("--output", help="JSON file to write (default: benchmarks/results/e2e-<time>.json).")
+
+    diff = commands.add_parser("compare", help="Compare two saved runs.")
+    diff.add_argument("old")
+    diff.add_argument("new")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
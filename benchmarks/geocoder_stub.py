@@ -0,0 +1,97 @@
+"""
+Local stand-in for the /search/ endpoint of api-adresse.data.gouv.fr.
+
+Every answer waits `latency` seconds (plus up to `jitter` more) and returns a
+point scattered over Paris derived from the query, so an address always
+geocodes to the same point and the apps' caches behave as with the real API.
+
+Run it on its own and point the apps at it:
+    python benchmarks/geocoder_stub.py --port 8099 --latency 0.05
+    export GEOCODER_URL=http://127.0.0.1:8099
+
+sample2/benchmarks/load_test.py serves the same stub with its `stub` command.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs
+
+
+def coordinates(query):
+    """
+    Deterministic [lon, lat] for a query, within ~1.5 km of central Paris.
+    """
+    seed = zlib.crc32(query.encode())
+    lon = 2.3522 + (seed % 1000 - 500) / 25000
+    lat = 48.8566 + (seed // 1000 % 1000 - 500) / 40000
+    return [lon, lat]
+
+
+class GeocoderStub:
+    """
+    ASGI app answering /search/?q=... ; `calls` counts the geocoding requests.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        self.calls += 1
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        query = parse_qs(scope["query_string"].decode()).get("q", [""])[0]
+        body = json.dumps({"features": [{"geometry": {"coordinates": coordinates(query)}}]}).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+
+
+class StubServer:
+    """
+    Serve a GeocoderStub from a background thread.
+    """
+
+    def __init__(self, stub, port=8099):
+        import uvicorn
+
+        self.stub = stub
+        self.url = f"http://127.0.0.1:{port}"
+        self._server = uvicorn.Server(
+            uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning", lifespan="off")
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(f"Geocoder stub failed to start on {self.url}")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before each answer.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds.")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    uvicorn.run(GeocoderStub(args.latency, args.jitter), port=args.port, log_level="warning", lifespan="off")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,105 @@
+import functools
+import json
+import math
+import os
+import time
 import psycopg2
 import logging
-from flask import Flask, request, jsonify
+from flask import Flask, Response, current_app, request, jsonify, stream_with_context
+from coverage_grid import GridFile, build_grid, decode
+from db_pool import ConnectionPool
+from metrics import DB_CONNECTION_WAIT_SECONDS, db_pool_stats, db_query, render as render_metrics, stage
+from profiling import HEADER, QUERY_FLAG, RequestProfile, profiling_requested, record_query
+from rate_limit import RateLimited
+from shared_index import SharedIndex, ensure_published
+from singleflight import SingleFlight
+from snapshot import load_columns
+from spatial_index import GridIndex
+from tiles import TileRouter
+from transform import lambert93_errors, parse_points, wgs84_to_lambert93, wgs84_to_lambert93_arrays
 from utility import (
     get_db_connection,
     address_to_coordinates,
-    wgs84_to_lambert93,
+    batch_address_to_coordinates,
+    search_bounds,
 )
 
+MAX_DISTANCE = 3000  # radius to search around coordinates in meters
+
+# Seconds a process trusts its copy of the tile catalog (see tiles.py)
+TILE_CATALOG_TTL = 60
+
+# Rows within the radius in one tile. The radius query reads every tile the
+# circle overlaps, each of them once, with UNION ALL.
+TILE_COVERAGE_QUERY = """
+    SELECT Operateur, x, y, g2, g3, g4
+    FROM {partition}
+    WHERE x BETWEEN %s AND %s AND y BETWEEN %s AND %s AND
+          SQRT(POW(x - %s::float8, 2) + POW(y - %s::float8, 2)) <= %s
+"""
+COVERAGE_ORDER = """
+    ORDER BY x, y, Operateur, g2, g3, g4;
+"""
+
+# Same semantics as the radius query for many points at once: a technology
+# of an operator is available when any of its rows within the radius has it.
+# Each (point, operator) pair reads the (x, y) index until its first row in
+# range, instead of reading the whole radius. A technology that row lacks is
+# then looked for with an EXISTS probe that also stops at its first match.
+# The operators are those of OPERATOR_MAPPING, like the nearest mode, rather
+# than read from the whole table on every call.
+BATCH_IN_RADIUS = """
+    FROM network_data d
+    WHERE d.Operateur = o.Operateur AND
+          d.x BETWEEN p.x_min AND p.x_max AND d.y BETWEEN p.y_min AND p.y_max AND
+          SQRT(POW(d.x - p.px, 2) + POW(d.y - p.py, 2)) <= p.radius
+"""
+BATCH_COVERAGE_QUERY = f"""
+    SELECT p.idx, o.Operateur,
+           n.g2 OR EXISTS (SELECT {BATCH_IN_RADIUS} AND d.g2),
+           n.g3 OR EXISTS (SELECT {BATCH_IN_RADIUS} AND d.g3),
+           n.g4 OR EXISTS (SELECT {BATCH_IN_RADIUS} AND d.g4)
+    FROM (
+        SELECT idx, px, py, %s::float8 AS radius,
+               floor(px - %s)::int AS x_min, ceil(px + %s)::int AS x_max,
+               floor(py - %s)::int AS y_min, ceil(py + %s)::int AS y_max
+        FROM unnest(%s::int[], %s::float8[], %s::float8[]) AS u(idx, px, py)
+    ) p
+    CROSS JOIN unnest(%s::varchar[]) AS o(Operateur)
+    CROSS JOIN LATERAL (SELECT d.g2, d.g3, d.g4 {BATCH_IN_RADIUS} LIMIT 1) n
+    ORDER BY p.idx, o.Operateur;
+"""
+
+# Nearest measurement of each operator, read with one GiST KNN probe per
+# operator and partition instead of materializing the whole radius. The
+# radius is checked outside the LATERAL: filtering inside it would make the
+# index scan walk every row of an operator that has none in range. The x and
+# y bounds cover whole tiles, those the router picked, so they only prune
+# the other tiles and never reject a row of the scanned ones.
+NEAREST_COVERAGE_QUERY = """
+    SELECT o.Operateur, n.x, n.y, n.g2, n.g3, n.g4, n.distance
+    FROM unnest(%s::varchar[]) AS o(Operateur)
+    CROSS JOIN LATERAL (
+        SELECT d.x, d.y, d.g2, d.g3, d.g4, d.location <-> point(%s, %s) AS distance
+        FROM network_data d
+        WHERE d.Operateur = o.Operateur AND
+              d.x BETWEEN %s AND %s AND d.y BETWEEN %s AND %s
+        ORDER BY d.location <-> point(%s, %s)
+        LIMIT 1
+    ) n
+    WHERE n.distance <= %s
+    ORDER BY n.distance, o.Operateur;
+"""
+
+QUERY_MODES = ("radius", "nearest")
+
+OPERATOR_MAPPING = {
+    "20801": "Orange",
+    "20810": "SFR",
+    "20820": "Bouygues",
+    "20815": "Free",
+}
+
 def create_app(config_class="app_config.Config"):
     """
     Create and configure the Flask app.
@@ -23,85 +116,536 @@ def create_app(config_class="app_config.Config"):
         logging.error(f"Error importing configuration '{config_class}': {e}")
         raise
 
+    init_db_pool(flask_app)
+    init_coverage_engine(flask_app)
+    # Concurrent requests for the same point share one coverage lookup
+    flask_app.extensions["coverage_flight"] = SingleFlight()
+
     # Register routes to the instance-specific app
     register_routes(flask_app)
 
     return flask_app
 
 
+def init_db_pool(flask_app):
+    """
+    Attach a connection pool shared by the request threads of this process.
+    Connections are only opened on first use.
+    """
+    flask_app.extensions["db_pool"] = ConnectionPool(
+        get_db_connection,
+        minconn=flask_app.config["DB_POOL_MIN"],
+        maxconn=flask_app.config["DB_POOL_MAX"],
+        timeout=flask_app.config["DB_POOL_TIMEOUT"],
+        health_check_interval=flask_app.config["DB_POOL_HEALTH_CHECK_INTERVAL"],
+        on_wait=DB_CONNECTION_WAIT_SECONDS.observe,
+        on_stats=db_pool_stats,
+    )
+
+
+def init_coverage_engine(flask_app):
+    """
+    Load the in-memory spatial index when the "memory" engine is configured,
+    or attach to the one shared by all workers with the "shared" engine.
+    Postgres stays the fallback engine if the index cannot be built.
+    """
+    engine = flask_app.config.get("COVERAGE_ENGINE", "postgres")
+    flask_app.extensions["coverage_index"] = None
+    flask_app.extensions["coverage_grid"] = None
+    if engine == "grid":
+        init_coverage_grid(flask_app)
+        return
+    if engine not in ("memory", "shared"):
+        return
+
+    try:
+        if engine == "shared":
+            directory = flask_app.config["COVERAGE_SHARED_DIR"]
+            ensure_published(directory, lambda: build_coverage_index(flask_app))
+            index = SharedIndex(directory, refresh_interval=flask_app.config["COVERAGE_SHARED_REFRESH"])
+        else:
+            index = build_coverage_index(flask_app)
+        flask_app.extensions["coverage_index"] = index
+    except (OSError, ValueError, psycopg2.Error) as e:
+        logging.error(f"Failed to build in-memory index, falling back to Postgres: {e}")
+
+
+def build_coverage_index(flask_app):
+    """
+    Build the spatial index from the configured source.
+    """
+    if flask_app.config.get("COVERAGE_INDEX_SOURCE") == "db":
+        with flask_app.extensions["db_pool"].connection() as conn:
+            return GridIndex.from_db(conn)
+    return GridIndex.from_path(flask_app.config["COVERAGE_DATA_PATH"])
+
+
+def init_coverage_grid(flask_app):
+    """
+    Open the precomputed coverage grid, building it from the dataset when the
+    file does not exist yet. Postgres stays the fallback engine if it fails.
+    """
+    path = flask_app.config["COVERAGE_GRID_PATH"]
+    try:
+        if not os.path.exists(path):
+            logging.info(f"Building the coverage grid {path}...")
+            build_grid(
+                *load_columns(flask_app.config["COVERAGE_DATA_PATH"]),
+                cell_size=flask_app.config["COVERAGE_GRID_CELL_SIZE"],
+                radius=MAX_DISTANCE,
+            ).save(path)
+        grid_file = GridFile(path)
+        radius = grid_file.get().radius
+        if radius != MAX_DISTANCE:
+            raise ValueError(f"The grid was built for a {radius:g} m radius, not {MAX_DISTANCE} m")
+        flask_app.extensions["coverage_grid"] = grid_file
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to load the coverage grid, falling back to Postgres: {e}")
+
+
+def current_grid():
+    """
+    The grid of the "grid" engine, or None when it is not configured or unreadable.
+    """
+    grid_file = current_app.extensions.get("coverage_grid")
+    if grid_file is None:
+        return None
+    try:
+        return grid_file.get()
+    except (OSError, ValueError) as e:
+        logging.error(f"Coverage grid unavailable, using the radius query: {e}")
+        return None
+
+
+def current_index():
+    """
+    The index of the "memory" or "shared" engine, or None when neither is
+    configured or no shared generation can be read, so that Postgres answers.
+    """
+    index = current_app.extensions.get("coverage_index")
+    if not isinstance(index, SharedIndex):
+        return index
+    try:
+        return index.get()
+    except (OSError, ValueError) as e:
+        logging.error(f"Shared coverage index unavailable, using Postgres: {e}")
+        return None
+
+
+def tile_router():
+    """
+    Router over the tiles of `network_data`, read from their catalog at most
+    every TILE_CATALOG_TTL seconds. Tables loaded before the tiled layout
+    have no catalog and are queried whole.
+    """
+    cached = current_app.extensions.get("tile_router")
+    if cached is not None and time.monotonic() - cached[1] < TILE_CATALOG_TTL:
+        return cached[0]
+    with current_app.extensions["db_pool"].connection() as conn:
+        try:
+            router = TileRouter.load(conn.cursor())
+        except psycopg2.errors.UndefinedTable:
+            logging.warning("network_data has no tile catalog, querying it whole")
+            router = TileRouter.untiled()
+    current_app.extensions["tile_router"] = (router, time.monotonic())
+    return router
+
+
+def query_routed(mode, query, params):
+    """
+    Run a query built from the tile router. A tile missing from the
+    database means the dataset was reloaded since the catalog was read:
+    the catalog is read again on the next query.
+    """
+    record_query(mode, query, params)
+    try:
+        with current_app.extensions["db_pool"].connection() as conn, db_query(mode) as rows:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows.extend(cursor.fetchall())
+    except psycopg2.errors.UndefinedTable:
+        current_app.extensions.pop("tile_router", None)
+        raise
+    return rows
+
+
+def query_postgres(addr_x_l93, addr_y_l93, radius=MAX_DISTANCE):
+    """
+    Fetch the rows within `radius` meters from the tiles of `network_data`
+    the circle overlaps, and from no other tile.
+    """
+    partitions = tile_router().route(addr_x_l93, addr_y_l93, radius)
+    if not partitions:
+        return []
+    query = "    UNION ALL".join(TILE_COVERAGE_QUERY.format(partition=partition) for partition in partitions)
+    params = (*search_bounds(addr_x_l93, addr_y_l93, radius), addr_x_l93, addr_y_l93, radius) * len(partitions)
+    return query_routed("radius", query + COVERAGE_ORDER, params)
+
+
+def query_postgres_batch(xs, ys, radius=MAX_DISTANCE):
+    """
+    Resolve many points with one set-based query. Returns the flags of each
+    point like `operator_flags`.
+    """
+    flags_per_point = [{} for _ in range(len(xs))]
+    if not len(xs):
+        return flags_per_point
+    params = (
+        radius,
+        radius,
+        radius,
+        radius,
+        radius,
+        list(range(len(xs))),
+        [float(x) for x in xs],
+        [float(y) for y in ys],
+        list(OPERATOR_MAPPING),
+    )
+    record_query("batch", BATCH_COVERAGE_QUERY, params)
+    with current_app.extensions["db_pool"].connection() as conn, db_query("batch") as rows:
+        cursor = conn.cursor()
+        cursor.execute(BATCH_COVERAGE_QUERY, params)
+        rows.extend(cursor.fetchall())
+    for idx, operator_code, g2, g3, g4 in rows:
+        flags_per_point[idx][operator_code] = (g2, g3, g4)
+    return flags_per_point
+
+
+def query_postgres_nearest(addr_x_l93, addr_y_l93, radius=MAX_DISTANCE):
+    """
+    Fetch the nearest row of each known operator within `radius` meters,
+    as (Operateur, x, y, g2, g3, g4, distance) sorted by distance.
+    """
+    bounds = tile_router().bounds(addr_x_l93, addr_y_l93, radius)
+    if bounds is None:
+        return []
+    params = (list(OPERATOR_MAPPING), addr_x_l93, addr_y_l93, *bounds, addr_x_l93, addr_y_l93, radius)
+    return query_routed("nearest", NEAREST_COVERAGE_QUERY, params)
+
+
+def find_coverage_rows(addr_x_l93, addr_y_l93, radius=MAX_DISTANCE):
+    """
+    Answer the radius query with the configured engine.
+    """
+    index = current_index()
+    if index is not None:
+        return index.query(addr_x_l93, addr_y_l93, radius)
+    return query_postgres(addr_x_l93, addr_y_l93, radius)
+
+
+def find_coverage_flags_batch(xs, ys, radius=MAX_DISTANCE):
+    """
+    Answer the radius query for many points with the configured engine, as
+    the flags of each point like `operator_flags`.
+    """
+    index = current_index()
+    if index is not None:
+        return [operator_flags(index.query(x, y, radius)) for x, y in zip(xs, ys)]
+    return query_postgres_batch(xs, ys, radius)
+
+
+def find_nearest_rows(addr_x_l93, addr_y_l93, radius=MAX_DISTANCE):
+    """
+    Answer the nearest-per-operator query with the configured engine. The
+    in-memory index picks from its radius query; the grid engine has no
+    distances, so it uses Postgres.
+    """
+    index = current_index()
+    if index is None:
+        return query_postgres_nearest(addr_x_l93, addr_y_l93, radius)
+    nearest = {}
+    for row in index.query(addr_x_l93, addr_y_l93, radius):
+        distance = math.hypot(row[1] - addr_x_l93, row[2] - addr_y_l93)
+        if row[0] not in nearest or distance < nearest[row[0]][-1]:
+            nearest[row[0]] = (*row, distance)
+    return sorted(nearest.values(), key=lambda row: (row[-1], row[0]))
+
+
+def build_nearest_networks(rows):
+    """
+    Map nearest rows to {operator name: {"2G", "3G", "4G", "distance"}},
+    the distance being in meters.
+    """
+    return {
+        OPERATOR_MAPPING.get(operator_code, f"Unknown (Code={operator_code})"): {
+            "2G": g2,
+            "3G": g3,
+            "4G": g4,
+            "distance": round(distance, 1),
+        }
+        for operator_code, _, _, g2, g3, g4, distance in rows
+    }
+
+
+def operator_flags(rows):
+    """
+    {operator code: (g2, g3, g4)} of coverage rows, each flag OR-ed over the
+    rows of the operator, like the cells of the coverage grid.
+    """
+    flags = {}
+    for operator_code, _, _, g2, g3, g4 in rows:
+        old = flags.get(operator_code, (False, False, False))
+        flags[operator_code] = (old[0] or g2, old[1] or g3, old[2] or g4)
+    return flags
+
+
+def build_available_networks(rows):
+    """
+    Map coverage rows to {operator name: {"2G", "3G", "4G"}}, a technology
+    being available when any row of the operator has it.
+    """
+    return flag_networks(operator_flags(rows))
+
+
+def flag_networks(flags):
+    """
+    Map {operator code: (g2, g3, g4)} to {operator name: {"2G", "3G", "4G"}}.
+    """
+    return {
+        OPERATOR_MAPPING.get(code, f"Unknown (Code={code})"): {"2G": g2, "3G": g3, "4G": g4}
+        for code, (g2, g3, g4) in flags.items()
+    }
+
+
+def find_available_networks(addr_x_l93, addr_y_l93):
+    """
+    {operator name: {"2G", "3G", "4G"}} around the point, each technology
+    being available when any row of the operator within the radius has it.
+    The "grid" engine answers with a single cell lookup; the other engines,
+    and points outside the grid, run the radius query.
+    """
+    grid = current_grid()
+    if grid is not None:
+        coverage = grid.lookup(addr_x_l93, addr_y_l93)
+        if coverage is not None:
+            return flag_networks(coverage)
+    return build_available_networks(find_coverage_rows(addr_x_l93, addr_y_l93))
+
+
+def find_available_networks_batch(xs, ys):
+    """
+    `find_available_networks` for many points, with one query for the points
+    the grid cannot answer.
+    """
+    results = [None] * len(xs)
+    grid = current_grid()
+    if grid is not None:
+        for i, bits in enumerate(grid.lookup_bits(xs, ys)):
+            if bits >= 0:
+                results[i] = flag_networks(decode(bits, grid.operator_codes))
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        flags_per_point = find_coverage_flags_batch([xs[i] for i in missing], [ys[i] for i in missing])
+        for i, flags in zip(missing, flags_per_point):
+            results[i] = flag_networks(flags)
+    return results
+
+
+def locate_lookup(mode, addr_x_l93, addr_y_l93, cell_size):
+    """
+    (single-flight key, point to look up) of a `/api/` lookup. Radius lookups
+    are shared by the `cell_size` meter Lambert-93 cell and run for its
+    centre, so the answer is the same whichever request ran it; nearest
+    lookups report distances from the exact point, so they are keyed on it.
+    """
+    if mode == "nearest":
+        return (mode, addr_x_l93, addr_y_l93), (addr_x_l93, addr_y_l93)
+    cell = math.floor(addr_x_l93 / cell_size), math.floor(addr_y_l93 / cell_size)
+    return (mode, *cell), ((cell[0] + 0.5) * cell_size, (cell[1] + 0.5) * cell_size)
+
+
+def lookup_coverage(addr_x_l93, addr_y_l93, mode="radius"):
+    """
+    Coverage answer of `/api/` for the point in the given query mode.
+    """
+    if mode == "nearest":
+        return build_nearest_networks(find_nearest_rows(addr_x_l93, addr_y_l93))
+    return find_available_networks(addr_x_l93, addr_y_l93)
+
+
+def coverage_lines(xs, ys, ids, errors, chunk_size):
+    """
+    NDJSON lines answering POST /api/coordinates, in input order. Points are
+    resolved `chunk_size` at a time, so the first lines go out before the
+    last chunk is queried. A database error ends the stream with an error line.
+    """
+    for start in range(0, len(xs), chunk_size):
+        end = min(start + chunk_size, len(xs))
+        valid = [i for i in range(start, end) if errors[i] is None]
+        try:
+            with stage("lookup"):
+                coverage = dict(zip(valid, find_available_networks_batch(xs[valid], ys[valid]) if valid else []))
+        except psycopg2.Error as e:
+            logging.error(f"Database query failed: {e}")
+            yield json.dumps({"error": "Internal server error"}) + "\n"
+            return
+        with stage("serialize"):
+            lines = []
+            for i in range(start, end):
+                line = {"index": i}
+                if ids[i] is not None:
+                    line["id"] = ids[i]
+                if errors[i] is None:
+                    line["coverage"] = coverage[i]
+                else:
+                    line["error"] = errors[i]
+                lines.append(json.dumps(line) + "\n")
+        yield "".join(lines)
+
+
+def profiled(view):
+    """
+    Run the view under a RequestProfile when an allowed client asks for it
+    (see profiling.py). The report is logged and returned next to the answer
+    as {"response": ..., "profile": ...}.
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profiling_requested(
+            request.headers.get(HEADER),
+            request.args.get(QUERY_FLAG),
+            request.remote_addr,
+            current_app.config["PROFILE_ALLOWED_CLIENTS"],
+        ):
+            return view(*args, **kwargs)
+
+        with RequestProfile() as profile:
+            response = current_app.make_response(view(*args, **kwargs))
+        if profile.queries:
+            try:
+                with current_app.extensions["db_pool"].connection() as conn:
+                    profile.explain(conn.cursor())
+            except psycopg2.Error as e:
+                logging.error(f"Could not explain the profiled queries: {e}")
+        report = profile.report()
+        logging.info(f"Profile of {request.method} {request.full_path}: {json.dumps(report)}")
+        if response.is_json:
+            response.set_data(json.dumps({"response": response.get_json(), "profile": report}))
+        return response
+
+    return wrapper
+
+
 def register_routes(flask_app):
     """
     Register all routes with the Flask app.
     """
 
     @flask_app.route("/api/", methods=["GET"])
+    @profiled
     def get_network_coverage():
         address = request.args.get("q")
         if not address:
             return jsonify({"message": "No address provided."}), 400
+        mode = request.args.get("mode", "radius")
+        if mode not in QUERY_MODES:
+            return jsonify({"message": f"Unknown mode, use one of: {', '.join(QUERY_MODES)}."}), 400
 
-        coordinates = address_to_coordinates(address)
+        try:
+            with stage("geocode"):
+                coordinates = address_to_coordinates(address)
+        except RateLimited as e:
+            response = jsonify({"message": "Too many geocoding requests, try again later."})
+            response.headers["Retry-After"] = str(math.ceil(e.retry_after))
+            return response, 503
         if not coordinates:
             return jsonify({"message": "Unable to fetch coordinates."}), 404
 
-        addr_x_l93, addr_y_l93 = wgs84_to_lambert93(
-            coordinates["lon"], coordinates["lat"]
-        )
-
-        # Determine partition range for x
-        if addr_x_l93 < 400000:
-            partition = "network_data_p1"
-        elif addr_x_l93 < 800000:
-            partition = "network_data_p2"
-        else:
-            partition = "network_data_p3"
+        with stage("transform"):
+            addr_x_l93, addr_y_l93 = wgs84_to_lambert93(
+                coordinates["lon"], coordinates["lat"]
+            )
 
-        # Query database
         try:
-            MAX_DISTANCE = 3000  # radius to search around coordinates in meters
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            query = f"""
-                SELECT Operateur, x, y, g2, g3, g4
-                FROM {partition}
-                WHERE x BETWEEN %s AND %s AND
-                      SQRT(POW(x - %s, 2) + POW(y - %s, 2)) <= {MAX_DISTANCE};
-            """
-            cursor.execute(
-                query,
-                (
-                    addr_x_l93 - MAX_DISTANCE,
-                    addr_x_l93 + MAX_DISTANCE,
-                    addr_x_l93,
-                    addr_y_l93,
-                ),
-            )
-            rows = cursor.fetchall()
-            conn.close()
+            with stage("lookup"):
+                key, point = locate_lookup(
+                    mode, addr_x_l93, addr_y_l93, flask_app.config["COVERAGE_FLIGHT_CELL_SIZE"]
+                )
+                available_networks = flask_app.extensions["coverage_flight"].do(
+                    key, lookup_coverage, *point, mode
+                )
         except psycopg2.Error as e:
             logging.error(f"Database query failed: {e}")
             return jsonify({"message": "Internal server error"}), 500
 
-        # Map the results directly without additional distance checks
-        available_networks = {}
-        operator_mapping = {
-            "20801": "Orange",
-            "20810": "SFR",
-            "20820": "Bouygues",
-            "20815": "Free",
-        }
+        if not available_networks:
+            return jsonify({"message": "No network coverage found."}), 200
+        with stage("serialize"):
+            return jsonify(available_networks)
 
-        for row in rows:
-            operator_code, row_x_l93, row_y_l93, g2, g3, g4 = row
-            operator_name = operator_mapping.get(
-                operator_code, f"Unknown (Code={operator_code})"
+    @flask_app.route("/api/batch", methods=["POST"])
+    @profiled
+    def get_network_coverage_batch():
+        payload = request.get_json(silent=True)
+        addresses = payload.get("addresses") if isinstance(payload, dict) else payload
+        if not isinstance(addresses, list) or not addresses:
+            return jsonify({"message": "Provide a non-empty list of addresses."}), 400
+        if len(addresses) > flask_app.config["BATCH_MAX_ADDRESSES"]:
+            return (
+                jsonify(
+                    {
+                        "message": f"Too many addresses, the limit is {flask_app.config['BATCH_MAX_ADDRESSES']}."
+                    }
+                ),
+                413,
             )
-            if operator_name not in available_networks:
-                available_networks[operator_name] = {"2G": g2, "3G": g3, "4G": g4}
 
-        if not available_networks:
-            return jsonify({"message": "No network coverage found."}), 200
-        return jsonify(available_networks)
+        results = [{"address": address} for address in addresses]
+        valid = [
+            i for i, address in enumerate(addresses)
+            if isinstance(address, str) and address.strip()
+        ]
+        for i in set(range(len(addresses))) - set(valid):
+            results[i]["error"] = "No address provided."
+
+        coordinates = batch_address_to_coordinates([addresses[i] for i in valid])
+        located = []
+        for i, coords in zip(valid, coordinates):
+            if coords:
+                located.append((i, coords))
+            else:
+                results[i]["error"] = "Unable to fetch coordinates."
+
+        if located:
+            xs, ys = wgs84_to_lambert93_arrays(
+                [coords["lon"] for _, coords in located],
+                [coords["lat"] for _, coords in located],
+            )
+            try:
+                coverage_per_point = find_available_networks_batch(xs, ys)
+            except psycopg2.Error as e:
+                logging.error(f"Database query failed: {e}")
+                return jsonify({"message": "Internal server error"}), 500
+            for (i, _), coverage in zip(located, coverage_per_point):
+                results[i]["coverage"] = coverage
+
+        return jsonify({"results": results})
+
+    @flask_app.route("/api/coordinates", methods=["POST"])
+    def get_network_coverage_coordinates():
+        try:
+            lons, lats, ids, errors = parse_points(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        if not lons:
+            return jsonify({"message": "Provide at least one point."}), 400
+        if len(lons) > flask_app.config["COORDINATES_MAX_POINTS"]:
+            return (
+                jsonify({"message": f"Too many points, the limit is {flask_app.config['COORDINATES_MAX_POINTS']}."}),
+                413,
+            )
+
+        with stage("transform"):
+            xs, ys = wgs84_to_lambert93_arrays(lons, lats)
+            errors = lambert93_errors(xs, ys, errors)
+        lines = coverage_lines(xs, ys, ids, errors, flask_app.config["COORDINATES_CHUNK_SIZE"])
+        return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+    @flask_app.route("/metrics", methods=["GET"])
+    def get_metrics():
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
 
 
 # Application entry point
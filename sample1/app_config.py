@@ -12,6 +12,79 @@ class Config:
     POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "password")
     POSTGRES_HOST = os.getenv("POSTGRES_HOST", "postgres_container")
     POSTGRES_PORT = os.getenv("POSTGRES_PORT", 5432)
+    # Connection pool shared by the request threads of each process
+    DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+    DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+    DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+    # "postgres" queries network_data, "memory" answers from an in-process index,
+    # "shared" from the same index shared by all worker processes (see
+    # shared_index.py), "grid" from the precomputed coverage grid (see coverage_grid.py)
+    COVERAGE_ENGINE = os.getenv("COVERAGE_ENGINE", "postgres")
+    # Where the "memory" and "shared" engines load their rows from: "csv" or "db"
+    COVERAGE_INDEX_SOURCE = os.getenv("COVERAGE_INDEX_SOURCE", "csv")
+    # CSV or snapshot (see snapshot.py) holding the coverage dataset
+    COVERAGE_DATA_PATH = os.getenv(
+        "COVERAGE_DATA_PATH", os.path.join(os.path.dirname(__file__), "data.csv")
+    )
+    # Precomputed grid of the "grid" engine, rebuilt by partition_and_load.py
+    COVERAGE_GRID_PATH = os.getenv(
+        "COVERAGE_GRID_PATH", os.path.join(os.path.dirname(__file__), "coverage.grid")
+    )
+    COVERAGE_GRID_CELL_SIZE = float(os.getenv("COVERAGE_GRID_CELL_SIZE", 250))
+    # Concurrent radius lookups of points in the same cell (side in meters)
+    # share one lookup, run for the cell centre
+    COVERAGE_FLIGHT_CELL_SIZE = float(os.getenv("COVERAGE_FLIGHT_CELL_SIZE", 25))
+    # Side in meters of the square tiles partitioning network_data (see tiles.py),
+    # applied by the next load of partition_and_load.py
+    COVERAGE_TILE_SIZE = int(os.getenv("COVERAGE_TILE_SIZE", 100000))
+    # Memory-backed directory holding the generations of the "shared" engine
+    COVERAGE_SHARED_DIR = os.getenv("COVERAGE_SHARED_DIR", "/dev/shm/coverage-index")
+    # Seconds after which idle workers release a replaced generation
+    COVERAGE_SHARED_REFRESH = float(os.getenv("COVERAGE_SHARED_REFRESH", 5))
+    GEOCODER_URL = os.getenv("GEOCODER_URL", "https://api-adresse.data.gouv.fr")
+    # Geocoder client (see geocoder_client.py): keep-alive pool, retries with
+    # jitter, circuit breaker and optional hedged requests
+    GEOCODER_TIMEOUT = float(os.getenv("GEOCODER_TIMEOUT", 5))
+    GEOCODER_POOL_SIZE = int(os.getenv("GEOCODER_POOL_SIZE", 10))
+    GEOCODER_RETRIES = int(os.getenv("GEOCODER_RETRIES", 2))
+    GEOCODER_RETRY_BACKOFF = float(os.getenv("GEOCODER_RETRY_BACKOFF", 0.1))
+    GEOCODER_BREAKER_THRESHOLD = int(os.getenv("GEOCODER_BREAKER_THRESHOLD", 5))
+    GEOCODER_BREAKER_RESET = float(os.getenv("GEOCODER_BREAKER_RESET", 30))
+    GEOCODER_HEDGE = os.getenv("GEOCODER_HEDGE", "false").lower() in ("1", "true", "yes")
+    # Rate limit of the geocoder calls (see rate_limit.py): calls per second
+    # (0 disables it) and burst, in a "memory" or "redis" bucket. Calls wait
+    # for their turn up to MAX_WAIT seconds, MAX_QUEUE at most per process.
+    # While Redis is unreachable each process allows FALLBACK calls per
+    # second; 0 gives it its share of the limit among WORKERS processes
+    GEOCODER_RATE_LIMIT = float(os.getenv("GEOCODER_RATE_LIMIT", 40))
+    GEOCODER_RATE_BURST = int(os.getenv("GEOCODER_RATE_BURST", 40))
+    GEOCODER_RATE_LIMIT_BACKEND = os.getenv("GEOCODER_RATE_LIMIT_BACKEND", "memory")
+    GEOCODER_RATE_LIMIT_REDIS_URL = os.getenv("GEOCODER_RATE_LIMIT_REDIS_URL", "redis://localhost:6379/1")
+    GEOCODER_RATE_LIMIT_FALLBACK = float(os.getenv("GEOCODER_RATE_LIMIT_FALLBACK", 0))
+    GEOCODER_RATE_LIMIT_WORKERS = int(os.getenv("GEOCODER_RATE_LIMIT_WORKERS", 4))
+    GEOCODER_RATE_LIMIT_MAX_WAIT = float(os.getenv("GEOCODER_RATE_LIMIT_MAX_WAIT", 5))
+    GEOCODER_RATE_LIMIT_MAX_QUEUE = int(os.getenv("GEOCODER_RATE_LIMIT_MAX_QUEUE", 100))
+    # Offline BAN index built by local_geocoder.py, tried before the API;
+    # answers below the confidence threshold go to the API
+    LOCAL_GEOCODER_PATH = os.getenv("LOCAL_GEOCODER_PATH", "")
+    LOCAL_GEOCODER_MIN_CONFIDENCE = float(os.getenv("LOCAL_GEOCODER_MIN_CONFIDENCE", 0.7))
+    # Largest list of addresses accepted by POST /api/batch
+    BATCH_MAX_ADDRESSES = int(os.getenv("BATCH_MAX_ADDRESSES", 10000))
+    # Largest list of points accepted by POST /api/coordinates, and the
+    # number of points resolved per query while its answer streams out
+    COORDINATES_MAX_POINTS = int(os.getenv("COORDINATES_MAX_POINTS", 50000))
+    COORDINATES_CHUNK_SIZE = int(os.getenv("COORDINATES_CHUNK_SIZE", 5000))
+    # Addresses or CIDR blocks, comma-separated, allowed to profile their
+    # requests with the X-Coverage-Profile header (see profiling.py)
+    PROFILE_ALLOWED_CLIENTS = os.getenv("PROFILE_ALLOWED_CLIENTS", "")
+    # Geocoding cache: in-process LRU plus an optional "sqlite" or "redis" tier
+    GEOCODE_CACHE_BACKEND = os.getenv("GEOCODE_CACHE_BACKEND", "memory")
+    GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", 10000))
+    GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", 86400))
+    GEOCODE_CACHE_NEGATIVE_TTL = int(os.getenv("GEOCODE_CACHE_NEGATIVE_TTL", 3600))
+    GEOCODE_CACHE_SQLITE_PATH = os.getenv("GEOCODE_CACHE_SQLITE_PATH", "/tmp/geocode_cache.sqlite3")
+    GEOCODE_CACHE_REDIS_URL = os.getenv("GEOCODE_CACHE_REDIS_URL", "redis://localhost:6379/1")
 
 class TestingConfig(Config):
     TESTING = True
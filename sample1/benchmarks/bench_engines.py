@@ -0,0 +1,81 @@
+"""
+Compare the Postgres, in-memory and grid coverage engines on random lookups.
+
+Run from the sample1 directory:
+    python benchmarks/bench_engines.py --queries 500
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import MAX_DISTANCE, create_app, query_postgres  # noqa: E402
+from app_config import Config  # noqa: E402
+from coverage_grid import build_grid  # noqa: E402
+from spatial_index import GridIndex  # noqa: E402
+
+
+def random_points(df, count, seed=0):
+    """
+    Points scattered around existing measurements, like real addresses.
+    """
+    rng = np.random.default_rng(seed)
+    picks = df[["x", "y"]].to_numpy()[rng.integers(0, len(df), size=count)]
+    return picks + rng.uniform(-2500, 2500, size=picks.shape)
+
+
+def time_engine(query, points):
+    """
+    Run every lookup and return (results, seconds per lookup).
+    """
+    results = []
+    start = time.perf_counter()
+    for x, y in points:
+        results.append(query(float(x), float(y), MAX_DISTANCE))
+    return results, (time.perf_counter() - start) / len(points)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--data", default=Config.COVERAGE_DATA_PATH)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data, delimiter=";", dtype={"Operateur": str})
+    points = random_points(df, args.queries)
+
+    start = time.perf_counter()
+    index = GridIndex.from_dataframe(df)
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f} ms for {len(index)} rows")
+
+    memory_results, memory_time = time_engine(index.query, points)
+    print(f"memory:   {memory_time * 1e6:10.1f} us/lookup")
+
+    start = time.perf_counter()
+    grid = build_grid(df["Operateur"], df["x"], df["y"], df["2G"], df["3G"], df["4G"], radius=MAX_DISTANCE)
+    print(f"grid build: {(time.perf_counter() - start) * 1000:.1f} ms for {grid.shape[1]}x{grid.shape[0]} cells")
+    _, grid_time = time_engine(lambda x, y, radius: grid.lookup(x, y), points)
+    print(f"grid:     {grid_time * 1e6:10.1f} us/lookup")
+
+    try:
+        with create_app().app_context():
+            postgres_results, postgres_time = time_engine(query_postgres, points)
+    except psycopg2.Error as e:
+        logging.error(f"Postgres engine unavailable, skipping comparison: {e}")
+        return
+    print(f"postgres: {postgres_time * 1e6:10.1f} us/lookup")
+    print(f"speedup:  {postgres_time / memory_time:10.1f}x")
+
+    mismatches = sum(a != b for a, b in zip(memory_results, postgres_results))
+    print(f"mismatching lookups: {mismatches}/{len(points)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare per-point and array WGS84 -> Lambert-93 transforms.
+
+Run from the sample1 directory:
+    python benchmarks/bench_transform.py --sizes 1 1000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from transform import wgs84_to_lambert93, wgs84_to_lambert93_arrays  # noqa: E402
+
+
+def random_points(count, seed=0):
+    """
+    Points spread over metropolitan France.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-4.5, 8.0, count), rng.uniform(42.5, 51.0, count)
+
+
+def best_of(function, repeat):
+    """
+    Best wall time of `repeat` runs, in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 1000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Create this thread's transformer outside of the timings
+    wgs84_to_lambert93(2.3522, 48.8566)
+
+    print(f"{'points':>9} {'scalar':>12} {'array':>12} {'speedup':>9}")
+    for size in args.sizes:
+        lons, lats = random_points(size)
+        lon_list, lat_list = lons.tolist(), lats.tolist()
+        scalar = best_of(lambda: [wgs84_to_lambert93(lon, lat) for lon, lat in zip(lon_list, lat_list)], args.repeat)
+        array = best_of(lambda: wgs84_to_lambert93_arrays(lons, lats), args.repeat)
+        print(f"{size:>9} {scalar * 1000:>10.3f}ms {array * 1000:>10.3f}ms {scalar / array:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Precomputed coverage grid.
+
+The answer to "which technologies does each operator offer within `radius`
+of this point" only depends on the point's neighbourhood, so it is
+rasterized once over a fixed Lambert-93 lattice of `cell_size` squares
+(cell edges are multiples of `cell_size`). Every cell stores the answer for
+its centre as one uint16 holding 4 bits per operator: present, 2G, 3G, 4G,
+OR-ed over the rows within the radius. A lookup is then a single array read.
+
+Snapping the point to its cell centre moves it by at most half a cell
+diagonal, so rows at about `radius` from the point can be counted in or out
+wrongly; `accuracy_report` measures how often against the exact query.
+
+File layout (little endian): the header, the operator codes and, aligned on
+64 bytes, the uint16 cells in row-major (y, x) order. The file is
+memory-mapped, so every worker of a host shares the same pages.
+"""
+import math
+import os
+import struct
+import tempfile
+import numpy as np
+
+MAGIC = b"COVGRID\x00"
+VERSION = 1
+# magic, version, operator count, cell size, radius, x0, y0, columns, rows
+HEADER = struct.Struct("<8sHHddddII")
+OPERATOR_CODE_SIZE = 16
+DATA_ALIGNMENT = 64
+
+BITS_PER_OPERATOR = 4
+MAX_OPERATORS = 4
+PRESENT, BIT_2G, BIT_3G, BIT_4G = 1, 2, 4, 8
+
+# Metropolitan France in Lambert-93 (x min, y min, x max, y max). Rows
+# outside, like misplaced (0, 0) coordinates, are left out of the grid.
+EXTENT = (50000, 6000000, 1300000, 7150000)
+
+
+def encode(operator_index, g2, g3, g4):
+    """
+    Cell bits for rows of the operator at `operator_index` (scalars or arrays).
+    """
+    flags = (
+        PRESENT
+        | np.asarray(g2, dtype=np.uint16) * BIT_2G
+        | np.asarray(g3, dtype=np.uint16) * BIT_3G
+        | np.asarray(g4, dtype=np.uint16) * BIT_4G
+    )
+    return (flags << (BITS_PER_OPERATOR * np.asarray(operator_index, dtype=np.uint16))).astype(np.uint16)
+
+
+def decode(bits, operator_codes):
+    """
+    Map cell bits to {operator code: (g2, g3, g4)} for the operators present.
+    """
+    coverage = {}
+    for i, code in enumerate(operator_codes):
+        flags = (int(bits) >> (BITS_PER_OPERATOR * i)) & 0xF
+        if flags & PRESENT:
+            coverage[code] = (bool(flags & BIT_2G), bool(flags & BIT_3G), bool(flags & BIT_4G))
+    return coverage
+
+
+def _columns(operators, x, y, g2, g3, g4):
+    """
+    Validate the rows and return (operator codes, cell bits, x, y) for the ones inside EXTENT.
+    """
+    operators = np.asarray(operators).astype(str)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    codes, operator_index = np.unique(operators, return_inverse=True)
+    if len(codes) > MAX_OPERATORS:
+        raise ValueError(f"The coverage grid holds at most {MAX_OPERATORS} operators, got {len(codes)}.")
+    values = encode(operator_index, g2, g3, g4)
+    inside = (x >= EXTENT[0]) & (y >= EXTENT[1]) & (x <= EXTENT[2]) & (y <= EXTENT[3])
+    return [str(code) for code in codes], values[inside], x[inside], y[inside]
+
+
+class CoverageGrid:
+    """
+    Cells of `cell_size` meters whose lower-left corner is (x0, y0).
+    """
+
+    def __init__(self, bits, operator_codes, x0, y0, cell_size, radius):
+        self.bits = bits
+        self.operator_codes = list(operator_codes)
+        self.x0 = x0
+        self.y0 = y0
+        self.cell_size = cell_size
+        self.radius = radius
+
+    @property
+    def shape(self):
+        return self.bits.shape
+
+    @classmethod
+    def open(cls, path):
+        """
+        Memory-map a grid written by `save`.
+        """
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError(f"{path} is not a coverage grid.")
+            magic, version, n_operators, cell_size, radius, x0, y0, nx, ny = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a coverage grid.")
+            if version != VERSION:
+                raise ValueError(f"Unsupported coverage grid version {version} in {path}.")
+            raw_codes = f.read(OPERATOR_CODE_SIZE * n_operators)
+        codes = [
+            raw_codes[i:i + OPERATOR_CODE_SIZE].rstrip(b"\x00").decode("ascii")
+            for i in range(0, len(raw_codes), OPERATOR_CODE_SIZE)
+        ]
+        offset = _data_offset(n_operators)
+        if nx and ny:
+            bits = np.memmap(path, dtype="<u2", mode="r", offset=offset, shape=(ny, nx))
+        else:
+            bits = np.zeros((ny, nx), dtype=np.uint16)
+        return cls(bits, codes, x0, y0, cell_size, radius)
+
+    def save(self, path):
+        """
+        Write the grid atomically, so readers never map a partial file.
+        """
+        ny, nx = self.bits.shape
+        header = HEADER.pack(
+            MAGIC, VERSION, len(self.operator_codes), self.cell_size, self.radius, self.x0, self.y0, nx, ny
+        )
+        codes = b"".join(code.encode("ascii").ljust(OPERATOR_CODE_SIZE, b"\x00") for code in self.operator_codes)
+        offset = _data_offset(len(self.operator_codes))
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(codes)
+                f.write(b"\x00" * (offset - len(header) - len(codes)))
+                f.write(np.ascontiguousarray(self.bits, dtype="<u2").tobytes())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def cells(self, xs, ys):
+        """
+        Return (rows, columns, inside) for arrays of points.
+        """
+        cols = np.floor((np.asarray(xs, dtype=np.float64) - self.x0) / self.cell_size).astype(np.int64)
+        rows = np.floor((np.asarray(ys, dtype=np.float64) - self.y0) / self.cell_size).astype(np.int64)
+        ny, nx = self.bits.shape
+        inside = (cols >= 0) & (cols < nx) & (rows >= 0) & (rows < ny)
+        return rows, cols, inside
+
+    def lookup_bits(self, xs, ys):
+        """
+        Cell bits for arrays of points, -1 for points outside the grid.
+        """
+        rows, cols, inside = self.cells(xs, ys)
+        bits = np.full(len(rows), -1, dtype=np.int32)
+        bits[inside] = self.bits[rows[inside], cols[inside]]
+        return bits
+
+    def lookup(self, x, y):
+        """
+        {operator code: (g2, g3, g4)} for the cell of (x, y), or None when the
+        point is outside the grid and the caller must run the exact query.
+        """
+        col = math.floor((x - self.x0) / self.cell_size)
+        row = math.floor((y - self.y0) / self.cell_size)
+        ny, nx = self.bits.shape
+        if not (0 <= col < nx and 0 <= row < ny):
+            return None
+        return decode(self.bits[row, col], self.operator_codes)
+
+
+def _data_offset(n_operators):
+    size = HEADER.size + OPERATOR_CODE_SIZE * n_operators
+    return -(-size // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+
+def build_grid(operators, x, y, g2, g3, g4, cell_size=250, radius=3000, chunk_size=2048):
+    """
+    Rasterize coverage rows into a CoverageGrid covering their bounding box
+    plus `radius`. Each row marks the cells whose centre is within `radius`.
+    """
+    codes, values, x, y = _columns(operators, x, y, g2, g3, g4)
+    if not len(x):
+        return CoverageGrid(np.zeros((0, 0), dtype=np.uint16), codes, 0.0, 0.0, cell_size, radius)
+
+    x0 = np.floor((x.min() - radius) / cell_size) * cell_size
+    y0 = np.floor((y.min() - radius) / cell_size) * cell_size
+    nx = int(np.ceil((x.max() + radius - x0) / cell_size))
+    ny = int(np.ceil((y.max() + radius - y0) / cell_size))
+    bits = np.zeros((ny, nx), dtype=np.uint16)
+    flat = bits.reshape(-1)
+
+    # Cells around the point's own cell that may have their centre in range
+    reach = int(np.ceil(radius / cell_size)) + 1
+    offsets = np.arange(-reach, reach + 1)
+    d_col, d_row = (a.ravel() for a in np.meshgrid(offsets, offsets))
+
+    for start in range(0, len(x), chunk_size):
+        px = x[start:start + chunk_size, None]
+        py = y[start:start + chunk_size, None]
+        cols = np.floor((px - x0) / cell_size).astype(np.int64) + d_col
+        rows = np.floor((py - y0) / cell_size).astype(np.int64) + d_row
+        dx = x0 + (cols + 0.5) * cell_size - px
+        dy = y0 + (rows + 0.5) * cell_size - py
+        within = np.sqrt(dx ** 2 + dy ** 2) <= radius
+        cells = (rows * nx + cols)[within]
+        cell_values = np.broadcast_to(values[start:start + chunk_size, None], within.shape)[within]
+        # OR the values of every row hitting the same cell
+        order = np.argsort(cells, kind="stable")
+        cells = cells[order]
+        cell_values = cell_values[order]
+        starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+        flat[cells[starts]] |= np.bitwise_or.reduceat(cell_values, starts)
+
+    return CoverageGrid(bits, codes, float(x0), float(y0), cell_size, radius)
+
+
+def exact_bits(grid, operators, x, y, g2, g3, g4, xs, ys):
+    """
+    Reference answer for the points (xs, ys): the bits OR-ed over every row
+    within `grid.radius`, encoded with the grid's operator order.
+    """
+    index = {code: i for i, code in enumerate(grid.operator_codes)}
+    operators = np.asarray(operators).astype(str)
+    known = np.array([code in index for code in operators], dtype=bool)
+    operator_index = np.array([index.get(code, 0) for code in operators], dtype=np.uint16)
+    values = np.where(known, encode(operator_index, g2, g3, g4), 0).astype(np.uint16)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    order = np.argsort(x, kind="stable")
+    x, y, values = x[order], y[order], values[order]
+
+    result = np.zeros(len(xs), dtype=np.int32)
+    for i, (px, py) in enumerate(zip(xs, ys)):
+        lo = np.searchsorted(x, px - grid.radius, side="left")
+        hi = np.searchsorted(x, px + grid.radius, side="right")
+        within = np.sqrt((x[lo:hi] - px) ** 2 + (y[lo:hi] - py) ** 2) <= grid.radius
+        if within.any():
+            result[i] = np.bitwise_or.reduce(values[lo:hi][within])
+    return result
+
+
+def accuracy_report(grid, operators, x, y, g2, g3, g4, samples=10000, seed=0):
+    """
+    Compare grid lookups with the exact radius query on `samples` random
+    points scattered within `radius` of random rows. Returns the share of
+    points answered exactly and, per technology, the number of
+    (point, operator) pairs the grid reports wrongly.
+    """
+    _, _, inside_x, inside_y = _columns(operators, x, y, g2, g3, g4)
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(inside_x), samples)
+    xs = inside_x[picks] + rng.uniform(-grid.radius, grid.radius, samples)
+    ys = inside_y[picks] + rng.uniform(-grid.radius, grid.radius, samples)
+
+    approx = grid.lookup_bits(xs, ys)
+    exact = exact_bits(grid, operators, x, y, g2, g3, g4, xs, ys)
+    inside = approx >= 0
+    approx, exact = approx[inside], exact[inside]
+
+    report = {
+        "samples": int(samples),
+        "outside_grid": int((~inside).sum()),
+        "exact_matches": int((approx == exact).sum()),
+    }
+    report["match_rate"] = report["exact_matches"] / max(len(approx), 1)
+    for name, bit in (("operator", PRESENT), ("2G", BIT_2G), ("3G", BIT_3G), ("4G", BIT_4G)):
+        false_positives = false_negatives = 0
+        for i in range(len(grid.operator_codes)):
+            mask = bit << (BITS_PER_OPERATOR * i)
+            false_positives += int(((approx & ~exact & mask) != 0).sum())
+            false_negatives += int(((exact & ~approx & mask) != 0).sum())
+        report[f"{name}_false_positives"] = false_positives
+        report[f"{name}_false_negatives"] = false_negatives
+    return report
+
+
+class GridFile:
+    """
+    A grid file opened lazily and reopened when it is replaced, so a rebuild
+    is picked up by running workers without a restart.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._grid = None
+        self._mtime = None
+
+    def get(self):
+        """
+        The current grid; raises OSError or ValueError when the file is unusable.
+        """
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self._mtime:
+            self._grid = CoverageGrid.open(self.path)
+            self._mtime = mtime
+        return self._grid
+
+
+def main():
+    import argparse
+    from app_config import Config
+    from snapshot import load_columns
+
+    parser = argparse.ArgumentParser(description="Build the precomputed coverage grid.")
+    parser.add_argument("--source", default=Config.COVERAGE_DATA_PATH, help="CSV or snapshot to rasterize.")
+    parser.add_argument("--output", default=Config.COVERAGE_GRID_PATH, help="Path of the grid file.")
+    parser.add_argument("--cell-size", type=float, default=Config.COVERAGE_GRID_CELL_SIZE)
+    parser.add_argument("--radius", type=float, default=3000)
+    parser.add_argument("--report", action="store_true", help="Print the accuracy versus the exact query.")
+    args = parser.parse_args()
+
+    columns = load_columns(args.source)
+    grid = build_grid(*columns, cell_size=args.cell_size, radius=args.radius)
+    grid.save(args.output)
+    print(f"Wrote a {grid.shape[1]}x{grid.shape[0]} grid of {args.cell_size:g} m cells to {args.output}.")
+    if args.report:
+        for name, value in accuracy_report(grid, *columns).items():
+            print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Thread-safe PostgreSQL connection pool for the Flask app.
+
+One pool is created per process by `create_app` and shared by every request
+thread. Checking a connection out blocks while the pool is saturated, for at
+most `timeout` seconds, then raises `PoolError` (a `psycopg2.Error`, so the
+handlers answer 500 like for any other database failure). Pools are created
+lazily and are reset after a fork, so prefork servers give every worker its
+own connections.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections created with `connect()`.
+
+    - At most `maxconn` connections are open; `minconn` of them are kept
+      even when idle, the others are closed after `max_idle` seconds.
+    - Connections idle for more than `health_check_interval` seconds are
+      checked with `SELECT 1` before being handed out; broken ones are
+      replaced transparently.
+    - `connection()` always gives the connection back: rolled back after a
+      normal exit or a query error, discarded after a connection error.
+    - `on_wait(seconds)`, when set, is called with the time every checkout
+      waited for a connection, timed out checkouts included.
+    - `on_stats(stats)`, when set, is called with `stats()` after every
+      checkout, timed out checkout and return.
+    - After `closeall()` checkouts raise `PoolError` and connections given
+      back are closed.
+    """
+
+    def __init__(
+        self,
+        connect,
+        minconn=1,
+        maxconn=10,
+        timeout=5.0,
+        health_check_interval=30.0,
+        max_idle=300.0,
+        on_wait=None,
+        on_stats=None,
+    ):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Pool size must satisfy 0 <= minconn <= maxconn and maxconn >= 1.")
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.max_idle = max_idle
+        self.on_wait = on_wait
+        self.on_stats = on_stats
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._closed = False
+        self._warmed = False
+        self._idle = deque()  # (connection, returned_at), most recent last
+        self._open = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+        self._health_check_failures = 0
+
+    def _check_fork(self):
+        # Connections inherited from the parent process must not be used or
+        # closed here (closing would end the parent's session), only dropped.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def getconn(self, timeout=None):
+        """
+        Check a connection out, waiting up to `timeout` seconds when saturated.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        with self._cond:
+            self._check_fork()
+            if self._closed:
+                raise PoolError("Connection pool is closed")
+            waited = False
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._open < self.maxconn:
+                    self._open += 1
+                    conn, returned_at = None, None
+                    break
+                remaining = timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._observe_wait(time.monotonic() - start)
+                    self._report()
+                    raise PoolError(
+                        f"Connection pool exhausted: {self.maxconn} connections in use for {timeout}s"
+                    )
+                waited = True
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+            self._acquired += 1
+            wait_time = time.monotonic() - start
+            if waited:
+                self._waits += 1
+                self._wait_time += wait_time
+                self._max_wait_time = max(self._max_wait_time, wait_time)
+            # Decided under the lock so that concurrent first checkouts
+            # start a single warm-up
+            warm_up = not self._warmed
+            self._warmed = True
+        self._observe_wait(wait_time)
+
+        try:
+            if conn is not None and not self._is_healthy(conn, returned_at):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._open -= 1
+                if warm_up:
+                    self._warmed = False
+                self._cond.notify()
+            raise
+        if warm_up:
+            self._warm_up()
+        self._report()
+        return conn
+
+    def _observe_wait(self, seconds):
+        if self.on_wait is not None:
+            self.on_wait(seconds)
+
+    def _report(self):
+        if self.on_stats is not None:
+            self.on_stats(self.stats())
+
+    def putconn(self, conn, discard=False):
+        """
+        Give a connection back; broken or discarded connections are closed,
+        as are all connections once the pool is closed.
+        """
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            if discard or conn.closed or self._closed:
+                self._open -= 1
+                self._discarded += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            expired = self._expire_idle()
+            self._cond.notify()
+        if conn is not None:
+            self._close(conn)
+        for idle_conn in expired:
+            self._close(idle_conn)
+        self._report()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager checking a connection out and always giving it back.
+        """
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.putconn(conn, discard=True)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def _release(self, conn):
+        try:
+            if not conn.closed and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error as e:
+            logging.warning(f"Discarding pooled connection that failed to roll back: {e}")
+            self.putconn(conn, discard=True)
+            return
+        self.putconn(conn)
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.health_check_interval:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1;")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logging.warning(f"Replacing unhealthy pooled connection: {e}")
+            with self._cond:
+                self._health_check_failures += 1
+            return False
+
+    def _expire_idle(self):
+        """
+        Pop connections idle for longer than `max_idle` beyond `minconn`.
+        Must be called with the lock held.
+        """
+        expired = []
+        now = time.monotonic()
+        while len(self._idle) > self.minconn and now - self._idle[0][1] > self.max_idle:
+            expired.append(self._idle.popleft()[0])
+            self._open -= 1
+        return expired
+
+    def _warm_up(self):
+        """
+        Open connections until `minconn` are open, on the first checkout.
+        """
+        while True:
+            with self._cond:
+                if self._open >= self.minconn:
+                    return
+                self._open += 1
+            try:
+                conn = self._connect()
+            except Exception as e:
+                logging.warning(f"Could not warm up the connection pool: {e}")
+                with self._cond:
+                    self._open -= 1
+                return
+            with self._cond:
+                self._idle.appendleft((conn, time.monotonic()))
+                self._cond.notify()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def closeall(self):
+        """
+        Close the pool: the idle connections are closed now, connections in
+        use when they are given back.
+        """
+        with self._cond:
+            self._check_fork()
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._open -= len(idle)
+            self._idle.clear()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """
+        Pool saturation metrics.
+        """
+        with self._cond:
+            return {
+                "max": self.maxconn,
+                "min": self.minconn,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "wait_time_total": self._wait_time,
+                "wait_time_max": self._max_wait_time,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "health_check_failures": self._health_check_failures,
+                "saturation": self._in_use / self.maxconn,
+            }
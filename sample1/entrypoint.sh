@@ -17,5 +17,11 @@ python /sample1/partition_and_load.py
 echo "Running tests..."
 pytest /sample1/test || echo "Tests failed or directory not found"
 
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    # Metrics files left by a previous run would be added to the new samples
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 echo "Starting the Flask server..."
 flask run --host=0.0.0.0 --port=5000
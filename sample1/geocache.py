@@ -0,0 +1,282 @@
+"""
+Two-tier cache for geocoding results.
+
+Tier 1 is a bounded in-process LRU with TTL. Tier 2 is optional and shared
+between processes: a local SQLite file or Redis. Keys are canonicalized
+addresses, and "no features" answers are cached too (for a shorter TTL).
+Concurrent misses for the same address share a single geocoder call.
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from singleflight import SingleFlight
+
+KEY_PREFIX = "geocode:"
+
+
+def canonicalize_address(address):
+    """
+    Normalize an address so trivially different spellings share a cache entry:
+    Unicode compatibility form, no accents, lower case, punctuation folded to
+    spaces and whitespace collapsed.
+    """
+    text = unicodedata.normalize("NFKD", address)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w]+", " ", text.casefold())
+    return " ".join(text.split())
+
+
+class LRUCache:
+    """
+    Thread-safe, bounded LRU with a per-entry expiry time.
+    """
+
+    def __init__(self, max_size=10000, clock=time.monotonic):
+        self.max_size = max_size
+        self.clock = clock
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return (found, value).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires_at = entry
+            if expires_at <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, self.clock() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteTier:
+    """
+    Second tier stored in a local SQLite file, shared by the processes of a host.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        # sqlite3 connections cannot be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM geocode_cache WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO geocode_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl),
+        )
+
+    def clear(self):
+        self._connection().execute("DELETE FROM geocode_cache")
+
+
+class RedisTier:
+    """
+    Second tier stored in Redis, shared by every worker of the deployment.
+    Redis expires the keys itself.
+    """
+
+    def __init__(self, url, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(
+                url, socket_connect_timeout=0.2, socket_timeout=0.2
+            )
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(KEY_PREFIX + key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    def set(self, key, value, ttl):
+        self.client.set(KEY_PREFIX + key, value, ex=max(1, int(ttl)))
+
+    def clear(self):
+        for key in self.client.scan_iter(match=f"{KEY_PREFIX}*"):
+            self.client.delete(key)
+
+
+class GeocodeCache:
+    """
+    Look addresses up in the LRU, then the second tier, then the geocoder.
+
+    A failing second tier is skipped for `tier_retry_after` seconds instead of
+    slowing every request down. Misses go through `flight`, so a burst of
+    requests for an uncached address calls the geocoder once.
+    `on_event(name)`, when set, is called with the name of every counter
+    incremented, e.g. to export them as metrics.
+    """
+
+    def __init__(
+        self,
+        max_size=10000,
+        ttl=86400,
+        negative_ttl=3600,
+        second_tier=None,
+        tier_retry_after=30,
+        clock=time.monotonic,
+        on_event=None,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.second_tier = second_tier
+        self.tier_retry_after = tier_retry_after
+        self.clock = clock
+        self.on_event = on_event
+        self.lru = LRUCache(max_size, clock=clock)
+        self.flight = SingleFlight()
+        self.hits = 0
+        self.second_tier_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.second_tier_errors = 0
+        self._tier_disabled_until = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        if self.on_event is not None:
+            self.on_event(counter)
+
+    def _tier_call(self, method, *args):
+        if self.second_tier is None or self.clock() < self._tier_disabled_until:
+            return None
+        try:
+            return getattr(self.second_tier, method)(*args)
+        except Exception as e:
+            self._count("second_tier_errors")
+            self._tier_disabled_until = self.clock() + self.tier_retry_after
+            logging.warning(f"Geocode cache second tier unavailable: {e}")
+            return None
+
+    def _store(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self.lru.set(key, value, ttl)
+        self._tier_call("set", key, json.dumps(value), ttl)
+
+    def lookup(self, address):
+        """
+        Return (found, value) for `address` from the LRU or the second tier.
+        """
+        key = canonicalize_address(address)
+
+        found, value = self.lru.get(key)
+        if not found:
+            stored = self._tier_call("get", key)
+            if stored is not None:
+                found, value = True, json.loads(stored)
+                self._count("second_tier_hits")
+                self.lru.set(key, value, self.ttl if value is not None else self.negative_ttl)
+        if found:
+            self._count("hits")
+            if value is None:
+                self._count("negative_hits")
+        else:
+            self._count("misses")
+        return found, value
+
+    def store(self, address, value):
+        """
+        Cache a geocoder answer; None records that the address has no match.
+        """
+        self._store(canonicalize_address(address), value)
+
+    def get_or_fetch(self, address, fetch):
+        """
+        Return the cached result for `address`, calling `fetch(address)` on a miss.
+        `fetch` returns None when the address has no match; that answer is
+        cached as well. Exceptions raised by `fetch` are not cached.
+        """
+        found, value = self.lookup(address)
+        if found:
+            return value
+        return self.flight.do(canonicalize_address(address), self._fetch_and_store, address, fetch)
+
+    def _fetch_and_store(self, address, fetch):
+        # A call that finished between our lookup and joining the flight
+        # has already filled the LRU
+        found, value = self.lru.get(canonicalize_address(address))
+        if found:
+            return value
+        value = fetch(address)
+        self.store(address, value)
+        return value
+
+    def clear(self):
+        self.lru.clear()
+        self._tier_call("clear")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "second_tier_hits": self.second_tier_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.lru.evictions,
+            "expirations": self.lru.expirations,
+            "second_tier_errors": self.second_tier_errors,
+            "coalesced": self.flight.coalesced,
+            "size": len(self.lru),
+        }
+
+
+def build_geocode_cache(backend="memory", max_size=10000, ttl=86400, negative_ttl=3600, sqlite_path=None, redis_url=None):
+    """
+    Create the cache for the configured second tier: "memory" (none), "sqlite" or "redis".
+    """
+    if backend == "sqlite":
+        second_tier = SQLiteTier(sqlite_path)
+    elif backend == "redis":
+        second_tier = RedisTier(redis_url)
+    elif backend == "memory":
+        second_tier = None
+    else:
+        raise ValueError(f"Unknown geocode cache backend: {backend}")
+    return GeocodeCache(max_size=max_size, ttl=ttl, negative_ttl=negative_ttl, second_tier=second_tier)
@@ -0,0 +1,253 @@
+"""
+HTTP client of the geocoding API, shared by the request threads of a process.
+
+- A requests.Session keeps up to `pool_size` connections to the upstream
+  alive, instead of a new TCP and TLS handshake per call.
+- Transport errors, timeouts and 429/5xx answers are retried up to
+  `retries` times, after a random delay of up to `backoff * 2**attempt`
+  seconds (full jitter), so callers do not retry in lockstep.
+- After `breaker_threshold` failed calls in a row the circuit breaker opens:
+  calls fail at once with CircuitOpenError for `breaker_reset` seconds, then
+  a single probe call decides whether to close it again.
+- With `hedge` on, a GET still unanswered after the p95 latency of recent
+  calls is sent a second time, and the first answer wins. The slowest 5% of
+  calls then cost about the p95 plus one more round trip, at the price of
+  about 5% more upstream requests.
+- With a `limiter` (see rate_limit.py), every attempt waits for its turn
+  first. Hedges are only sent when a token is free right away, and calls
+  refused by the limiter raise RateLimited without being retried.
+
+Every call reports its outcomes through `on_outcome(endpoint, outcome)`:
+success, error, retry, circuit_open, rate_limited, hedge and hedge_won.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import RateLimited
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Recent latencies the hedging delay is computed from, and the fewest to use
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+HEDGE_QUANTILE = 0.95
+# Hedging delay until enough latencies are known, and its lower bound
+DEFAULT_HEDGE_DELAY = 0.5
+MIN_HEDGE_DELAY = 0.01
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    The upstream failed too often recently; the call was not attempted.
+    """
+
+
+class RetryableStatus(requests.HTTPError):
+    """
+    An answer with a status worth retrying, raised to go through the retry loop.
+    """
+
+
+class CircuitBreaker:
+    """
+    Consecutive failure counter opening the circuit at `threshold` failures.
+    Once `reset_timeout` seconds have passed it lets one probe call through
+    (half-open): its success closes the circuit, its failure reopens it.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or self._clock() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        """
+        Whether a call may go through now.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release_probe(self):
+        """
+        Give up the probe call without an answer, e.g. when it was never
+        sent, so the next call probes instead.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                if self._opened_at is None or self._probing:
+                    logging.warning(
+                        f"Geocoder circuit opened after {self._failures} failed calls, "
+                        f"failing fast for {self.reset_timeout:g}s"
+                    )
+                self._opened_at = self._clock()
+            self._probing = False
+
+
+class GeocoderClient:
+    """
+    Pooled, retrying client of the geocoding API rooted at `base_url`.
+    `get` and `post` return the final requests.Response, whose status is
+    left to the caller, or raise requests.RequestException.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        timeout=5,
+        pool_size=10,
+        retries=2,
+        backoff=0.1,
+        breaker_threshold=5,
+        breaker_reset=30,
+        hedge=False,
+        limiter=None,
+        on_outcome=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.limiter = limiter
+        self.on_outcome = on_outcome
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._executor = ThreadPoolExecutor(max_workers=2 * pool_size, thread_name_prefix="geocoder") if hedge else None
+
+    def _outcome(self, endpoint, outcome):
+        if self.on_outcome is not None:
+            self.on_outcome(endpoint, outcome)
+
+    def hedge_delay(self):
+        """
+        Seconds to wait for an answer before hedging: the p95 of recent calls.
+        """
+        latencies = sorted(self._latencies)
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return max(latencies[int(HEDGE_QUANTILE * (len(latencies) - 1))], MIN_HEDGE_DELAY)
+
+    def _send(self, endpoint, method, url, kwargs, limited=True):
+        """
+        One attempt, once the limiter lets it through unless `limited` is
+        off; answers with a retryable status raise RetryableStatus.
+        """
+        if limited and self.limiter is not None:
+            self.limiter.acquire(endpoint)
+        start = time.perf_counter()
+        response = self.session.request(method, url, timeout=kwargs.pop("timeout", self.timeout), **kwargs)
+        if response.status_code in RETRY_STATUSES:
+            raise RetryableStatus(f"{response.status_code} from {url}", response=response)
+        self._latencies.append(time.perf_counter() - start)
+        return response
+
+    def _hedged_send(self, endpoint, method, url, kwargs):
+        """
+        One attempt, sent a second time if it is still unanswered after
+        `hedge_delay()`. Returns the first successful answer.
+        """
+        primary = self._executor.submit(self._send, endpoint, method, url, dict(kwargs))
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if done:
+            return primary.result()
+        if self.limiter is not None:
+            try:
+                # A hedge waiting for its turn would come too late
+                self.limiter.reserve(endpoint, max_wait=0)
+            except RateLimited:
+                return primary.result()
+        self._outcome(endpoint, "hedge")
+        hedged = self._executor.submit(self._send, endpoint, method, url, dict(kwargs), limited=False)
+        pending = {primary, hedged}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                if future is hedged:
+                    self._outcome(endpoint, "hedge_won")
+                return response
+        raise error
+
+    def request(self, endpoint, method, path, hedge=True, **kwargs):
+        """
+        Send a request to `path` with retries, behind the circuit breaker.
+        `endpoint` names the call in the outcomes.
+        """
+        if not self.breaker.allow():
+            self._outcome(endpoint, "circuit_open")
+            raise CircuitOpenError(f"Geocoder circuit open, not calling {path}")
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.retries + 1):
+            try:
+                if hedge and self.hedge:
+                    response = self._hedged_send(endpoint, method, url, kwargs)
+                else:
+                    response = self._send(endpoint, method, url, dict(kwargs))
+            except RateLimited:
+                self.breaker.release_probe()
+                self._outcome(endpoint, "rate_limited")
+                raise
+            except requests.RequestException as e:
+                if attempt == self.retries:
+                    self.breaker.record_failure()
+                    self._outcome(endpoint, "error")
+                    if isinstance(e, RetryableStatus):
+                        return e.response
+                    raise
+                self._outcome(endpoint, "retry")
+                time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+                continue
+            self.breaker.record_success()
+            self._outcome(endpoint, "success")
+            return response
+
+    def get(self, endpoint, path, **kwargs):
+        return self.request(endpoint, "GET", path, **kwargs)
+
+    def post(self, endpoint, path, **kwargs):
+        # Batch uploads are too heavy to send twice
+        return self.request(endpoint, "POST", path, hedge=False, **kwargs)
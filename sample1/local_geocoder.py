@@ -0,0 +1,322 @@
+"""
+Offline geocoder built from a BAN (Base Adresse Nationale) CSV extract.
+
+The extract, e.g. https://adresse.data.gouv.fr/data/ban/adresses/latest/csv/adresses-75.csv.gz,
+is turned into a SQLite file holding:
+- `streets`: one row per street of a commune, with the mean position of its
+  numbers, and an FTS5 token index over "street name, postcode, city";
+- `numbers`: the position of every house number of a street;
+- `terms`: the indexed tokens, to drop query words the index cannot match.
+
+A query is canonicalized like the geocode cache keys, its leading house
+number is split off, and the streets matching every remaining known word are
+ranked. The confidence (0 to 1) is the share of the query words the street
+explains times the share of the street name the query mentions, lowered
+when the house number is missing or unknown and when another street far
+away matches as well. Lookups take well under a millisecond; answers below
+`min_confidence` are left to the remote API. Build the index with
+`python local_geocoder.py adresses-75.csv.gz --output geocoder.sqlite3`.
+"""
+import csv
+import gzip
+import logging
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import namedtuple
+
+from geocache import canonicalize_address
+
+Match = namedtuple("Match", "lon lat confidence label")
+
+ABBREVIATIONS = {
+    "all": "allee",
+    "av": "avenue",
+    "ave": "avenue",
+    "bd": "boulevard",
+    "bld": "boulevard",
+    "bvd": "boulevard",
+    "ch": "chemin",
+    "che": "chemin",
+    "crs": "cours",
+    "fbg": "faubourg",
+    "fg": "faubourg",
+    "imp": "impasse",
+    "pl": "place",
+    "qu": "quai",
+    "r": "rue",
+    "rte": "route",
+    "sq": "square",
+    "st": "saint",
+    "ste": "sainte",
+}
+STOPWORDS = {"a", "au", "aux", "d", "de", "des", "du", "en", "et", "l", "la", "le", "les", "sur"}
+HOUSE_NUMBER = re.compile(r"(\d{1,4})(bis|ter|quater|[a-z])?")
+REPETITIONS = {"bis", "ter", "quater"}
+
+# Numbers the BAN uses for named places without a house number
+NO_NUMBER = 99999
+CANDIDATES = 20
+# Confidence factors: no house number in the query, a number the street does
+# not have (or has with another suffix), and another matching street farther
+# than AMBIGUITY_DISTANCE meters
+NO_NUMBER_FACTOR = 0.9
+UNKNOWN_NUMBER_FACTOR = 0.8
+OTHER_REPETITION_FACTOR = 0.95
+AMBIGUITY_FACTOR = 0.5
+AMBIGUITY_DISTANCE = 1000
+
+SCHEMA = [
+    "CREATE TABLE streets (id INTEGER PRIMARY KEY, name TEXT, postcode TEXT, city TEXT, "
+    "label TEXT, lon REAL, lat REAL)",
+    "CREATE TABLE numbers (street_id INTEGER, number INTEGER, rep TEXT, lon REAL, lat REAL, "
+    "PRIMARY KEY (street_id, number, rep)) WITHOUT ROWID",
+    "CREATE VIRTUAL TABLE street_search USING fts5(text, content='', tokenize='unicode61')",
+    "CREATE TABLE terms (term TEXT PRIMARY KEY) WITHOUT ROWID",
+]
+
+# Streets matching every known query word. Ranking them with bm25 costs more
+# than the rest of a lookup, so it is only done when there are too many
+CANDIDATES_SQL = (
+    "SELECT s.id, s.name, s.postcode, s.city, s.label, s.lon, s.lat "
+    "FROM street_search JOIN streets s ON s.id = street_search.rowid "
+    "WHERE street_search MATCH ? LIMIT ?"
+)
+RANKED_CANDIDATES_SQL = CANDIDATES_SQL.replace(" LIMIT ?", " ORDER BY rank LIMIT ?")
+
+
+def tokens(text):
+    """
+    Canonical words of `text` with common abbreviations expanded.
+    """
+    return [ABBREVIATIONS.get(token, token) for token in canonicalize_address(text).split()]
+
+
+def parse_query(query):
+    """
+    (house number, repetition suffix, words) of a query like "42 bis rue ...".
+    """
+    words = tokens(query)
+    number = rep = None
+    match = HOUSE_NUMBER.fullmatch(words[0]) if words else None
+    if match:
+        words.pop(0)
+        number, rep = int(match.group(1)), match.group(2)
+        if rep is None and words and words[0] in REPETITIONS:
+            rep = words.pop(0)
+    return number, rep or "", [word for word in words if word not in STOPWORDS]
+
+
+def read_ban(path):
+    """
+    Rows of a BAN CSV extract (";"-separated, optionally gzipped).
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f, delimiter=";")
+
+
+def build_index(rows, path):
+    """
+    Write the index of BAN `rows` to `path` atomically. Returns the number
+    of (streets, numbers) indexed.
+    """
+    streets = {}  # (name, postcode, city) -> [id, label, lon sum, lat sum, count]
+    numbers = {}
+    for row in rows:
+        try:
+            lon, lat = float(row["lon"]), float(row["lat"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if not row.get("nom_voie"):
+            continue
+        key = (" ".join(tokens(row["nom_voie"])), row.get("code_postal", ""), " ".join(tokens(row.get("nom_commune", ""))))
+        street = streets.get(key)
+        if street is None:
+            label = f"{row['nom_voie']} {row.get('code_postal', '')} {row.get('nom_commune', '')}"
+            street = streets[key] = [len(streets) + 1, label, 0.0, 0.0, 0]
+        street[2] += lon
+        street[3] += lat
+        street[4] += 1
+        try:
+            number = int(row.get("numero") or NO_NUMBER)
+        except ValueError:
+            continue
+        if number != NO_NUMBER:
+            rep = canonicalize_address(row.get("rep") or "")
+            numbers[(street[0], number, rep)] = (lon, lat)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.executemany(
+                "INSERT INTO streets VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (id_, name, postcode, city, label, lon_sum / count, lat_sum / count)
+                    for (name, postcode, city), (id_, label, lon_sum, lat_sum, count) in streets.items()
+                ),
+            )
+            conn.executemany(
+                "INSERT INTO street_search (rowid, text) VALUES (?, ?)",
+                ((id_, f"{name} {postcode} {city}") for (name, postcode, city), (id_, *_) in streets.items()),
+            )
+            conn.executemany(
+                "INSERT INTO numbers VALUES (?, ?, ?, ?, ?)",
+                ((*key, lon, lat) for key, (lon, lat) in numbers.items()),
+            )
+            conn.execute("CREATE VIRTUAL TABLE temp.vocabulary USING fts5vocab(main, street_search, 'row')")
+            conn.execute("INSERT INTO terms SELECT term FROM temp.vocabulary")
+        conn.execute("VACUUM")
+        conn.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return len(streets), len(numbers)
+
+
+def distance(lon1, lat1, lon2, lat2):
+    """
+    Approximate distance in meters between two nearby WGS84 points.
+    """
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371000 * math.hypot(x, y)
+
+
+class LocalGeocoder:
+    """
+    Thread-safe reader of an index built by `build_index`. Every thread has
+    its own read-only connection, reopened when the file is rebuilt.
+    """
+
+    def __init__(self, path, min_confidence=0.7):
+        self.path = path
+        self.min_confidence = min_confidence
+        self._local = threading.local()
+        self._connection()
+
+    def _connection(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if getattr(self._local, "mtime", None) != mtime:
+            self._local.conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.mtime = mtime
+        return self._local.conn
+
+    def search(self, query, min_confidence=0.0):
+        """
+        Best Match for `query`, or None. Streets are only searched when the
+        query words the index knows could reach `min_confidence`, which
+        skips ranking the many streets matched by common words alone.
+        """
+        number, rep, words = parse_query(query)
+        query_words = set(words)
+        if not query_words:
+            return None
+        conn = self._connection()
+        placeholders = ", ".join("?" * len(query_words))
+        known = {
+            row[0]
+            for row in conn.execute(f"SELECT term FROM terms WHERE term IN ({placeholders})", list(query_words))
+        }
+        if not known or len(known) / len(query_words) < min_confidence:
+            return None
+        match = " AND ".join(f'"{word}"' for word in sorted(known))
+        candidates = conn.execute(CANDIDATES_SQL, (match, CANDIDATES)).fetchall()
+        if len(candidates) == CANDIDATES:
+            # More streets match than are scored: keep the best ranked ones
+            candidates = conn.execute(RANKED_CANDIDATES_SQL, (match, CANDIDATES)).fetchall()
+
+        scored = []
+        for street_id, name, postcode, city, label, lon, lat in candidates:
+            name_words = set(name.split()) - STOPWORDS
+            street_words = name_words | set(city.split()) | {postcode}
+            confidence = (
+                len(query_words & street_words) / len(query_words)
+                * len(query_words & name_words) / max(len(name_words), 1)
+            )
+            if number is None:
+                confidence *= NO_NUMBER_FACTOR
+            else:
+                position = conn.execute(
+                    "SELECT lon, lat, rep = ? FROM numbers WHERE street_id = ? AND number = ? "
+                    "ORDER BY rep = ? DESC, rep = '' DESC LIMIT 1",
+                    (rep, street_id, number, rep),
+                ).fetchone()
+                if position is None:
+                    confidence *= UNKNOWN_NUMBER_FACTOR
+                else:
+                    lon, lat, same_rep = position
+                    if not same_rep:
+                        confidence *= OTHER_REPETITION_FACTOR
+                label = f"{number}{' ' + rep if rep else ''} {label}"
+            scored.append(Match(lon, lat, confidence, label))
+        if not scored:
+            return None
+
+        scored.sort(key=lambda match: match.confidence, reverse=True)
+        best = scored[0]
+        if any(
+            other.confidence >= best.confidence
+            and distance(best.lon, best.lat, other.lon, other.lat) > AMBIGUITY_DISTANCE
+            for other in scored[1:]
+        ):
+            best = best._replace(confidence=best.confidence * AMBIGUITY_FACTOR)
+        return best._replace(confidence=round(best.confidence, 3))
+
+    def lookup(self, query):
+        """
+        (status, Match or None): "found" when the confidence reaches
+        `min_confidence`, "low_confidence" with the match otherwise, or
+        "not_found" when no street can reach it.
+        """
+        match = self.search(query, self.min_confidence)
+        if match is None:
+            return "not_found", None
+        if match.confidence < self.min_confidence:
+            return "low_confidence", match
+        return "found", match
+
+
+def build_local_geocoder(path, min_confidence=0.7):
+    """
+    The LocalGeocoder of the index at `path`, or None when no path is
+    configured or the index cannot be opened.
+    """
+    if not path:
+        return None
+    try:
+        return LocalGeocoder(path, min_confidence)
+    except (OSError, sqlite3.Error) as e:
+        logging.error(f"Local geocoder index {path} unavailable, using the remote API only: {e}")
+        return None
+
+
+def main():
+    import argparse
+    import time
+    from app_config import Config
+
+    parser = argparse.ArgumentParser(description="Build the local geocoder index from a BAN CSV extract.")
+    parser.add_argument("source", help="BAN CSV extract (adresses-XX.csv or .csv.gz).")
+    parser.add_argument("--output", default=Config.LOCAL_GEOCODER_PATH, help="Path of the index.")
+    args = parser.parse_args()
+    if not args.output:
+        parser.error("Set --output or LOCAL_GEOCODER_PATH.")
+
+    start = time.perf_counter()
+    streets, numbers = build_index(read_ban(args.source), args.output)
+    print(f"Indexed {streets} streets and {numbers} numbers into {args.output} in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
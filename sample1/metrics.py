@@ -0,0 +1,213 @@
+"""
+Prometheus metrics of the /api/ request pipeline, served on /metrics.
+
+Every stage of a lookup is timed so a slowdown can be pinned on the
+geocoder, the coordinate transform, the coverage lookup or serialization:
+- coverage_stage_duration_seconds{stage}: geocode, transform, lookup, serialize
+- coverage_geocoder_request_duration_seconds{endpoint, status}: upstream
+  calls, by HTTP status or "error" when no answer came back
+- coverage_geocoder_outcomes_total{endpoint, outcome}: successes, errors,
+  retries, hedged requests and calls refused by the circuit breaker or the
+  rate limit
+- coverage_geocoder_rate_limit_wait_seconds{endpoint}: wait of the admitted
+  calls for their turn, and coverage_geocoder_queue_depth: calls waiting
+- coverage_db_query_duration_seconds{query} and coverage_db_query_rows{query}
+- coverage_db_connection_wait_seconds: time to check a pooled connection out
+- coverage_db_pool_connections{state}: open, in_use, idle and waiting
+  connections of the pools, coverage_db_pool_max_connections, the highest
+  coverage_db_pool_saturation of a worker and the checkouts that waited or
+  timed out (coverage_db_pool_checkout_waits, coverage_db_pool_checkout_timeouts)
+- coverage_cache_events_total{cache, event}: hits and misses of the caches
+
+Under a prefork server every worker has its own metrics. Set
+PROMETHEUS_MULTIPROC_DIR to an empty directory writable by all workers
+before they start: they then write their samples there and /metrics
+aggregates the files of every worker.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from profiling import record_stage
+
+# Database connection checkouts wait a few milliseconds at most when healthy
+WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+ROW_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+STAGE_SECONDS = Histogram(
+    "coverage_stage_duration_seconds",
+    "Time spent in each stage of a coverage lookup.",
+    ["stage"],
+)
+GEOCODER_SECONDS = Histogram(
+    "coverage_geocoder_request_duration_seconds",
+    "Latency of the calls to the geocoding API.",
+    ["endpoint", "status"],
+)
+DB_QUERY_SECONDS = Histogram(
+    "coverage_db_query_duration_seconds",
+    "Execution time of the coverage queries, fetching included.",
+    ["query"],
+)
+DB_QUERY_ROWS = Histogram(
+    "coverage_db_query_rows",
+    "Rows returned by each coverage query.",
+    ["query"],
+    buckets=ROW_BUCKETS,
+)
+DB_CONNECTION_WAIT_SECONDS = Histogram(
+    "coverage_db_connection_wait_seconds",
+    "Time to get a database connection from the pool.",
+    buckets=WAIT_BUCKETS,
+)
+GEOCODER_OUTCOMES = Counter(
+    "coverage_geocoder_outcomes",
+    "Geocoder client events: success, error, retry, circuit_open, rate_limited, hedge and hedge_won.",
+    ["endpoint", "outcome"],
+)
+GEOCODER_RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "coverage_geocoder_rate_limit_wait_seconds",
+    "Time the admitted geocoder calls waited for the rate limit.",
+    ["endpoint"],
+    buckets=WAIT_BUCKETS,
+)
+GEOCODER_QUEUE_DEPTH = Gauge(
+    "coverage_geocoder_queue_depth",
+    "Geocoder calls waiting for the rate limit.",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "coverage_db_pool_connections",
+    "Connections of the database pools: open, in_use, idle and waiting checkouts.",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_MAX_CONNECTIONS = Gauge(
+    "coverage_db_pool_max_connections",
+    "Connections the database pools may open.",
+    multiprocess_mode="livesum",
+)
+DB_POOL_SATURATION = Gauge(
+    "coverage_db_pool_saturation",
+    "Share of the pool connections in use, highest over the workers.",
+    multiprocess_mode="livemax",
+)
+DB_POOL_CHECKOUT_WAITS = Gauge(
+    "coverage_db_pool_checkout_waits",
+    "Checkouts that waited for a connection since the workers started.",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Gauge(
+    "coverage_db_pool_checkout_timeouts",
+    "Checkouts that timed out since the workers started.",
+    multiprocess_mode="livesum",
+)
+CACHE_EVENTS = Counter(
+    "coverage_cache_events",
+    "Cache lookups by outcome: hits, misses, negative_hits and second_tier_hits "
+    "(both included in hits), second_tier_errors.",
+    ["cache", "event"],
+)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time one stage of a lookup, also for the request profile when profiling.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        record_stage(name, elapsed)
+
+
+@contextmanager
+def geocoder_call(endpoint):
+    """
+    Time a geocoder call; set `call["status"]` to the HTTP status once the
+    answer is in, calls that raise before are recorded as "error".
+    """
+    call = {"status": "error"}
+    start = time.perf_counter()
+    try:
+        yield call
+    finally:
+        GEOCODER_SECONDS.labels(endpoint, str(call["status"])).observe(time.perf_counter() - start)
+
+
+@contextmanager
+def db_query(name):
+    """
+    Time a coverage query; the block appends the fetched rows to the yielded list.
+    """
+    rows = []
+    with DB_QUERY_SECONDS.labels(name).time():
+        yield rows
+    DB_QUERY_ROWS.labels(name).observe(len(rows))
+
+
+def geocoder_outcome(endpoint, outcome):
+    """
+    Count a geocoder client event, for GeocoderClient's `on_outcome`.
+    """
+    GEOCODER_OUTCOMES.labels(endpoint, outcome).inc()
+
+
+def rate_limit_wait(endpoint, seconds):
+    """
+    Record the wait of an admitted call, for RateLimiter's `on_wait`.
+    """
+    GEOCODER_RATE_LIMIT_WAIT_SECONDS.labels(endpoint).observe(seconds)
+
+
+def rate_limit_queue(depth):
+    """
+    Record the calls waiting for their turn, for RateLimiter's `on_queue`.
+    """
+    GEOCODER_QUEUE_DEPTH.set(depth)
+
+
+def db_pool_stats(stats):
+    """
+    Record the saturation of a connection pool, for ConnectionPool's `on_stats`.
+    """
+    for state in ("open", "in_use", "idle", "waiting"):
+        DB_POOL_CONNECTIONS.labels(state).set(stats[state])
+    DB_POOL_MAX_CONNECTIONS.set(stats["max"])
+    DB_POOL_SATURATION.set(stats["saturation"])
+    DB_POOL_CHECKOUT_WAITS.set(stats["waits"])
+    DB_POOL_CHECKOUT_TIMEOUTS.set(stats["timeouts"])
+
+
+def cache_event(cache):
+    """
+    Callback counting the events of `cache`, for GeocodeCache's `on_event`.
+    """
+    return lambda event: CACHE_EVENTS.labels(cache, event).inc()
+
+
+def render():
+    """
+    (body, content type) of the metrics exposition, aggregated over every
+    worker in multiprocess mode.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
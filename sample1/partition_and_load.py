@@ -1,6 +1,14 @@
+import io
+import time
 import psycopg2
-import pandas as pd
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from app_config import Config
+from coverage_grid import build_grid
+from shared_index import publish
+from snapshot import load_dataframe
+from spatial_index import GridIndex
+from tiles import CATALOG, DEFAULT_PARTITION, PARENT, strip_name, tile_bounds, tile_name
 from utility import get_db_connection
 
 # Configure logging
@@ -8,11 +16,33 @@ logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
+COLUMNS = "Operateur, x, y, g2, g3, g4"
+
+# Shared by the parent and its partitions. `location` backs the GiST index
+# used by the nearest-measurement queries.
+TABLE_DEFINITION = """
+    Operateur VARCHAR(10),
+    x INT,
+    y INT,
+    g2 BOOLEAN,
+    g3 BOOLEAN,
+    g4 BOOLEAN,
+    location POINT GENERATED ALWAYS AS (point(x, y)) STORED
+"""
+
+# Rows serialized into each in-memory buffer streamed to COPY
+COPY_CHUNK_ROWS = 20000
+# Tiles loaded at once, each over its own connection
+COPY_WORKERS = 8
+# Each gets a partial index, so that the batch query's probe for a technology
+# an operator lacks around a point reads no rows
+TECHNOLOGIES = ("g2", "g3", "g4")
 
 
 def check_table_and_partitions(cursor):
     """
-    Check if the parent table and required partitions exist in the database.
+    Check if the parent table and the tiles of its catalog exist in the
+    database, with the current schema.
     """
     # Check if the parent table exists
     cursor.execute(
@@ -25,25 +55,203 @@ def check_table_and_partitions(cursor):
     )
     table_exists = cursor.fetchone()[0]
 
-    # Check if the partitions exist
+    # Check if the tiles exist. Tables split in x strips only have no catalog
     if table_exists:
+        cursor.execute(
+            f"""
+            SELECT EXISTS (
+                SELECT FROM information_schema.tables
+                WHERE table_schema = 'public' AND table_name = '{CATALOG}'
+            );
+        """
+        )
+        if not cursor.fetchone()[0]:
+            logging.info(f"Table '{PARENT}' predates the tiled layout, reloading it.")
+            return False
+        cursor.execute(
+            f"""
+            SELECT name FROM {CATALOG}
+            EXCEPT
+            SELECT relid::regclass::text FROM pg_partition_tree('{PARENT}') WHERE isleaf;
+        """
+        )
+        missing = {row[0] for row in cursor.fetchall()}
+        if missing:
+            logging.info(f"Missing partitions: {missing}")
+            return False
+
+        # Tables created before the nearest-measurement queries lack `location`
         cursor.execute(
             """
-            SELECT inhrelid::regclass AS partition_name
-            FROM pg_inherits
-            WHERE inhparent = 'network_data'::regclass;
+            SELECT EXISTS (
+                SELECT FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = 'network_data' AND column_name = 'location'
+            );
         """
         )
-        partitions = {row[0] for row in cursor.fetchall()}
-        required_partitions = {"network_data_p1", "network_data_p2", "network_data_p3"}
-        if required_partitions.issubset(partitions):
-            return True  # Parent table and all required partitions exist
-        else:
-            logging.info(f"Missing partitions: {required_partitions - partitions}")
+        if not cursor.fetchone()[0]:
+            logging.info("Table 'network_data' predates the 'location' column, reloading it.")
+            return False
+
+        # Tiles loaded before the batch query probed technologies lack their indexes
+        cursor.execute(
+            f"""
+            SELECT EXISTS (
+                SELECT FROM {CATALOG}
+                WHERE 'idx_g4_' || substr(name, {len(PARENT) + 2}) NOT IN (SELECT indexname FROM pg_indexes)
+            );
+        """
+        )
+        if cursor.fetchone()[0]:
+            logging.info(f"Tiles of '{PARENT}' predate the technology indexes, reloading them.")
+            return False
+        return True  # Parent table and all required partitions exist
     return False
 
 
+def split_tiles(df, size):
+    """
+    Split the rows the same way Postgres routes them to partitions:
+    {table name: (tile, rows)}, the tile being (i, j) or None for the
+    default partition.
+    """
+    tiled = (df["x"] >= 0) & (df["y"] >= 0)
+    frames = {
+        tile_name(i, j): ((int(i), int(j)), frame)
+        for (i, j), frame in df[tiled].groupby([df["x"][tiled] // size, df["y"][tiled] // size])
+    }
+    frames[DEFAULT_PARTITION] = (None, df[~tiled])
+    return frames
+
+
+def create_partition_tables(cursor, frames, size):
+    """
+    Create the tiles as standalone tables. They are attached to the parent
+    only once loaded and indexed, so `check_table_and_partitions` never sees
+    a half-loaded dataset.
+    """
+    cursor.execute(f"DROP TABLE IF EXISTS {PARENT} CASCADE;")
+    # Tables left behind by an interrupted load, or by a former layout
+    cursor.execute(
+        f"SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename LIKE '{PARENT}\\_%';"
+    )
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"DROP TABLE IF EXISTS {name} CASCADE;")
+    for name, (tile, _) in frames.items():
+        cursor.execute(
+            f"""
+            CREATE TABLE {name} ({TABLE_DEFINITION});
+        """
+        )
+        if tile:
+            # Lets ATTACH PARTITION skip its validation scans
+            x_min, x_max, y_min, y_max = tile_bounds(*tile, size)
+            cursor.execute(
+                f"ALTER TABLE {name} ADD CONSTRAINT {name}_range "
+                f"CHECK (x IS NOT NULL AND x >= {x_min} AND x < {x_max} AND "
+                f"y IS NOT NULL AND y >= {y_min} AND y < {y_max});"
+            )
+
+
+def copy_partition(name, frame):
+    """
+    Stream one partition into Postgres with COPY over its own connection,
+    then build its index. Returns (rows loaded, seconds).
+    """
+    start = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        for offset in range(0, len(frame), COPY_CHUNK_ROWS):
+            buffer = io.StringIO()
+            frame.iloc[offset:offset + COPY_CHUNK_ROWS].to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+            cursor.copy_expert(
+                f"COPY {name} ({COLUMNS}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        # Indexes are built after the data lands, which is much cheaper than
+        # maintaining them row by row
+        suffix = name.removeprefix(f"{PARENT}_")
+        cursor.execute(f"CREATE INDEX idx_x_y_{suffix} ON {name} (x, y);")
+        cursor.execute(f"CREATE INDEX idx_location_{suffix} ON {name} USING gist (location);")
+        for column in TECHNOLOGIES:
+            cursor.execute(f"CREATE INDEX idx_{column}_{suffix} ON {name} (Operateur, x, y) WHERE {column};")
+        cursor.execute(f"ANALYZE {name};")
+        conn.commit()
+    finally:
+        conn.close()
+    return len(frame), time.perf_counter() - start
+
+
+def attach_partitions(cursor, frames, size):
+    """
+    Create the parent table and its x strips, attach every loaded tile to
+    its strip, and record the tiles in the catalog read by the app.
+    """
+    cursor.execute(
+        f"""
+        CREATE TABLE {PARENT} ({TABLE_DEFINITION}) PARTITION BY RANGE (x);
+    """
+    )
+    tiles = {name: tile for name, (tile, _) in frames.items() if tile}
+    for i in sorted({i for i, _ in tiles.values()}):
+        strip = strip_name(i)
+        cursor.execute(
+            f"""
+            CREATE TABLE {strip} ({TABLE_DEFINITION}) PARTITION BY RANGE (y);
+        """
+        )
+        for name, (tile_i, j) in tiles.items():
+            if tile_i == i:
+                _, _, y_min, y_max = tile_bounds(i, j, size)
+                cursor.execute(f"ALTER TABLE {strip} ATTACH PARTITION {name} FOR VALUES FROM ({y_min}) TO ({y_max});")
+        cursor.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {strip} FOR VALUES FROM ({i * size}) TO ({(i + 1) * size});")
+    for name in tiles:
+        cursor.execute(f"ALTER TABLE {name} DROP CONSTRAINT {name}_range;")
+    cursor.execute(f"ALTER TABLE {PARENT} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT;")
+
+    cursor.execute(f"CREATE TABLE {CATALOG} (name TEXT PRIMARY KEY, x_min INT, x_max INT, y_min INT, y_max INT);")
+    cursor.executemany(
+        f"INSERT INTO {CATALOG} VALUES (%s, %s, %s, %s, %s);",
+        [(name, *tile_bounds(*tile, size)) for name, tile in tiles.items()],
+    )
+
+
+def rebuild_grid(df):
+    """
+    Rasterize the freshly loaded rows into the coverage grid of the "grid" engine.
+    Running apps pick the new file up on their next lookup.
+    """
+    start = time.perf_counter()
+    try:
+        grid = build_grid(
+            df["Operateur"], df["x"], df["y"], df["g2"], df["g3"], df["g4"],
+            cell_size=Config.COVERAGE_GRID_CELL_SIZE,
+        )
+        grid.save(Config.COVERAGE_GRID_PATH)
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to rebuild the coverage grid: {e}")
+        return
+    logging.info(
+        f"Rebuilt the coverage grid ({grid.shape[1]}x{grid.shape[0]} cells) "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+
+def publish_shared_index(df):
+    """
+    Publish the freshly loaded rows to the workers of the "shared" engine,
+    which attach to them on their next lookup.
+    """
+    try:
+        index = GridIndex(df["Operateur"], df["x"], df["y"], df["g2"], df["g3"], df["g4"])
+        publish(index, Config.COVERAGE_SHARED_DIR)
+    except (OSError, ValueError) as e:
+        logging.error(f"Failed to publish the shared coverage index: {e}")
+
+
 def main():
+    conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -56,70 +264,56 @@ def main():
             return
 
         logging.info("Creating partitioned table and loading data...")
+        start = time.perf_counter()
 
-        # Drop existing table if it exists
-        cursor.execute("DROP TABLE IF EXISTS network_data CASCADE;")
-
-        # Create partitioned table
-        cursor.execute(
-            """
-            CREATE TABLE network_data (
-                Operateur VARCHAR(10),
-                x INT,
-                y INT,
-                g2 BOOLEAN,
-                g3 BOOLEAN,
-                g4 BOOLEAN
-            ) PARTITION BY RANGE (x);
-        """
-        )
-
-        # Define partitions, including a default partition
-        cursor.execute(
-            """
-            CREATE TABLE network_data_p1 PARTITION OF network_data FOR VALUES FROM (102980) TO (400000);
-            CREATE TABLE network_data_p2 PARTITION OF network_data FOR VALUES FROM (400000) TO (800000);
-            CREATE TABLE network_data_p3 PARTITION OF network_data FOR VALUES FROM (800000) TO (1240586);
-            CREATE TABLE network_data_default PARTITION OF network_data DEFAULT;
-        """
-        )
-
-        # Add indexes to partitions
-        cursor.execute("CREATE INDEX idx_x_y_p1 ON network_data_p1 (x, y);")
-        cursor.execute("CREATE INDEX idx_x_y_p2 ON network_data_p2 (x, y);")
-        cursor.execute("CREATE INDEX idx_x_y_p3 ON network_data_p3 (x, y);")
-
-        # Load CSV into DataFrame
-        df = pd.read_csv("/app/data.csv", delimiter=";")
-
-        # Ensure all data types are standard Python types
+        # Load the CSV or snapshot into a DataFrame
+        df = load_dataframe(Config.COVERAGE_DATA_PATH)
+        df = df.rename(columns={"2G": "g2", "3G": "g3", "4G": "g4"})[
+            ["Operateur", "x", "y", "g2", "g3", "g4"]
+        ]
         df["Operateur"] = df["Operateur"].astype(str)
         df["x"] = df["x"].astype(int)
         df["y"] = df["y"].astype(int)
-        df["2G"] = df["2G"].astype(bool)
-        df["3G"] = df["3G"].astype(bool)
-        df["4G"] = df["4G"].astype(bool)
+        for column in ("g2", "g3", "g4"):
+            df[column] = df[column].astype(bool)
 
-        # Insert data into the partitioned table
-        for _, row in df.iterrows():
-            cursor.execute(
-                """
-                INSERT INTO network_data (Operateur, x, y, g2, g3, g4)
-                VALUES (%s, %s, %s, %s, %s, %s);
-            """,
-                (row["Operateur"], row["x"], row["y"], row["2G"], row["3G"], row["4G"]),
+        size = Config.COVERAGE_TILE_SIZE
+        frames = split_tiles(df, size)
+        create_partition_tables(cursor, frames, size)
+        conn.commit()
+
+        # Load the tiles in parallel over separate connections
+        with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+            results = dict(
+                zip(frames, executor.map(copy_partition, frames, [frame for _, frame in frames.values()]))
+            )
+        for name, (rows, seconds) in results.items():
+            logging.info(
+                f"{name}: {rows} rows in {seconds:.2f}s ({rows / max(seconds, 1e-9):,.0f} rows/s)"
             )
 
+        # Publish the dataset in a single transaction
+        attach_partitions(cursor, frames, size)
         conn.commit()
+
+        total_rows = sum(rows for rows, _ in results.values())
+        elapsed = time.perf_counter() - start
         logging.info(
+            f"Loaded {total_rows} rows into {len(frames) - 1} tiles of {size / 1000:g} km "
+            f"in {elapsed:.2f}s ({total_rows / elapsed:,.0f} rows/s). "
             "Partitioned table created and data loaded into PostgreSQL successfully."
         )
 
+        if Config.COVERAGE_ENGINE == "grid":
+            rebuild_grid(df)
+        if Config.COVERAGE_ENGINE == "shared":
+            publish_shared_index(df)
+
     except psycopg2.Error as e:
         logging.error(f"Database operation failed: {e}")
     finally:
-        cursor.close()
-        conn.close()
+        if conn is not None:
+            conn.close()
 
 
 if __name__ == "__main__":
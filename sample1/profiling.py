@@ -0,0 +1,183 @@
+"""
+Opt-in profiling of single requests, to find out why an address is slow.
+
+A request sent with the `X-Coverage-Profile: 1` header or `profile=1` in its
+query string, by a client in the configured networks, runs under cProfile.
+The time of each stage (see metrics.stage) and the coverage queries it
+issued are recorded; the queries are then run again with
+`EXPLAIN (ANALYZE, BUFFERS)`. The report lists the stages, the functions
+with the most cumulative time, and each plan with the partitions it read.
+
+cProfile only sees the thread the request runs on.
+"""
+import cProfile
+import ipaddress
+import os
+import pstats
+import time
+from contextvars import ContextVar
+
+HEADER = "X-Coverage-Profile"
+QUERY_FLAG = "profile"
+TOP_FUNCTIONS = 15
+
+_current = ContextVar("request_profile", default=None)
+
+
+def parse_clients(clients):
+    """
+    Networks allowed to profile requests, from a comma-separated string or a
+    list of addresses and CIDR blocks. Invalid entries raise ValueError.
+    """
+    if isinstance(clients, str):
+        clients = clients.split(",")
+    return [ipaddress.ip_network(client.strip(), strict=False) for client in clients if client.strip()]
+
+
+def profiling_requested(header, flag, client, allowed_clients):
+    """
+    Whether to profile a request with this header and query flag value, sent
+    from the `client` address. Requests from other clients run normally.
+    """
+    if (header or flag or "").lower() not in ("1", "true", "yes"):
+        return False
+    try:
+        address = ipaddress.ip_address(client or "")
+    except ValueError:
+        return False
+    return any(address in network for network in parse_clients(allowed_clients))
+
+
+def current_profile():
+    """
+    The RequestProfile of the running request, or None when not profiled.
+    """
+    return _current.get()
+
+
+def record_stage(name, seconds):
+    profile = _current.get()
+    if profile is not None:
+        profile.stages[name] = profile.stages.get(name, 0.0) + seconds
+
+
+def record_query(name, sql, params):
+    """
+    Remember a query of the profiled request, to explain it afterwards.
+    """
+    profile = _current.get()
+    if profile is not None:
+        profile.queries.append((name, sql, params))
+
+
+def relations(plan):
+    """
+    Tables and partitions read by the plan node and its children.
+    """
+    found = [plan["Relation Name"]] if "Relation Name" in plan else []
+    for child in plan.get("Plans", []):
+        found.extend(relation for relation in relations(child) if relation not in found)
+    return found
+
+
+def plan_lines(plan, depth=0):
+    """
+    One line per plan node: type, relation, rows, time and buffers.
+    """
+    relation = f" on {plan['Relation Name']}" if "Relation Name" in plan else ""
+    index = f" using {plan['Index Name']}" if "Index Name" in plan else ""
+    lines = [
+        f"{'  ' * depth}{plan['Node Type']}{index}{relation} "
+        f"(rows={plan.get('Actual Rows')} loops={plan.get('Actual Loops')} "
+        f"time={plan.get('Actual Total Time')} ms "
+        f"buffers hit={plan.get('Shared Hit Blocks', 0)} read={plan.get('Shared Read Blocks', 0)})"
+    ]
+    for child in plan.get("Plans", []):
+        lines.extend(plan_lines(child, depth + 1))
+    return lines
+
+
+def short_path(filename):
+    """
+    Last directory and file name of a source path, e.g. "psycopg2/extras.py".
+    """
+    return "/".join(filename.replace(os.sep, "/").split("/")[-2:])
+
+
+class RequestProfile:
+    """
+    Profile of one request, active for the code run inside `with profile:`.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.queries = []
+        self.plans = []
+        self.elapsed = None
+        self._profiler = None
+        self._token = None
+        self._start = None
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self._profiler = cProfile.Profile()
+        try:
+            self._profiler.enable()
+        except ValueError:
+            # Another profiler is already running on this thread
+            self._profiler = None
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self._start
+        if self._profiler is not None:
+            self._profiler.disable()
+        _current.reset(self._token)
+
+    def explain(self, cursor):
+        """
+        Run the recorded queries again under EXPLAIN (ANALYZE, BUFFERS) with `cursor`.
+        """
+        for name, sql, params in self.queries:
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+                result = cursor.fetchone()[0][0]
+            except Exception as e:
+                self.plans.append({"query": name, "error": str(e)})
+                continue
+            self.plans.append(
+                {
+                    "query": name,
+                    "execution_ms": result["Execution Time"],
+                    "planning_ms": result["Planning Time"],
+                    "relations": relations(result["Plan"]),
+                    "plan": plan_lines(result["Plan"]),
+                }
+            )
+
+    def top_functions(self, limit=TOP_FUNCTIONS):
+        if self._profiler is None:
+            return []
+        stats = pstats.Stats(self._profiler).stats
+        ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+        return [
+            {
+                "function": f"{short_path(filename)}:{line}({function})",
+                "calls": calls,
+                "cumulative_ms": round(cumulative * 1000, 3),
+                "own_ms": round(own * 1000, 3),
+            }
+            for (filename, line, function), (_, calls, own, cumulative, _) in ranked
+        ]
+
+    def report(self):
+        """
+        JSON-serializable summary of the request.
+        """
+        return {
+            "total_ms": round(self.elapsed * 1000, 3),
+            "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            "functions": self.top_functions(),
+            "queries": self.plans or [{"query": name} for name, _, _ in self.queries],
+        }
@@ -0,0 +1,234 @@
+"""
+Rate limit of the calls to the geocoding API, shared by every worker.
+
+api-adresse limits the requests per second of each client IP. Every worker
+calling it on its own would exceed that limit as soon as the deployment
+scales out, so calls take a token from one bucket of `rate` tokens per
+second holding up to `burst` of them:
+- "redis": the bucket lives in Redis and is shared by every process. It is
+  kept as the time the bucket will be full again (GCRA), updated by a Lua
+  script, so one round trip takes a token.
+- "memory": the bucket is held by the process.
+
+A call finding the bucket empty is not refused: it reserves the next token
+and sleeps until its time, so bursts are queued and spread out. Only calls
+that would wait more than `max_wait` seconds, or arrive while `max_queue`
+calls of the process already wait, fail at once with RateLimited. When
+Redis cannot be reached the process falls back to a local bucket for
+`retry_after` seconds. By default that bucket holds the process's share of
+the limit, `rate / workers`, so the `workers` processes together stay
+within it.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+KEY = "ratelimit:geocoder"
+
+# KEYS[1]: theoretical arrival time of the next token, in seconds.
+# ARGV: seconds per token, burst, longest accepted wait.
+# Returns {admitted, wait} with the wait as a string, Lua numbers being
+# truncated to integers on their way back.
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+-- Subtracted directly: adding and removing the interval rounds a free token into a tiny wait
+local wait = tat - now - (burst - 1) * interval
+if wait < 0 then
+    wait = 0
+end
+if wait > max_wait then
+    return {0, tostring(wait)}
+end
+redis.call('SET', KEYS[1], tostring(tat + interval), 'PX', math.ceil((tat + interval - now) * 1000))
+return {1, tostring(wait)}
+"""
+
+
+class RateLimited(requests.RequestException):
+    """
+    The geocoder call would have waited too long for its turn; it was not sent.
+    `retry_after` is the number of seconds until a call would be admitted.
+    """
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LocalBucket:
+    """
+    Token bucket of one process, with the same reservations as RedisBucket.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.interval = 1 / rate
+        self.burst = burst
+        self.clock = clock
+        self._tat = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """
+        (admitted, wait): take the next token if it is available within
+        `max_wait` seconds, and the seconds until it is.
+        """
+        with self._lock:
+            now = self.clock()
+            tat = max(self._tat, now)
+            # Subtracted directly: adding and removing the interval rounds a
+            # free token into a tiny wait
+            wait = max(tat - now - (self.burst - 1) * self.interval, 0.0)
+            if wait > max_wait:
+                return False, wait
+            self._tat = tat + self.interval
+            return True, wait
+
+
+class RedisBucket:
+    """
+    Token bucket stored in Redis, shared by every worker of the deployment.
+    """
+
+    def __init__(self, url, rate, burst, key=KEY, client=None):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url, socket_connect_timeout=0.2, socket_timeout=0.2)
+        self.interval = 1 / rate
+        self.burst = burst
+        self.key = key
+        self._script = client.register_script(GCRA_SCRIPT)
+
+    def reserve(self, max_wait):
+        admitted, wait = self._script(keys=[self.key], args=[self.interval, self.burst, max_wait])
+        return bool(admitted), float(wait)
+
+
+class RateLimiter:
+    """
+    Admission control of the geocoder calls over `bucket`.
+
+    `on_wait(endpoint, seconds)` is called with the wait of every admitted
+    call and `on_queue(depth)` with the number of calls of the process
+    waiting for their turn, e.g. to export them as metrics.
+    """
+
+    def __init__(
+        self,
+        bucket,
+        fallback=None,
+        max_wait=5,
+        max_queue=100,
+        retry_after=30,
+        clock=time.monotonic,
+        sleep=time.sleep,
+        on_wait=None,
+        on_queue=None,
+    ):
+        self.bucket = bucket
+        self.fallback = fallback
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.clock = clock
+        self.sleep = sleep
+        self.on_wait = on_wait
+        self.on_queue = on_queue
+        self.depth = 0
+        self._bucket_disabled_until = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, max_wait):
+        if self.fallback is None or self.clock() >= self._bucket_disabled_until:
+            try:
+                return self.bucket.reserve(max_wait)
+            except Exception as e:
+                if self.fallback is None:
+                    raise
+                self._bucket_disabled_until = self.clock() + self.retry_after
+                logging.warning(f"Geocoder rate limit bucket unavailable, limiting this process only: {e}")
+        return self.fallback.reserve(max_wait)
+
+    def reserve(self, endpoint, max_wait=None):
+        """
+        Take a token for a call to `endpoint` and return the seconds to wait
+        before sending it. Raises RateLimited when the wait would exceed
+        `max_wait` (the limiter's by default).
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        admitted, wait = self._reserve(max_wait)
+        if not admitted:
+            raise RateLimited(f"Geocoder rate limit reached, next {endpoint} call in {wait:.2f}s", retry_after=wait)
+        if self.on_wait is not None:
+            self.on_wait(endpoint, wait)
+        return wait
+
+    @contextmanager
+    def queued(self):
+        """
+        Count the block as a call waiting for its turn; raises RateLimited
+        when `max_queue` calls are waiting already.
+        """
+        with self._lock:
+            if self.depth >= self.max_queue:
+                raise RateLimited(f"{self.depth} geocoder calls are already waiting", retry_after=self.max_wait)
+            self.depth += 1
+            depth = self.depth
+        if self.on_queue is not None:
+            self.on_queue(depth)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.depth -= 1
+                depth = self.depth
+            if self.on_queue is not None:
+                self.on_queue(depth)
+
+    def acquire(self, endpoint, max_wait=None):
+        """
+        Block until a call to `endpoint` may be sent.
+        """
+        with self.queued():
+            wait = self.reserve(endpoint, max_wait)
+            if wait > 0:
+                self.sleep(wait)
+
+
+def build_rate_limiter(
+    backend="memory",
+    rate=40,
+    burst=40,
+    fallback_rate=0,
+    workers=4,
+    max_wait=5,
+    max_queue=100,
+    redis_url=None,
+):
+    """
+    Create the limiter for the configured bucket: "memory" or "redis", or
+    None when `rate` is 0. The in-process fallback of the Redis bucket
+    allows `fallback_rate` calls per second, or when it is 0 the share of
+    one of the `workers` processes sharing the bucket, `rate / workers`.
+    """
+    if not rate:
+        return None
+    if backend == "redis":
+        bucket = RedisBucket(redis_url, rate, burst)
+        fallback = LocalBucket(fallback_rate or rate / workers, max(burst // workers, 1))
+    elif backend == "memory":
+        bucket, fallback = LocalBucket(rate, burst), None
+    else:
+        raise ValueError(f"Unknown geocoder rate limit backend: {backend}")
+    return RateLimiter(bucket, fallback, max_wait=max_wait, max_queue=max_queue)
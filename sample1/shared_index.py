@@ -0,0 +1,231 @@
+"""
+Coverage index shared by every worker process of a prefork server.
+
+With the "memory" engine every worker builds and holds its own copy of the
+index. The "shared" engine publishes the built index once into a directory
+on a memory-backed filesystem (/dev/shm by default), as one .npy file per
+array, and every worker maps those files read-only: the pages are held
+once, whatever the number of workers.
+
+Layout of the directory:
+    current         name of the published generation
+    gen-<time>/     arrays of one generation, and meta.json (cell size, rows)
+
+A new dataset is written into a new generation directory, then `current`
+is replaced atomically. Workers check `current` on every lookup and attach
+to the new generation without a restart; older generations are removed
+right away. A lookup in progress keeps a consistent view of the generation
+it started on.
+
+The pages of a removed generation are freed once no worker maps it. Besides
+its lookups, every worker checks `current` from a background thread every
+`refresh_interval` seconds, so an idle worker drops the old mapping within
+that delay too. Two generations are thus in memory together for at most
+`refresh_interval` seconds after a swap, rather than until the next lookup
+of the last idle worker. Overwriting the arrays in place would avoid the
+overlap, but a lookup in progress could then read a mix of two datasets.
+
+Publish a new dataset with:
+    python shared_index.py --source data.csv
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from spatial_index import GridIndex
+
+POINTER = "current"
+LOCK = ".lock"
+META = "meta.json"
+GENERATION_PREFIX = "gen-"
+# A generation can be removed between reading `current` and mapping it
+ATTACH_ATTEMPTS = 3
+# Seconds between two checks of `current` made without a lookup
+REFRESH_INTERVAL = 5.0
+
+
+@contextmanager
+def publish_lock(directory):
+    """
+    Serialize the publishers of `directory`, across processes.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def current_generation(directory):
+    """
+    Name of the published generation, or None before the first publish.
+    """
+    try:
+        with open(os.path.join(directory, POINTER)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish(index, directory):
+    """
+    Write `index` as a new generation of `directory`, make it current and
+    remove the previous ones. Returns the name of the new generation.
+    """
+    with publish_lock(directory):
+        return _publish(index, directory)
+
+
+def ensure_published(directory, build):
+    """
+    Publish the index returned by `build()` unless a generation already
+    exists. Workers starting together build it once: the others wait for
+    the lock, then find it published.
+    """
+    with publish_lock(directory):
+        if current_generation(directory) is None:
+            _publish(build(), directory)
+
+
+def _publish(index, directory):
+    tmp_path = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+    try:
+        for name, array in index.arrays().items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, META), "w") as f:
+            json.dump({"cell_size": index.cell_size, "rows": len(index)}, f)
+        generation = f"{GENERATION_PREFIX}{time.time_ns()}"
+        os.rename(tmp_path, os.path.join(directory, generation))
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+    fd, pointer_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        f.write(generation)
+    os.replace(pointer_path, os.path.join(directory, POINTER))
+
+    for entry in os.listdir(directory):
+        if entry != generation and entry.startswith((GENERATION_PREFIX, ".tmp-")):
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+    logging.info(f"Published {len(index)} rows as {generation} in {directory}")
+    return generation
+
+
+def attach(directory, generation):
+    """
+    GridIndex over the memory-mapped arrays of `generation`.
+    """
+    path = os.path.join(directory, generation)
+    with open(os.path.join(path, META)) as f:
+        meta = json.load(f)
+    # Plain ndarray views of the maps: indexing np.memmap is slower
+    arrays = {
+        name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        for name in GridIndex.ARRAYS
+    }
+    return GridIndex.from_arrays(arrays, cell_size=meta["cell_size"])
+
+
+class SharedIndex:
+    """
+    The current generation of a shared index directory, reattached when a
+    new one is published, on the next lookup or at the latest after
+    `refresh_interval` seconds (never when it is 0). Answers queries like
+    GridIndex.
+    """
+
+    def __init__(self, directory, refresh_interval=REFRESH_INTERVAL):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self._pointer = os.path.join(directory, POINTER)
+        # (pointer file identity, generation name, GridIndex)
+        self._state = (None, None, None)
+        self._watcher_lock = threading.Lock()
+        self._watcher_pid = None
+        self._stopped = threading.Event()
+        self.get()
+
+    @property
+    def generation(self):
+        return self._state[1]
+
+    def get(self):
+        """
+        The GridIndex of the current generation; raises OSError or ValueError
+        when none is published or it cannot be read.
+        """
+        if self._watcher_pid != os.getpid() and self.refresh_interval:
+            self._start_watcher()
+        for _ in range(ATTACH_ATTEMPTS):
+            pointer = os.stat(self._pointer)
+            key = (pointer.st_ino, pointer.st_mtime_ns)
+            if key == self._state[0]:
+                return self._state[2]
+            generation = current_generation(self.directory)
+            if generation is None:
+                break
+            try:
+                self._state = (key, generation, attach(self.directory, generation))
+            except FileNotFoundError:
+                continue
+            return self._state[2]
+        raise ValueError(f"No usable coverage index generation in {self.directory}")
+
+    def _start_watcher(self):
+        # Threads do not survive a fork, so every worker starts its own
+        with self._watcher_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            self._stopped = threading.Event()
+            threading.Thread(
+                target=self._watch, args=(self._stopped,), name="shared-index-watcher", daemon=True
+            ).start()
+
+    def _watch(self, stopped):
+        while not stopped.wait(self.refresh_interval):
+            try:
+                self.get()
+            except (OSError, ValueError) as e:
+                logging.warning(f"Could not refresh the shared coverage index: {e}")
+
+    def close(self):
+        """
+        Stop checking for new generations in the background.
+        """
+        self._stopped.set()
+
+    def __len__(self):
+        return len(self.get())
+
+    def query(self, x, y, radius):
+        return self.get().query(x, y, radius)
+
+
+def main():
+    import argparse
+    from app_config import Config
+
+    parser = argparse.ArgumentParser(description="Publish a new generation of the shared coverage index.")
+    parser.add_argument("--source", default=Config.COVERAGE_DATA_PATH, help="CSV or snapshot to index.")
+    parser.add_argument("--directory", default=Config.COVERAGE_SHARED_DIR, help="Shared index directory.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generation = publish(GridIndex.from_path(args.source), args.directory)
+    print(f"Published {generation} to {args.directory} in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
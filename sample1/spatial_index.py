@@ -0,0 +1,190 @@
+import logging
+from math import floor
+
+import numpy as np
+import pandas as pd
+from snapshot import Snapshot, is_snapshot
+
+# Cell size in meters; matching it to the search radius keeps a query to 3x3 cells
+DEFAULT_CELL_SIZE = 3000
+
+# Large enough to keep any Lambert-93 cell row distinct inside a single int64 key
+CELL_KEY_STRIDE = 1 << 32
+
+
+def cell_keys(cell_x, cell_y):
+    """
+    Combine grid cell coordinates into a single sortable key.
+    """
+    return np.asarray(cell_x, dtype=np.int64) * CELL_KEY_STRIDE + np.asarray(
+        cell_y, dtype=np.int64
+    )
+
+
+class GridIndex:
+    """
+    Uniform grid over Lambert-93 coordinates answering radius queries from memory.
+
+    Rows are stored in the same order the Postgres engine sorts them in
+    (x, y, Operateur, g2, g3, g4), so both engines return identical rows.
+    """
+
+    # Arrays holding the built index, see `arrays` and `from_arrays`
+    ARRAYS = (
+        "operator_codes", "x", "y", "operator_idx", "g2", "g3", "g4",
+        "rank", "cell_keys", "cell_starts", "cell_ends",
+    )
+
+    def __init__(self, operators, x, y, g2, g3, g4, cell_size=DEFAULT_CELL_SIZE):
+        operators = np.asarray(operators).astype(str)
+        x = np.asarray(x, dtype=np.int64)
+        y = np.asarray(y, dtype=np.int64)
+        g2 = np.asarray(g2, dtype=bool)
+        g3 = np.asarray(g3, dtype=bool)
+        g4 = np.asarray(g4, dtype=bool)
+
+        self.cell_size = cell_size
+        self.operator_codes, operator_idx = np.unique(operators, return_inverse=True)
+
+        # Canonical row order, then grouped by cell; the stable sort keeps the
+        # canonical order inside each cell so it can be recovered with `rank`.
+        canonical = np.lexsort((g4, g3, g2, operator_idx, y, x))
+        keys = cell_keys(x[canonical] // cell_size, y[canonical] // cell_size)
+        by_cell = np.argsort(keys, kind="stable")
+        order = canonical[by_cell]
+
+        self.rank = by_cell
+        self.x = x[order]
+        self.y = y[order]
+        self.operator_idx = operator_idx[order]
+        self.g2 = g2[order]
+        self.g3 = g3[order]
+        self.g4 = g4[order]
+
+        sorted_keys = keys[by_cell]
+        self.cell_keys, self.cell_starts = np.unique(sorted_keys, return_index=True)
+        self.cell_ends = np.append(self.cell_starts[1:], len(sorted_keys))
+
+    def __len__(self):
+        return len(self.x)
+
+    def arrays(self):
+        """
+        {name: array} of the built index, enough for `from_arrays` to rebuild it.
+        """
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    @classmethod
+    def from_arrays(cls, arrays, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Wrap arrays saved from a built index without copying them, e.g.
+        memory-mapped ones shared by several processes.
+        """
+        index = cls.__new__(cls)
+        index.cell_size = cell_size
+        for name in cls.ARRAYS:
+            setattr(index, name, arrays[name])
+        return index
+
+    @classmethod
+    def from_dataframe(cls, df, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Build the index from a DataFrame shaped like data.csv.
+        """
+        return cls(
+            df["Operateur"],
+            df["x"],
+            df["y"],
+            df["2G"],
+            df["3G"],
+            df["4G"],
+            cell_size=cell_size,
+        )
+
+    @classmethod
+    def from_csv(cls, path, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Build the index from the semicolon separated coverage CSV.
+        """
+        df = pd.read_csv(path, delimiter=";", dtype={"Operateur": str})
+        index = cls.from_dataframe(df, cell_size=cell_size)
+        logging.info(f"Loaded {len(index)} rows into the in-memory index from {path}")
+        return index
+
+    @classmethod
+    def from_snapshot(cls, path, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Build the index straight from the memory-mapped snapshot columns.
+        """
+        snap = Snapshot(path)
+        index = cls(
+            snap.operators, snap.x, snap.y, snap.g2, snap.g3, snap.g4, cell_size=cell_size
+        )
+        logging.info(f"Loaded {len(index)} rows into the in-memory index from {path}")
+        return index
+
+    @classmethod
+    def from_path(cls, path, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Build the index from a snapshot or a CSV file, whichever `path` is.
+        """
+        if is_snapshot(path):
+            return cls.from_snapshot(path, cell_size=cell_size)
+        return cls.from_csv(path, cell_size=cell_size)
+
+    @classmethod
+    def from_db(cls, conn, cell_size=DEFAULT_CELL_SIZE):
+        """
+        Build the index from the `network_data` table.
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT Operateur, x, y, g2, g3, g4 FROM network_data;")
+        rows = cursor.fetchall()
+        cursor.close()
+        df = pd.DataFrame(rows, columns=["Operateur", "x", "y", "2G", "3G", "4G"])
+        index = cls.from_dataframe(df, cell_size=cell_size)
+        logging.info(f"Loaded {len(index)} rows into the in-memory index from network_data")
+        return index
+
+    def _candidates(self, x, y, radius):
+        """
+        Positions of the rows stored in cells overlapping the query bounding box.
+        """
+        cs = self.cell_size
+        cells_x = np.arange(floor((x - radius) / cs), floor((x + radius) / cs) + 1)
+        cells_y = np.arange(floor((y - radius) / cs), floor((y + radius) / cs) + 1)
+        wanted = cell_keys(np.repeat(cells_x, len(cells_y)), np.tile(cells_y, len(cells_x)))
+
+        pos = np.searchsorted(self.cell_keys, wanted)
+        found = pos < len(self.cell_keys)
+        found[found] = self.cell_keys[pos[found]] == wanted[found]
+        pos = pos[found]
+        if not len(pos):
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(
+            [np.arange(self.cell_starts[p], self.cell_ends[p]) for p in pos]
+        )
+
+    def query(self, x, y, radius):
+        """
+        Return the (Operateur, x, y, g2, g3, g4) rows within `radius` meters of
+        (x, y), in the same order as the Postgres engine.
+        """
+        x, y = float(x), float(y)
+        candidates = self._candidates(x, y, radius)
+        dx = self.x[candidates] - x
+        dy = self.y[candidates] - y
+        hits = candidates[np.sqrt(dx**2 + dy**2) <= radius]
+        hits = hits[np.argsort(self.rank[hits])]
+
+        return list(
+            zip(
+                self.operator_codes[self.operator_idx[hits]].tolist(),
+                self.x[hits].tolist(),
+                self.y[hits].tolist(),
+                self.g2[hits].tolist(),
+                self.g3[hits].tolist(),
+                self.g4[hits].tolist(),
+            )
+        )
+
@@ -41,3 +41,19 @@ def test_api_valid_address(client, requests_mock):
     response = client.get("/api/?q=42+rue+papernest+75011+Paris")
     assert response.status_code == 200
     assert "Orange" in response.json, "Orange operator missing in response"
+
+
+def test_api_nearest_mode(client, requests_mock):
+    requests_mock.get(
+        "https://api-adresse.data.gouv.fr/search/?q=42+rue+papernest+75011+Paris",
+        json={"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]},
+    )
+    response = client.get("/api/?q=42+rue+papernest+75011+Paris&mode=nearest")
+    assert response.status_code == 200
+    assert set(response.json["Orange"]) == {"2G", "3G", "4G", "distance"}
+    assert all(0 <= network["distance"] <= 3000 for network in response.json.values())
+
+
+def test_api_unknown_mode(client):
+    response = client.get("/api/?q=Paris&mode=closest")
+    assert response.status_code == 400
@@ -0,0 +1,116 @@
+import csv
+import io
+from email.parser import BytesParser
+from email.policy import default
+import pytest
+import sample1.utility as utility
+from sample1.app import create_app, find_coverage_flags_batch, find_coverage_rows, operator_flags
+
+BATCH_URL = "https://api-adresse.data.gouv.fr/search/csv/"
+
+# Addresses the stand-in geocoder knows about
+KNOWN_ADDRESSES = {
+    "42 rue papernest 75011 Paris": (2.3522, 48.8566),
+    "1 place bellecour 69002 Lyon": (4.8320, 45.7578),
+    "10 rue de rivoli 75004 Paris": (2.3601, 48.8554),
+    "3 quai des chartrons 33000 Bordeaux": (-0.5700, 44.8480),
+}
+
+
+def batch_geocoder(request, context):
+    """Local stand-in for api-adresse's CSV batch mode."""
+    message = BytesParser(policy=default).parsebytes(
+        f"Content-Type: {request.headers['Content-Type']}\r\n\r\n".encode() + request.body
+    )
+    upload = next(
+        part.get_content()
+        for part in message.iter_parts()
+        if part.get_param("name", header="content-disposition") == "data"
+    )
+    if isinstance(upload, bytes):
+        upload = upload.decode("utf-8")
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["id", "q", "latitude", "longitude"])
+    for row in csv.DictReader(io.StringIO(upload)):
+        lon, lat = KNOWN_ADDRESSES.get(row["q"], ("", ""))
+        writer.writerow([row["id"], row["q"], lat, lon])
+    return output.getvalue()
+
+
+@pytest.fixture
+def client():
+    app = create_app("app_config.TestingConfig")
+    with app.test_client() as client:
+        yield client
+
+
+def test_batch_requires_a_list(client):
+    response = client.post("/api/batch", json={"addresses": "Paris"})
+    assert response.status_code == 400
+
+
+def test_batch_rejects_oversized_payload(client):
+    client.application.config["BATCH_MAX_ADDRESSES"] = 2
+    response = client.post("/api/batch", json=["a", "b", "c"])
+    assert response.status_code == 413
+
+
+def test_batch_results_in_input_order(client, requests_mock):
+    requests_mock.post(BATCH_URL, text=batch_geocoder)
+    addresses = [
+        "1 place bellecour 69002 Lyon",
+        "",
+        "nowhere at all",
+        "42 rue papernest 75011 Paris",
+    ]
+    response = client.post("/api/batch", json={"addresses": addresses})
+    assert response.status_code == 200
+    results = response.json["results"]
+    assert [result["address"] for result in results] == addresses
+    assert "Orange" in results[0]["coverage"]
+    assert results[1]["error"] == "No address provided."
+    assert results[2]["error"] == "Unable to fetch coordinates."
+    assert "Orange" in results[3]["coverage"]
+    assert requests_mock.call_count == 1
+
+
+def test_batch_upstream_failure_is_reported_per_item(client, requests_mock):
+    requests_mock.post(BATCH_URL, status_code=503)
+    response = client.post("/api/batch", json=["somewhere unknown"])
+    assert response.status_code == 200
+    assert response.json["results"][0]["error"] == "Unable to fetch coordinates."
+
+
+def test_batch_sends_each_canonical_address_once(client, requests_mock):
+    uploads = []
+
+    def geocoder(request, context):
+        uploads.append(request.body.lower())
+        return batch_geocoder(request, context)
+
+    requests_mock.post(BATCH_URL, text=geocoder)
+    response = client.post("/api/batch", json=["10 rue de rivoli 75004 Paris", "10 Rue de Rivoli, 75004 PARIS"])
+    results = response.json["results"]
+    assert "Orange" in results[0]["coverage"]
+    assert results[1]["coverage"] == results[0]["coverage"]
+    assert len(uploads) == 1
+    assert uploads[0].count(b"rivoli") == 1
+
+
+def test_completed_chunks_are_cached_when_a_later_one_fails(requests_mock):
+    requests_mock.post(BATCH_URL, [{"text": batch_geocoder}, {"status_code": 503}])
+    addresses = ["3 quai des chartrons 33000 Bordeaux", "4 quai des chartrons 33000 Bordeaux"]
+    results = utility.batch_address_to_coordinates(addresses, chunk_size=1)
+    assert results == [{"lon": -0.57, "lat": 44.848}, None]
+    assert utility.geocode_cache.lookup("3 Quai des Chartrons 33000 Bordeaux") == (True, results[0])
+    assert utility.geocode_cache.lookup(addresses[1]) == (False, None)
+
+
+def test_batch_query_matches_single_lookups(client):
+    points = [(652000.0, 6862000.0), (843000.5, 6519000.5), (102980.0, 6847973.0), (0.0, 0.0)]
+    with client.application.app_context():
+        batch = find_coverage_flags_batch([x for x, _ in points], [y for _, y in points])
+        for (x, y), flags in zip(points, batch):
+            assert flags == operator_flags(find_coverage_rows(x, y))
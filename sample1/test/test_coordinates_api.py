@@ -0,0 +1,53 @@
+import json
+import pytest
+from sample1.app import create_app
+
+PARIS = [2.3522, 48.8566]
+
+
+@pytest.fixture
+def client():
+    app = create_app("app_config.TestingConfig")
+    with app.test_client() as client:
+        yield client
+
+
+def read_lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_coordinates_stream_one_line_per_point(client):
+    client.application.config["COORDINATES_CHUNK_SIZE"] = 2
+    response = client.post("/api/coordinates", json=[PARIS, [200, 0], {"lon": 2.3522, "lat": 48.8566}])
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = read_lines(response)
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    assert "Orange" in lines[0]["coverage"]
+    assert lines[1]["error"] == "Coordinates out of WGS84 range."
+    assert lines[2]["coverage"] == lines[0]["coverage"]
+
+
+def test_points_outside_lambert93_are_point_errors(client):
+    lines = read_lines(client.post("/api/coordinates", json=[[0, -90], PARIS, [-30.0, 40.0]]))
+    assert [line["index"] for line in lines] == [0, 1, 2]
+    assert lines[0]["error"] == "Coordinates outside the Lambert-93 area."
+    assert "Orange" in lines[1]["coverage"]
+    assert lines[2]["error"] == "Coordinates outside the Lambert-93 area."
+
+
+def test_coordinates_accept_a_feature_collection(client):
+    collection = {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "id": 7, "geometry": {"type": "Point", "coordinates": PARIS}}],
+    }
+    [line] = read_lines(client.post("/api/coordinates", json=collection))
+    assert line["id"] == 7
+    assert "Orange" in line["coverage"]
+
+
+def test_coordinates_reject_invalid_payloads(client):
+    assert client.post("/api/coordinates", json={"points": [PARIS]}).status_code == 400
+    assert client.post("/api/coordinates", json=[]).status_code == 400
+    client.application.config["COORDINATES_MAX_POINTS"] = 1
+    assert client.post("/api/coordinates", json=[PARIS, PARIS]).status_code == 413
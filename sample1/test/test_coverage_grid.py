@@ -0,0 +1,102 @@
+import os
+import numpy as np
+import pytest
+from sample1.app import create_app, find_coverage_rows, operator_flags
+from sample1.app_config import TestingConfig
+from sample1.coverage_grid import CoverageGrid, GridFile, accuracy_report, build_grid
+from sample1.snapshot import read_csv
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data.csv")
+
+
+@pytest.fixture(scope="module")
+def columns():
+    df = read_csv(DATA_PATH)
+    return (df["Operateur"], df["x"], df["y"], df["2G"], df["3G"], df["4G"])
+
+
+@pytest.fixture(scope="module")
+def grid_path(columns, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("grid") / "coverage.grid")
+    build_grid(*columns).save(path)
+    return path
+
+
+def test_grid_ors_rows_within_radius():
+    # Cell centres of 100 m cells are at odd multiples of 50 m
+    grid = build_grid(
+        ["20801", "20801", "20810", "20815"],
+        [100050, 101050, 100050, 104050],
+        [6100050, 6100050, 6102050, 6100050],
+        [1, 0, 0, 1],
+        [0, 0, 1, 1],
+        [0, 1, 0, 1],
+        cell_size=100,
+        radius=2000,
+    )
+    assert grid.lookup(100050, 6100050) == {"20801": (True, False, True), "20810": (False, True, False)}
+    assert grid.lookup(100020, 6100099) == grid.lookup(100050, 6100050)
+    assert grid.lookup(102150, 6100050) == {"20801": (False, False, True), "20815": (True, True, True)}
+    assert grid.lookup(107000, 6100050) is None
+
+
+def test_rows_outside_extent_are_ignored():
+    grid = build_grid(["20801", "20815"], [100000, 0], [6100000, 0], [1, 1], [1, 1], [1, 1])
+    assert grid.lookup(0, 0) is None
+    assert grid.lookup(100000, 6100000) == {"20801": (True, True, True)}
+
+
+def test_grid_round_trip(columns, grid_path):
+    grid = CoverageGrid.open(grid_path)
+    assert isinstance(grid.bits, np.memmap)
+    assert grid.operator_codes == ["20801", "20810", "20815", "20820"]
+    assert (grid.cell_size, grid.radius) == (250, 3000)
+    assert np.array_equal(grid.bits, build_grid(*columns).bits)
+
+
+def test_accuracy_report(columns, grid_path):
+    report = accuracy_report(CoverageGrid.open(grid_path), *columns, samples=2000)
+    assert report["samples"] == 2000
+    assert report["outside_grid"] == 0
+    assert report["match_rate"] > 0.95
+
+
+def test_grid_file_picks_up_rebuilds(tmp_path):
+    path = str(tmp_path / "coverage.grid")
+    build_grid(["20801"], [100000], [6100000], [1], [0], [0]).save(path)
+    grid_file = GridFile(path)
+    assert grid_file.get().lookup(100000, 6100000) == {"20801": (True, False, False)}
+    build_grid(["20801"], [100000], [6100000], [1], [1], [1]).save(path)
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert grid_file.get().lookup(100000, 6100000) == {"20801": (True, True, True)}
+
+
+def test_grid_engine_api(grid_path, requests_mock):
+    class GridTestingConfig(TestingConfig):
+        COVERAGE_ENGINE = "grid"
+        COVERAGE_GRID_PATH = grid_path
+
+    requests_mock.get(
+        "https://api-adresse.data.gouv.fr/search/?q=42+rue+papernest+75011+Paris",
+        json={"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]},
+    )
+    app = create_app(GridTestingConfig)
+    assert app.extensions["coverage_grid"] is not None
+    with app.test_client() as client:
+        response = client.get("/api/?q=42+rue+papernest+75011+Paris")
+    assert response.status_code == 200
+    assert response.json["Orange"] == {"2G": True, "3G": True, "4G": True}
+
+
+def test_radius_query_answers_like_the_grid(columns, grid_path):
+    grid = GridFile(grid_path).get()
+    _, x, y, _, _, _ = columns
+    rng = np.random.default_rng(0)
+    picks = rng.integers(0, len(x), 20)
+    # Cell centres, where the grid answer is exact
+    xs = grid.x0 + (np.floor((x[picks] - grid.x0) / grid.cell_size) + 0.5) * grid.cell_size
+    ys = grid.y0 + (np.floor((y[picks] - grid.y0) / grid.cell_size) + 0.5) * grid.cell_size
+    app = create_app("app_config.TestingConfig")
+    with app.app_context():
+        for cx, cy in zip(xs, ys):
+            assert operator_flags(find_coverage_rows(float(cx), float(cy))) == grid.lookup(cx, cy)
@@ -0,0 +1,243 @@
+import threading
+import time
+import psycopg2
+import pytest
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+from sample1.app import create_app
+from sample1.db_pool import ConnectionPool
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.rollbacks = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeConnect:
+    def __init__(self):
+        self.created = []
+
+    def __call__(self):
+        conn = FakeConnection()
+        self.created.append(conn)
+        return conn
+
+
+def test_connections_are_reused():
+    connect = FakeConnect()
+    pool = ConnectionPool(connect, minconn=1, maxconn=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(connect.created) == 1
+    assert pool.stats()["acquired"] == 2
+
+
+def test_min_connections_are_warmed_up():
+    connect = FakeConnect()
+    pool = ConnectionPool(connect, minconn=3, maxconn=5)
+    with pool.connection():
+        pass
+    assert pool.stats()["open"] == 3
+    assert pool.stats()["idle"] == 3
+
+
+def test_concurrent_first_checkouts_warm_up_once():
+    class SlowCheckPool(ConnectionPool):
+        # Widen the window between checking and setting the flag
+        @property
+        def _warmed(self):
+            warmed = self.__dict__["warmed"]
+            time.sleep(0.01)
+            return warmed
+
+        @_warmed.setter
+        def _warmed(self, value):
+            self.__dict__["warmed"] = value
+
+    pool = SlowCheckPool(FakeConnect(), minconn=2, maxconn=4)
+    warm_ups = []
+    warm_up = pool._warm_up
+    pool._warm_up = lambda: warm_ups.append(1) or warm_up()
+    threads = [threading.Thread(target=lambda: pool.putconn(pool.getconn())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(warm_ups) == 1
+
+
+def test_saturated_pool_times_out():
+    pool = ConnectionPool(FakeConnect(), minconn=0, maxconn=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(PoolError):
+            pool.getconn()
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["in_use"] == 0
+
+
+def test_checkout_waits_are_reported():
+    waits = []
+    pool = ConnectionPool(FakeConnect(), minconn=0, maxconn=1, timeout=0.05, on_wait=waits.append)
+    with pool.connection():
+        with pytest.raises(PoolError):
+            pool.getconn()
+    assert len(waits) == 2
+    assert waits[0] < 0.05 <= waits[1]
+
+
+def test_stats_are_reported():
+    reports = []
+    pool = ConnectionPool(FakeConnect(), minconn=0, maxconn=1, timeout=0.05, on_stats=reports.append)
+    with pool.connection():
+        assert reports[-1]["in_use"] == 1
+        assert reports[-1]["saturation"] == 1
+        with pytest.raises(PoolError):
+            pool.getconn()
+        assert reports[-1]["timeouts"] == 1
+    assert reports[-1]["in_use"] == 0
+    assert reports[-1]["idle"] == 1
+
+
+def test_waiting_thread_gets_returned_connection():
+    pool = ConnectionPool(FakeConnect(), minconn=0, maxconn=1, timeout=2)
+    conn = pool.getconn()
+    acquired = []
+
+    def worker():
+        with pool.connection() as other:
+            acquired.append(other)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    time.sleep(0.05)
+    assert pool.stats()["waiting"] == 1
+    pool.putconn(conn)
+    thread.join()
+    assert acquired == [conn]
+    assert pool.stats()["waits"] == 1
+    assert pool.stats()["wait_time_max"] > 0
+
+
+def test_query_error_rolls_back_and_returns_connection():
+    pool = ConnectionPool(FakeConnect(), minconn=0, maxconn=1)
+    with pytest.raises(psycopg2.ProgrammingError):
+        with pool.connection() as conn:
+            conn.status = extensions.TRANSACTION_STATUS_INERROR
+            raise psycopg2.ProgrammingError("syntax error")
+    assert conn.rollbacks == 1
+    assert not conn.closed
+    assert pool.stats()["idle"] == 1
+
+
+def test_connection_error_discards_connection():
+    connect = FakeConnect()
+    pool = ConnectionPool(connect, minconn=0, maxconn=1)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+    assert conn.closed
+    assert pool.stats()["open"] == 0
+    with pool.connection() as replacement:
+        assert replacement is not conn
+
+
+def test_unhealthy_idle_connection_is_replaced():
+    connect = FakeConnect()
+    pool = ConnectionPool(connect, minconn=0, maxconn=1, health_check_interval=0)
+    with pool.connection() as conn:
+        pass
+    conn.broken = True
+    with pool.connection() as replacement:
+        assert replacement is not conn
+    assert conn.closed
+    assert pool.stats()["health_check_failures"] == 1
+    assert pool.stats()["open"] == 1
+
+
+def test_closeall_closes_connections_in_use_when_returned():
+    pool = ConnectionPool(FakeConnect(), minconn=0, maxconn=2)
+    idle = pool.getconn()
+    in_use = pool.getconn()
+    pool.putconn(idle)
+    pool.closeall()
+    assert idle.closed
+    assert not in_use.closed
+    pool.putconn(in_use)
+    assert in_use.closed
+    stats = pool.stats()
+    assert stats["open"] == 0
+    assert stats["idle"] == 0
+    with pytest.raises(PoolError):
+        pool.getconn()
+
+
+def test_pool_under_many_threads():
+    pool = ConnectionPool(FakeConnect(), minconn=1, maxconn=4, timeout=5)
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(50):
+                with pool.connection():
+                    time.sleep(0.0005)
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.stats()
+    assert errors == []
+    assert stats["open"] <= 4
+    assert stats["in_use"] == 0
+    assert stats["acquired"] == 16 * 50
+
+
+def test_app_uses_pooled_connections():
+    app = create_app("app_config.TestingConfig")
+    pool = app.extensions["db_pool"]
+    with app.app_context():
+        for _ in range(3):
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1;")
+                assert cursor.fetchone()[0] == 1
+    assert pool.stats()["open"] == 1
+    pool.closeall()
@@ -0,0 +1,108 @@
+import pytest
+from sample1.geocache import GeocodeCache, SQLiteTier, canonicalize_address
+
+
+class StubGeocoder:
+    """Local stand-in for api-adresse that counts its calls."""
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def __call__(self, address):
+        self.calls.append(address)
+        result = self.results.get(address)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+PARIS = {"lon": 2.3522, "lat": 48.8566}
+
+
+def test_canonicalize_address():
+    assert canonicalize_address("  42, Rue  de l'Église  75011 PARIS ") == "42 rue de l eglise 75011 paris"
+    assert canonicalize_address("42 rue de l eglise 75011 paris") == "42 rue de l eglise 75011 paris"
+
+
+def test_repeat_addresses_hit_the_cache():
+    geocoder = StubGeocoder({"42 rue papernest 75011 Paris": PARIS})
+    cache = GeocodeCache()
+    assert cache.get_or_fetch("42 rue papernest 75011 Paris", geocoder) == PARIS
+    assert cache.get_or_fetch("42 Rue Papernest, 75011 PARIS", geocoder) == PARIS
+    assert len(geocoder.calls) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_negative_results_are_cached_with_their_own_ttl():
+    clock = FakeClock()
+    geocoder = StubGeocoder({})
+    cache = GeocodeCache(ttl=100, negative_ttl=10, clock=clock)
+    assert cache.get_or_fetch("nowhere", geocoder) is None
+    assert cache.get_or_fetch("nowhere", geocoder) is None
+    assert len(geocoder.calls) == 1
+    assert cache.stats()["negative_hits"] == 1
+
+    clock.now = 11
+    assert cache.get_or_fetch("nowhere", geocoder) is None
+    assert len(geocoder.calls) == 2
+    assert cache.stats()["expirations"] == 1
+
+
+def test_errors_are_not_cached():
+    geocoder = StubGeocoder({"paris": ConnectionError("upstream down")})
+    cache = GeocodeCache()
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            cache.get_or_fetch("paris", geocoder)
+    assert len(geocoder.calls) == 2
+
+
+def test_lru_evicts_least_recently_used():
+    geocoder = StubGeocoder({"a": PARIS, "b": PARIS, "c": PARIS})
+    cache = GeocodeCache(max_size=2)
+    cache.get_or_fetch("a", geocoder)
+    cache.get_or_fetch("b", geocoder)
+    cache.get_or_fetch("a", geocoder)
+    cache.get_or_fetch("c", geocoder)  # evicts "b"
+    assert cache.stats()["evictions"] == 1
+    cache.get_or_fetch("a", geocoder)
+    cache.get_or_fetch("b", geocoder)
+    assert geocoder.calls == ["a", "b", "c", "b"]
+
+
+def test_sqlite_second_tier_is_shared(tmp_path):
+    path = str(tmp_path / "geocode.sqlite3")
+    geocoder = StubGeocoder({"paris": PARIS})
+    GeocodeCache(second_tier=SQLiteTier(path)).get_or_fetch("paris", geocoder)
+    GeocodeCache(second_tier=SQLiteTier(path)).get_or_fetch("paris", geocoder)
+
+    other_process = GeocodeCache(second_tier=SQLiteTier(path))
+    assert other_process.get_or_fetch("Paris", geocoder) == PARIS
+    assert len(geocoder.calls) == 1
+    assert other_process.stats()["second_tier_hits"] == 1
+
+
+def test_failing_second_tier_is_bypassed():
+    class BrokenTier:
+        def get(self, key):
+            raise OSError("connection refused")
+
+        def set(self, key, value, ttl):
+            raise OSError("connection refused")
+
+    geocoder = StubGeocoder({"paris": PARIS})
+    cache = GeocodeCache(second_tier=BrokenTier())
+    assert cache.get_or_fetch("paris", geocoder) == PARIS
+    assert cache.get_or_fetch("paris", geocoder) == PARIS
+    assert len(geocoder.calls) == 1
+    assert cache.stats()["second_tier_errors"] == 1
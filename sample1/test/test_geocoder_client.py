@@ -0,0 +1,179 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from sample1.geocoder_client import CircuitBreaker, CircuitOpenError, GeocoderClient, RateLimited
+
+PARIS = {"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]}
+
+
+class FakeGeocoder(ThreadingHTTPServer):
+    """Local stand-in for api-adresse answering from a script of (status, delay)."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeGeocoderHandler)
+        self.script = []
+        self.requests = 0
+        self.connections = set()
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_answer(self):
+        self.requests += 1
+        return self.script.pop(0) if self.script else (200, 0)
+
+
+class FakeGeocoderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        status, delay = self.server.next_answer()
+        time.sleep(delay)
+        body = json.dumps(PARIS).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_geocoder():
+    server = FakeGeocoder()
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(url, outcomes, **kwargs):
+    return GeocoderClient(url, backoff=0.001, on_outcome=lambda endpoint, outcome: outcomes.append(outcome), **kwargs)
+
+
+def test_connections_are_kept_alive(fake_geocoder):
+    outcomes = []
+    client = make_client(fake_geocoder.url, outcomes)
+    for _ in range(5):
+        assert client.get("search", "/search/", params={"q": "paris"}).json() == PARIS
+    assert len(fake_geocoder.connections) == 1
+    assert outcomes == ["success"] * 5
+
+
+def test_server_errors_are_retried(fake_geocoder):
+    outcomes = []
+    client = make_client(fake_geocoder.url, outcomes, retries=2)
+    fake_geocoder.script = [(503, 0), (502, 0)]
+    assert client.get("search", "/search/").status_code == 200
+    assert outcomes == ["retry", "retry", "success"]
+
+    fake_geocoder.script = [(503, 0)] * 3
+    assert client.get("search", "/search/").status_code == 503
+    assert outcomes[-3:] == ["retry", "retry", "error"]
+    assert fake_geocoder.requests == 6
+
+
+def test_client_errors_are_not_retried(fake_geocoder):
+    outcomes = []
+    client = make_client(fake_geocoder.url, outcomes)
+    fake_geocoder.script = [(400, 0)]
+    assert client.get("search", "/search/").status_code == 400
+    assert fake_geocoder.requests == 1
+
+
+def test_circuit_opens_after_repeated_failures(fake_geocoder):
+    outcomes = []
+    client = make_client(fake_geocoder.url, outcomes, retries=0, breaker_threshold=2, breaker_reset=60)
+    fake_geocoder.script = [(500, 0)] * 2
+    client.get("search", "/search/")
+    client.get("search", "/search/")
+    with pytest.raises(CircuitOpenError):
+        client.get("search", "/search/")
+    assert fake_geocoder.requests == 2
+    assert outcomes == ["error", "error", "circuit_open"]
+
+
+def test_timeouts_are_retried(fake_geocoder):
+    outcomes = []
+    client = make_client(fake_geocoder.url, outcomes, timeout=0.1, retries=1)
+    fake_geocoder.script = [(200, 0.5)] * 2
+    with pytest.raises(requests.Timeout):
+        client.get("search", "/search/")
+    assert outcomes == ["retry", "error"]
+
+
+def test_slow_calls_are_hedged(fake_geocoder):
+    outcomes = []
+    client = make_client(fake_geocoder.url, outcomes, hedge=True)
+    for _ in range(20):
+        client.get("search", "/search/")
+    assert client.hedge_delay() < 0.1
+
+    fake_geocoder.script = [(200, 1)]
+    start = time.perf_counter()
+    assert client.get("search", "/search/").json() == PARIS
+    assert time.perf_counter() - start < 0.5
+    assert outcomes[-3:] == ["hedge", "hedge_won", "success"]
+
+
+class QuotaLimiter:
+    """Lets `calls` calls through, then refuses the others."""
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def acquire(self, endpoint, max_wait=None):
+        if self.calls == 0:
+            raise RateLimited("quota exhausted")
+        self.calls -= 1
+
+
+def test_rate_limited_calls_are_not_retried(fake_geocoder):
+    outcomes = []
+    client = make_client(fake_geocoder.url, outcomes, retries=2, limiter=QuotaLimiter(1))
+    client.get("search", "/search/")
+    with pytest.raises(RateLimited):
+        client.get("search", "/search/")
+    assert fake_geocoder.requests == 1
+    assert outcomes == ["success", "rate_limited"]
+    assert client.breaker.state == "closed"
+
+
+def test_probe_refused_by_the_limiter_does_not_hold_the_breaker(fake_geocoder):
+    outcomes = []
+    limiter = QuotaLimiter(1)
+    client = make_client(fake_geocoder.url, outcomes, retries=0, breaker_threshold=1, breaker_reset=0.05, limiter=limiter)
+    fake_geocoder.script = [(500, 0)]
+    client.get("search", "/search/")
+    time.sleep(0.06)
+    with pytest.raises(RateLimited):
+        client.get("search", "/search/")
+    assert client.breaker.state == "half_open"
+
+    limiter.calls = 1
+    assert client.get("search", "/search/").status_code == 200
+    assert client.breaker.state == "closed"
+    assert outcomes == ["error", "rate_limited", "success"]
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    now = [0.0]
+    breaker = CircuitBreaker(threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    now[0] = 10.0
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
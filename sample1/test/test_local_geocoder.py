@@ -0,0 +1,112 @@
+import csv
+import gzip
+import os
+import pytest
+import requests_mock
+import sample1.utility as utility
+from sample1.local_geocoder import LocalGeocoder, build_index, parse_query, read_ban
+
+COLUMNS = ["id", "numero", "rep", "nom_voie", "code_postal", "code_insee", "nom_commune", "lon", "lat"]
+
+# (street, postcode, city, lon, lat) of the synthetic BAN extract; every
+# street has the numbers 1 to 20, 9 also exists as "9 bis"
+STREETS = [
+    ("Rue de la Roquette", "75011", "Paris", 2.3700, 48.8550),
+    ("Boulevard Voltaire", "75011", "Paris", 2.3750, 48.8580),
+    ("Avenue des Champs-Élysées", "75008", "Paris", 2.3070, 48.8700),
+    ("Rue de la Paix", "75002", "Paris", 2.3310, 48.8690),
+    ("Rue de la Paix", "69001", "Lyon", 4.8350, 45.7640),
+]
+
+
+def write_extract(path, opener=open):
+    with opener(path, "wt", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(COLUMNS)
+        for street, postcode, city, lon, lat in STREETS:
+            for number in range(1, 21):
+                writer.writerow(["", number, "", street, postcode, "", city, lon + number * 1e-4, lat])
+            writer.writerow(["", 9, "bis", street, postcode, "", city, lon + 0.0095, lat])
+
+
+@pytest.fixture
+def geocoder(tmp_path):
+    extract = tmp_path / "adresses.csv"
+    write_extract(extract)
+    index = tmp_path / "geocoder.sqlite3"
+    assert build_index(read_ban(str(extract)), str(index)) == (5, 105)
+    return LocalGeocoder(str(index), min_confidence=0.7)
+
+
+def test_parse_query():
+    assert parse_query("42 bis, Rue de l'Église 75011 Paris") == (42, "bis", ["rue", "eglise", "75011", "paris"])
+    assert parse_query("9ter av. Foch") == (9, "ter", ["avenue", "foch"])
+    assert parse_query("Rue du 8 Mai 1945") == (None, "", ["rue", "8", "mai", "1945"])
+
+
+def test_exact_address(geocoder):
+    status, match = geocoder.lookup("12 rue de la Roquette 75011 Paris")
+    assert status == "found"
+    assert (match.lon, match.lat) == pytest.approx((2.3712, 48.8550))
+    assert match.confidence == 1.0
+    assert match.label == "12 Rue de la Roquette 75011 Paris"
+
+
+def test_abbreviations_accents_and_suffixes(geocoder):
+    status, match = geocoder.lookup("9 bis av des champs elysees")
+    assert status == "found"
+    assert match.lon == pytest.approx(2.3165)
+    status, match = geocoder.lookup("3 BD VOLTAIRE PARIS")
+    assert status == "found"
+    assert match.lon == pytest.approx(2.3753)
+
+
+def test_unknown_number_uses_street_position(geocoder):
+    status, match = geocoder.lookup("120 rue de la roquette 75011")
+    assert status == "found"
+    assert match.confidence == 0.8
+    # Mean position of the street's 21 numbers
+    assert match.lon == pytest.approx(2.3700 + (sum(range(1, 21)) * 1e-4 + 0.0095) / 21)
+
+
+def test_ambiguous_or_unknown_street_is_left_to_the_api(geocoder):
+    status, match = geocoder.lookup("5 rue de la paix")
+    assert status == "low_confidence"
+    assert match.confidence < 0.7
+    assert geocoder.lookup("5 rue de la paix 69001 lyon")[0] == "found"
+    assert geocoder.lookup("5 rue inconnue 75011 paris")[0] == "low_confidence"
+    assert geocoder.lookup("5 impasse inconnue") == ("not_found", None)
+    assert geocoder.lookup("") == ("not_found", None)
+
+
+def test_gzipped_extract(tmp_path):
+    extract = tmp_path / "adresses.csv.gz"
+    write_extract(extract, gzip.open)
+    assert build_index(read_ban(str(extract)), str(tmp_path / "geocoder.sqlite3")) == (5, 105)
+
+
+def test_local_answers_skip_the_api(geocoder, monkeypatch):
+    monkeypatch.setattr(utility, "local_geocoder", geocoder)
+    utility.geocode_cache.clear()
+    with requests_mock.Mocker() as mock:
+        assert utility.address_to_coordinates("4 rue de la roquette paris") == pytest.approx(
+            {"lon": 2.3704, "lat": 48.8550}
+        )
+        assert not mock.called
+        mock.get("https://api-adresse.data.gouv.fr/search/?q=4+rue+de+la+paix", json={
+            "features": [{"geometry": {"coordinates": [2.3314, 48.8690]}}]
+        })
+        assert utility.address_to_coordinates("4 rue de la paix") == {"lon": 2.3314, "lat": 48.8690}
+        assert mock.call_count == 1
+
+
+def test_removed_index_falls_back_to_the_api(geocoder, monkeypatch):
+    monkeypatch.setattr(utility, "local_geocoder", geocoder)
+    utility.geocode_cache.clear()
+    os.remove(geocoder.path)
+    with requests_mock.Mocker() as mock:
+        mock.get("https://api-adresse.data.gouv.fr/search/?q=4+rue+de+la+roquette+paris", json={
+            "features": [{"geometry": {"coordinates": [2.3704, 48.8550]}}]
+        })
+        assert utility.address_to_coordinates("4 rue de la roquette paris") == {"lon": 2.3704, "lat": 48.8550}
+        assert mock.call_count == 1
@@ -0,0 +1,64 @@
+import pytest
+from prometheus_client import REGISTRY
+from sample1.app import create_app
+
+PARIS = {"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]}
+
+
+@pytest.fixture
+def client():
+    app = create_app("app_config.TestingConfig")
+    with app.test_client() as client:
+        yield client
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    assert b"coverage_stage_duration_seconds" in response.data
+
+
+def test_lookup_stages_are_measured(client, requests_mock):
+    requests_mock.get("https://api-adresse.data.gouv.fr/search/?q=1+rue+des+metriques", json=PARIS)
+    stages = ("geocode", "transform", "lookup", "serialize")
+    before = {s: sample("coverage_stage_duration_seconds_count", stage=s) for s in stages}
+    geocoder_before = sample("coverage_geocoder_request_duration_seconds_count", endpoint="search", status="200")
+    misses_before = sample("coverage_cache_events_total", cache="geocode", event="misses")
+    hits_before = sample("coverage_cache_events_total", cache="geocode", event="hits")
+    rows_before = sample("coverage_db_query_rows_count", query="radius")
+
+    assert client.get("/api/?q=1+rue+des+metriques").status_code == 200
+    assert client.get("/api/?q=1+rue+des+metriques").status_code == 200
+
+    for s in stages:
+        assert sample("coverage_stage_duration_seconds_count", stage=s) == before[s] + 2
+    # The second request is answered by the geocode cache
+    assert sample("coverage_geocoder_request_duration_seconds_count", endpoint="search", status="200") == geocoder_before + 1
+    assert sample("coverage_cache_events_total", cache="geocode", event="misses") == misses_before + 1
+    assert sample("coverage_cache_events_total", cache="geocode", event="hits") == hits_before + 1
+    assert sample("coverage_db_query_rows_count", query="radius") >= rows_before + 1
+    assert sample("coverage_db_query_rows_sum", query="radius") > 0
+    assert sample("coverage_db_connection_wait_seconds_count") > 0
+
+
+def test_db_pool_saturation_is_exported(client, requests_mock):
+    requests_mock.get("https://api-adresse.data.gouv.fr/search/?q=3+rue+des+metriques", json=PARIS)
+    assert client.get("/api/?q=3+rue+des+metriques").status_code == 200
+    body = client.get("/metrics").data
+    assert sample("coverage_db_pool_connections", state="in_use") == 0
+    assert sample("coverage_db_pool_connections", state="open") >= 1
+    assert sample("coverage_db_pool_max_connections") == client.application.config["DB_POOL_MAX"]
+    assert b"coverage_db_pool_saturation" in body
+    assert b"coverage_db_pool_checkout_timeouts" in body
+
+
+def test_geocoder_errors_are_measured(client, requests_mock):
+    requests_mock.get("https://api-adresse.data.gouv.fr/search/?q=2+rue+des+metriques", status_code=503)
+    before = sample("coverage_geocoder_request_duration_seconds_count", endpoint="search", status="503")
+    assert client.get("/api/?q=2+rue+des+metriques").status_code == 404
+    assert sample("coverage_geocoder_request_duration_seconds_count", endpoint="search", status="503") == before + 1
@@ -0,0 +1,33 @@
+import pandas as pd
+from sample1.partition_and_load import check_table_and_partitions, split_tiles
+from sample1.utility import get_db_connection
+
+
+def test_split_tiles_matches_ranges():
+    df = pd.DataFrame({"x": [0, 999, 1000, 2500, -1, 1500], "y": [0, 999, 0, 1000, 5, -3]})
+    frames = split_tiles(df, 1000)
+    assert set(frames) == {"network_data_0_0", "network_data_1_0", "network_data_2_1", "network_data_default"}
+    assert frames["network_data_0_0"][0] == (0, 0)
+    assert frames["network_data_0_0"][1]["x"].tolist() == [0, 999]
+    assert frames["network_data_1_0"][1]["x"].tolist() == [1000]
+    assert frames["network_data_2_1"][1]["x"].tolist() == [2500]
+    assert frames["network_data_default"][0] is None
+    assert frames["network_data_default"][1]["x"].tolist() == [-1, 1500]
+
+
+def test_loaded_partitions_are_attached_and_indexed():
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        assert check_table_and_partitions(cursor)
+        cursor.execute("SELECT name FROM network_data_tiles;")
+        tiles = {row[0] for row in cursor.fetchall()}
+        assert tiles
+        cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename LIKE 'network_data_%';")
+        indexes = {row[0] for row in cursor.fetchall()}
+        assert {f"idx_x_y_{name.removeprefix('network_data_')}" for name in tiles} <= indexes
+        assert {f"idx_location_{name.removeprefix('network_data_')}" for name in tiles} <= indexes
+        for column in ("g2", "g3", "g4"):
+            assert {f"idx_{column}_{name.removeprefix('network_data_')}" for name in tiles} <= indexes
+    finally:
+        conn.close()
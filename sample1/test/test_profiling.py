@@ -0,0 +1,45 @@
+import pytest
+from sample1.app import create_app
+from sample1.profiling import profiling_requested
+
+PARIS = {"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]}
+
+
+@pytest.fixture
+def app():
+    app = create_app("app_config.TestingConfig")
+    app.config["PROFILE_ALLOWED_CLIENTS"] = "127.0.0.1, 10.0.0.0/8"
+    return app
+
+
+def test_profiling_requested():
+    allowed = "127.0.0.1, 10.0.0.0/8"
+    assert profiling_requested("1", None, "10.1.2.3", allowed)
+    assert profiling_requested(None, "true", "127.0.0.1", allowed)
+    assert not profiling_requested(None, None, "127.0.0.1", allowed)
+    assert not profiling_requested("1", None, "192.168.1.1", allowed)
+    assert not profiling_requested("1", None, "127.0.0.1", "")
+    assert not profiling_requested("1", None, "unknown", allowed)
+
+
+def test_profiled_request(app, requests_mock):
+    requests_mock.get("https://api-adresse.data.gouv.fr/search/?q=paris", json=PARIS)
+    response = app.test_client().get("/api/?q=paris", headers={"X-Coverage-Profile": "1"})
+    assert response.status_code == 200
+    assert "Orange" in response.json["response"]
+    profile = response.json["profile"]
+    assert set(profile["stages_ms"]) == {"geocode", "transform", "lookup", "serialize"}
+    assert any("get_network_coverage" in f["function"] for f in profile["functions"])
+    [query] = profile["queries"]
+    assert query["query"] == "radius"
+    assert query["relations"] and all(r.startswith("network_data") for r in query["relations"])
+    assert any("network_data" in line for line in query["plan"])
+
+
+def test_profiling_is_restricted_to_allowed_clients(app, requests_mock):
+    requests_mock.get("https://api-adresse.data.gouv.fr/search/?q=paris", json=PARIS)
+    app.config["PROFILE_ALLOWED_CLIENTS"] = "10.0.0.0/8"
+    response = app.test_client().get("/api/?q=paris&profile=1")
+    assert response.status_code == 200
+    assert "profile" not in response.json
+    assert "Orange" in response.json
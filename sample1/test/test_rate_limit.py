@@ -0,0 +1,118 @@
+import threading
+import time
+import pytest
+import requests_mock
+import sample1.utility as utility
+from sample1.rate_limit import LocalBucket, RateLimited, RateLimiter, RedisBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DownRedis:
+    """Redis client whose scripts fail like an unreachable server."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def register_script(self, script):
+        def run(keys, args):
+            self.calls += 1
+            raise ConnectionError("Redis unreachable")
+
+        return run
+
+
+def test_bursts_are_queued_then_spread_out():
+    clock = FakeClock()
+    waits = []
+    limiter = RateLimiter(LocalBucket(10, 2, clock=clock), clock=clock, on_wait=lambda endpoint, wait: waits.append(wait))
+    for _ in range(4):
+        limiter.reserve("search")
+    assert waits == pytest.approx([0, 0, 0.1, 0.2])
+
+    clock.now = 1
+    assert limiter.reserve("search") == 0
+
+
+def test_calls_waiting_too_long_are_refused():
+    clock = FakeClock()
+    limiter = RateLimiter(LocalBucket(10, 1, clock=clock), max_wait=0.15, clock=clock)
+    limiter.reserve("search")
+    limiter.reserve("search")
+    with pytest.raises(RateLimited) as refused:
+        limiter.reserve("search", max_wait=0.15)
+    assert refused.value.retry_after == pytest.approx(0.2)
+    # A refused call does not take a token
+    clock.now = 0.1
+    assert limiter.reserve("search") == pytest.approx(0.1)
+
+
+def test_queue_is_bounded():
+    depths = []
+    limiter = RateLimiter(LocalBucket(10, 1), max_queue=1, on_queue=depths.append)
+    with limiter.queued():
+        with pytest.raises(RateLimited):
+            limiter.acquire("search")
+    assert depths == [1, 0]
+
+
+def test_concurrent_callers_share_the_rate():
+    limiter = RateLimiter(LocalBucket(100, 5))
+    threads = [threading.Thread(target=limiter.acquire, args=("search",)) for _ in range(20)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 5 calls in the burst, then one every 10ms
+    assert time.perf_counter() - start >= 0.14
+    assert limiter.depth == 0
+
+
+def test_unreachable_redis_falls_back_to_the_process_bucket():
+    clock = FakeClock()
+    redis = DownRedis()
+    limiter = RateLimiter(
+        RedisBucket(None, 10, 1, client=redis), LocalBucket(10, 1, clock=clock), retry_after=30, clock=clock
+    )
+    assert limiter.reserve("search") == 0
+    assert limiter.reserve("search") == pytest.approx(0.1)
+    assert redis.calls == 1
+
+    clock.now = 30
+    limiter.reserve("search")
+    assert redis.calls == 2
+
+
+def test_fallback_defaults_to_the_share_of_one_worker():
+    limiter = utility.build_rate_limiter(backend="redis", rate=40, burst=40, workers=4, redis_url="redis://127.0.0.1:1/0")
+    assert limiter.fallback.interval == pytest.approx(0.1)
+    assert limiter.fallback.burst == 10
+    limiter = utility.build_rate_limiter(backend="redis", rate=40, fallback_rate=20, redis_url="redis://127.0.0.1:1/0")
+    assert limiter.fallback.interval == pytest.approx(0.05)
+
+
+def test_free_token_has_no_wait():
+    # (now + interval) - interval rounds above now at this clock reading
+    bucket = LocalBucket(0.001, 1, clock=lambda: 205.450578076638)
+    assert bucket.reserve(0) == (True, 0.0)
+
+
+def test_refused_calls_are_not_sent(monkeypatch):
+    limiter = utility.build_rate_limiter(rate=0.001, burst=1, max_wait=0)
+    monkeypatch.setattr(utility.geocoder, "limiter", limiter)
+    utility.geocode_cache.clear()
+    with requests_mock.Mocker() as mock:
+        mock.get("https://api-adresse.data.gouv.fr/search/", json={
+            "features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]
+        })
+        assert utility.address_to_coordinates("1 rue du quota") == {"lon": 2.3522, "lat": 48.8566}
+        with pytest.raises(utility.RateLimited):
+            utility.address_to_coordinates("2 rue du quota")
+        assert mock.call_count == 1
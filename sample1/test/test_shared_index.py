@@ -0,0 +1,132 @@
+import multiprocessing
+import os
+import time
+import numpy as np
+from sample1.app import create_app
+from sample1.app_config import TestingConfig
+from sample1.shared_index import SharedIndex, current_generation, ensure_published, publish
+from sample1.spatial_index import GridIndex
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data.csv")
+
+
+def small_index(g4):
+    return GridIndex(["20801", "20810"], [0, 5000], [0, 0], [1, 0], [1, 1], [g4, 1], cell_size=1000)
+
+
+def test_published_index_answers_like_the_built_one(tmp_path):
+    index = small_index(0)
+    publish(index, str(tmp_path))
+    shared = SharedIndex(str(tmp_path))
+    assert shared.query(0, 0, 5000) == index.query(0, 0, 5000)
+    assert len(shared) == 2
+    assert isinstance(shared.get().x.base, np.memmap)
+
+
+def test_new_generation_is_picked_up(tmp_path):
+    publish(small_index(0), str(tmp_path))
+    shared = SharedIndex(str(tmp_path))
+    old = shared.get()
+    first = shared.generation
+
+    publish(small_index(1), str(tmp_path))
+    assert shared.query(0, 0, 10) == [("20801", 0, 0, True, True, True)]
+    assert shared.generation == current_generation(str(tmp_path)) != first
+    assert [entry for entry in os.listdir(tmp_path) if entry.startswith("gen-")] == [shared.generation]
+    # The removed generation stays readable where it is still mapped
+    assert old.query(0, 0, 10) == [("20801", 0, 0, True, True, False)]
+
+
+def mapped_generations(directory):
+    with open("/proc/self/maps") as f:
+        return {line.split(directory, 1)[1].split(os.sep)[1] for line in f if directory in line}
+
+
+def test_replaced_generation_is_released_without_a_lookup(tmp_path):
+    directory = str(tmp_path)
+    publish(small_index(0), directory)
+    shared = SharedIndex(directory, refresh_interval=0.05)
+    try:
+        first = shared.generation
+        assert mapped_generations(directory) == {first}
+
+        publish(small_index(1), directory)
+        deadline = time.monotonic() + 5
+        while shared.generation == first and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert shared.generation == current_generation(directory)
+        assert mapped_generations(directory) == {shared.generation}
+    finally:
+        shared.close()
+
+
+def lookup_in_worker(directory, conn):
+    shared = SharedIndex(directory)
+    conn.send(shared.query(0, 0, 10))
+    conn.recv()
+    conn.send(shared.query(0, 0, 10))
+
+
+def test_worker_processes_attach_to_new_generations(tmp_path):
+    publish(small_index(0), str(tmp_path))
+    parent, child = multiprocessing.Pipe()
+    worker = multiprocessing.get_context("fork").Process(target=lookup_in_worker, args=(str(tmp_path), child))
+    worker.start()
+    assert parent.recv() == [("20801", 0, 0, True, True, False)]
+    publish(small_index(1), str(tmp_path))
+    parent.send("published")
+    assert parent.recv() == [("20801", 0, 0, True, True, True)]
+    worker.join(5)
+    assert worker.exitcode == 0
+
+
+def test_index_is_built_once(tmp_path):
+    builds = []
+
+    def build():
+        builds.append(1)
+        return small_index(0)
+
+    ensure_published(str(tmp_path), build)
+    ensure_published(str(tmp_path), build)
+    assert len(builds) == 1
+
+
+def test_shared_engine_api(tmp_path, requests_mock):
+    requests_mock.get(
+        "https://api-adresse.data.gouv.fr/search/?q=42+rue+papernest+75011+Paris",
+        json={"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]},
+    )
+
+    class SharedTestingConfig(TestingConfig):
+        COVERAGE_ENGINE = "shared"
+        COVERAGE_INDEX_SOURCE = "csv"
+        COVERAGE_DATA_PATH = DATA_PATH
+        COVERAGE_SHARED_DIR = str(tmp_path)
+
+    app = create_app(SharedTestingConfig)
+    assert app.extensions["coverage_index"].generation is not None
+    with app.test_client() as client:
+        response = client.get("/api/?q=42+rue+papernest+75011+Paris")
+    assert response.status_code == 200
+    assert "Orange" in response.json
+
+
+def test_unreadable_shared_index_falls_back_to_postgres(tmp_path, requests_mock):
+    requests_mock.get(
+        "https://api-adresse.data.gouv.fr/search/?q=42+rue+papernest+75011+Paris",
+        json={"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]},
+    )
+
+    class SharedTestingConfig(TestingConfig):
+        COVERAGE_ENGINE = "shared"
+        COVERAGE_INDEX_SOURCE = "csv"
+        COVERAGE_DATA_PATH = DATA_PATH
+        COVERAGE_SHARED_DIR = str(tmp_path)
+
+    app = create_app(SharedTestingConfig)
+    os.remove(os.path.join(tmp_path, "current"))
+    with app.test_client() as client:
+        response = client.get("/api/?q=42+rue+papernest+75011+Paris")
+    assert response.status_code == 200
+    assert "Orange" in response.json
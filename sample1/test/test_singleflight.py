@@ -0,0 +1,155 @@
+import threading
+import time
+import pytest
+import sample1.app as app_module
+from sample1.app import create_app, locate_lookup
+from sample1.geocache import GeocodeCache
+from sample1.singleflight import SingleFlight
+
+PARIS = {"lon": 2.3522, "lat": 48.8566}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def run_concurrently(n, target):
+    """
+    Start `n` threads calling `target()`; return (threads, results, errors).
+    """
+    results, errors = [], []
+
+    def worker():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    executions = []
+
+    def lookup():
+        executions.append(1)
+        release.wait(5)
+        return "coverage"
+
+    threads, results, errors = run_concurrently(8, lambda: flight.do("key", lookup))
+    wait_for(lambda: flight.stats()["calls"] == 8)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["coverage"] * 8 and not errors
+    assert len(executions) == 1
+    assert flight.stats() == {"calls": 8, "executions": 1, "coalesced": 7, "in_flight": 0}
+
+
+def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def lookup():
+        release.wait(5)
+        raise ValueError("geocoder down")
+
+    threads, results, errors = run_concurrently(4, lambda: flight.do("key", lookup))
+    wait_for(lambda: flight.stats()["calls"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert not results
+    assert [str(e) for e in errors] == ["geocoder down"] * 4
+
+
+def test_keys_are_forgotten_once_done():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("a", lambda: 2) == 2
+    assert flight.do("b", lambda: 3) == 3
+    with pytest.raises(KeyError):
+        flight.do("a", dict().__getitem__, "missing")
+    assert flight.stats() == {"calls": 4, "executions": 4, "coalesced": 0, "in_flight": 0}
+
+
+def test_geocode_cache_coalesces_concurrent_misses():
+    cache = GeocodeCache()
+    release = threading.Event()
+    calls = []
+
+    def geocoder(address):
+        calls.append(address)
+        release.wait(5)
+        return PARIS
+
+    addresses = iter(["42 rue papernest 75011 Paris", "42 Rue Papernest, 75011 PARIS"] * 3)
+    lock = threading.Lock()
+
+    def get():
+        with lock:
+            address = next(addresses)
+        return cache.get_or_fetch(address, geocoder)
+
+    threads, results, errors = run_concurrently(6, get)
+    wait_for(lambda: cache.flight.stats()["calls"] == 6)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [PARIS] * 6 and not errors
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 5
+    assert cache.get_or_fetch("42 rue papernest 75011 Paris", geocoder) == PARIS
+    assert len(calls) == 1
+
+
+def test_lookups_are_keyed_on_the_cell():
+    key, point = locate_lookup("radius", 652001.0, 6862012.0, 25)
+    assert locate_lookup("radius", 652024.0, 6862000.5, 25) == (key, point)
+    assert point == (652012.5, 6862012.5)
+    assert locate_lookup("radius", 652026.0, 6862012.0, 25)[0] != key
+    assert locate_lookup("nearest", 652001.0, 6862012.0, 25) == (("nearest", 652001.0, 6862012.0), (652001.0, 6862012.0))
+
+
+def test_nearby_addresses_share_one_lookup(monkeypatch):
+    app = create_app("app_config.TestingConfig")
+    points = {"1 rue papernest": (652001.0, 6862012.0), "3 rue papernest": (652024.0, 6862000.5)}
+    release = threading.Event()
+    lookups = []
+
+    def lookup(x, y, mode):
+        lookups.append((x, y))
+        release.wait(5)
+        return {"Orange": {"2G": True, "3G": True, "4G": False}}
+
+    monkeypatch.setattr(app_module, "address_to_coordinates", lambda address: {"lon": address, "lat": 0})
+    monkeypatch.setattr(app_module, "wgs84_to_lambert93", lambda lon, lat: points[lon])
+    monkeypatch.setattr(app_module, "lookup_coverage", lookup)
+    addresses = iter(points)
+    lock = threading.Lock()
+
+    def get():
+        with lock:
+            address = next(addresses)
+        return app.test_client().get("/api/", query_string={"q": address}).get_json()
+
+    threads, results, errors = run_concurrently(2, get)
+    wait_for(lambda: app.extensions["coverage_flight"].stats()["calls"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert results == [{"Orange": {"2G": True, "3G": True, "4G": False}}] * 2
+    assert lookups == [(652012.5, 6862012.5)]
@@ -0,0 +1,81 @@
+import os
+import threading
+import numpy as np
+import pytest
+from sample1.snapshot import Snapshot, build_snapshot, is_snapshot, load_columns, load_dataframe, read_csv, write_snapshot
+from sample1.spatial_index import GridIndex
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data.csv")
+
+
+@pytest.fixture(scope="module")
+def snapshot_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("snapshot") / "data.snapshot")
+    build_snapshot(DATA_PATH, path)
+    return path
+
+
+def test_snapshot_round_trip(snapshot_path):
+    df = read_csv(DATA_PATH)
+    snap = Snapshot(snapshot_path)
+    assert len(snap) == len(df)
+    assert isinstance(snap.x, np.memmap)
+    assert snap.x.dtype == np.int32 and snap.flags.dtype == np.uint8
+    assert np.array_equal(snap.operators, df["Operateur"].to_numpy())
+    assert np.array_equal(snap.x, df["x"].to_numpy())
+    assert np.array_equal(snap.y, df["y"].to_numpy())
+    assert np.array_equal(snap.g2, df["2G"].astype(bool).to_numpy())
+    assert np.array_equal(snap.g3, df["3G"].astype(bool).to_numpy())
+    assert np.array_equal(snap.g4, df["4G"].astype(bool).to_numpy())
+
+
+def test_snapshot_is_compact(snapshot_path):
+    # 4 + 4 bytes of coordinates, 1 operator byte and 1 flags byte per row
+    assert os.path.getsize(snapshot_path) < len(Snapshot(snapshot_path)) * 10 + 1024
+
+
+def test_is_snapshot(snapshot_path):
+    assert is_snapshot(snapshot_path)
+    assert not is_snapshot(DATA_PATH)
+
+
+def test_load_dataframe_from_snapshot(snapshot_path):
+    df = load_dataframe(snapshot_path)
+    assert list(df.columns) == ["Operateur", "x", "y", "2G", "3G", "4G"]
+    assert df.iloc[0].tolist() == ["20801", 102980, 6847973, True, True, False]
+
+
+def test_load_columns_keeps_coordinates_mapped(snapshot_path):
+    operators, x, y, g2, g3, g4 = load_columns(snapshot_path)
+    assert isinstance(x, np.memmap) and isinstance(y, np.memmap)
+    csv_columns = load_columns(DATA_PATH)
+    for column, expected in zip((operators, x, y, g2, g3, g4), csv_columns):
+        assert np.array_equal(column, expected.astype(column.dtype))
+
+
+def test_concurrent_writers_do_not_share_a_temporary_file(tmp_path):
+    path = str(tmp_path / "data.snapshot")
+    errors = []
+
+    def writer(g4):
+        try:
+            for _ in range(20):
+                write_snapshot(path, ["20801"] * 1000, range(1000), range(1000), [1] * 1000, [1] * 1000, [g4] * 1000)
+        except OSError as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(g4,)) for g4 in (0, 1, 0, 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(Snapshot(path)) == 1000
+    assert os.listdir(tmp_path) == ["data.snapshot"]
+
+
+def test_grid_index_from_snapshot(snapshot_path):
+    from_csv = GridIndex.from_csv(DATA_PATH)
+    from_snapshot = GridIndex.from_path(snapshot_path)
+    for x, y in [(652000.0, 6862000.0), (843000.5, 6519000.5), (102980.0, 6847973.0)]:
+        assert from_snapshot.query(x, y, 3000) == from_csv.query(x, y, 3000)
@@ -0,0 +1,102 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sample1.app import create_app, find_nearest_rows, query_postgres, query_postgres_nearest
+from sample1.app_config import TestingConfig
+from sample1.spatial_index import GridIndex
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "data.csv")
+
+
+class MemoryTestingConfig(TestingConfig):
+    COVERAGE_ENGINE = "memory"
+    COVERAGE_INDEX_SOURCE = "csv"
+    COVERAGE_DATA_PATH = DATA_PATH
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    return pd.read_csv(DATA_PATH, delimiter=";", dtype={"Operateur": str})
+
+
+@pytest.fixture(scope="module")
+def index(dataset):
+    return GridIndex.from_dataframe(dataset)
+
+
+def brute_force(df, x, y, radius):
+    distance = np.sqrt((df["x"] - x) ** 2 + (df["y"] - y) ** 2)
+    hits = df[distance <= radius].sort_values(["x", "y", "Operateur", "2G", "3G", "4G"])
+    return [
+        (op, int(hx), int(hy), bool(g2), bool(g3), bool(g4))
+        for op, hx, hy, g2, g3, g4 in hits[
+            ["Operateur", "x", "y", "2G", "3G", "4G"]
+        ].itertuples(index=False)
+    ]
+
+
+def sample_points(df, count=50, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = df.sample(count, random_state=seed)
+    jitter = rng.uniform(-2500, 2500, size=(count, 2))
+    return [
+        (float(px + jx), float(py + jy))
+        for (px, py), (jx, jy) in zip(picks[["x", "y"]].to_numpy(), jitter)
+    ]
+
+
+def test_grid_index_matches_brute_force(dataset, index):
+    for x, y in sample_points(dataset):
+        assert index.query(x, y, 3000) == brute_force(dataset, x, y, 3000)
+
+
+def test_grid_index_point_outside_dataset(index):
+    assert index.query(-500000, -500000, 3000) == []
+
+
+def test_grid_index_radius_larger_than_cell():
+    index = GridIndex(["20801", "20810"], [0, 5000], [0, 0], [1, 0], [1, 1], [0, 1], cell_size=1000)
+    assert index.query(0, 0, 5000) == [
+        ("20801", 0, 0, True, True, False),
+        ("20810", 5000, 0, False, True, True),
+    ]
+    assert index.query(0, 0, 4999.9) == [("20801", 0, 0, True, True, False)]
+
+
+def test_memory_engine_api(requests_mock):
+    requests_mock.get(
+        "https://api-adresse.data.gouv.fr/search/?q=42+rue+papernest+75011+Paris",
+        json={"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]},
+    )
+    app = create_app(MemoryTestingConfig)
+    assert app.extensions["coverage_index"] is not None
+    with app.test_client() as client:
+        response = client.get("/api/?q=42+rue+papernest+75011+Paris")
+    assert response.status_code == 200
+    assert "Orange" in response.json
+
+
+def test_engines_return_identical_rows(dataset, index):
+    app = create_app("app_config.TestingConfig")
+    with app.app_context():
+        for x, y in sample_points(dataset, count=20, seed=1):
+            assert query_postgres(x, y, 3000) == index.query(x, y, 3000)
+
+
+def test_nearest_mode_matches_between_engines(dataset, index):
+    app = create_app("app_config.TestingConfig")
+    memory_app = create_app(MemoryTestingConfig)
+    for x, y in sample_points(dataset, count=20, seed=2):
+        with app.app_context():
+            postgres_rows = query_postgres_nearest(x, y, 3000)
+        with memory_app.app_context():
+            memory_rows = find_nearest_rows(x, y, 3000)
+        assert [row[0] for row in postgres_rows] == [row[0] for row in memory_rows]
+        for postgres_row, memory_row in zip(postgres_rows, memory_rows):
+            assert postgres_row[-1] == pytest.approx(memory_row[-1])
+            assert postgres_row[-1] <= 3000
+        # The nearest row of each operator is also the closest one of the radius query
+        for operator, *_, distance in postgres_rows:
+            distances = [np.hypot(hx - x, hy - y) for op, hx, hy, *_ in index.query(x, y, 3000) if op == operator]
+            assert distance == pytest.approx(min(distances))
@@ -0,0 +1,53 @@
+import pytest
+from sample1.app import create_app, query_postgres, query_postgres_nearest, tile_router
+from sample1.spatial_index import GridIndex
+from sample1.tiles import TileRouter, tile_bounds, tile_name
+
+
+@pytest.fixture
+def router():
+    return TileRouter({tile_name(i, j): tile_bounds(i, j, 1000) for i in range(3) for j in range(3) if (i, j) != (2, 2)})
+
+
+def test_circle_inside_a_tile_reads_it_alone(router):
+    assert router.route(1500, 1500, 400) == ["network_data_1_1"]
+    assert router.bounds(1500, 1500, 400) == (1000, 1999, 1000, 1999)
+
+
+def test_circle_across_an_edge_reads_both_tiles(router):
+    assert router.route(1990, 1500, 50) == ["network_data_1_1", "network_data_2_1"]
+    assert router.bounds(1990, 1500, 50) == (1000, 2999, 1000, 1999)
+
+
+def test_tiles_past_a_corner_are_read_only_within_the_radius(router):
+    # The corner (1000, 1000) is 70.7 m away
+    assert router.route(950, 950, 60) == ["network_data_0_0", "network_data_0_1", "network_data_1_0"]
+    assert router.route(950, 950, 80) == [
+        "network_data_0_0", "network_data_0_1", "network_data_1_0", "network_data_1_1",
+    ]
+
+
+def test_circle_without_tiles_reads_nothing(router):
+    assert router.route(2500, 2500, 100) == []
+    assert router.bounds(2500, 2500, 100) is None
+    assert router.route(-5000, 0, 3000) == []
+
+
+def test_untiled_router_reads_the_parent():
+    assert TileRouter.untiled().route(-5000, 0, 3000) == ["network_data"]
+
+
+def test_postgres_answers_at_tile_edges():
+    app = create_app("app_config.TestingConfig")
+    size = app.config["COVERAGE_TILE_SIZE"]
+    with app.app_context():
+        with app.extensions["db_pool"].connection() as conn:
+            index = GridIndex.from_db(conn)
+        # Measurements less than 1 km from the left edge of their tile
+        edges = [(float(x), float(y)) for x, y in zip(index.x, index.y) if 0 < x % size < 1000][::50]
+        assert edges
+        for x, y in edges:
+            assert len(tile_router().route(x, y, 3000)) > 1
+            rows = index.query(x, y, 3000)
+            assert query_postgres(x, y, 3000) == rows
+            assert sorted(row[0] for row in query_postgres_nearest(x, y, 3000)) == sorted({row[0] for row in rows})
@@ -0,0 +1,73 @@
+import math
+import threading
+import numpy as np
+import pytest
+from sample1.transform import (
+    LAMBERT93,
+    WGS84,
+    get_transformer,
+    lambert93_to_wgs84,
+    lambert93_to_wgs84_arrays,
+    parse_points,
+    wgs84_to_lambert93,
+    wgs84_to_lambert93_arrays,
+)
+
+
+def test_paris_to_lambert93():
+    x, y = wgs84_to_lambert93(2.3522, 48.8566)
+    assert x == pytest.approx(652469, abs=1)
+    assert y == pytest.approx(6862035, abs=1)
+
+
+def test_arrays_match_scalar_calls():
+    rng = np.random.default_rng(0)
+    lons = rng.uniform(-4.5, 8.0, 100)
+    lats = rng.uniform(42.5, 51.0, 100)
+    xs, ys = wgs84_to_lambert93_arrays(lons, lats)
+    assert xs.dtype == np.float64 and xs.shape == (100,)
+    for lon, lat, x, y in zip(lons, lats, xs, ys):
+        assert wgs84_to_lambert93(lon, lat) == (x, y)
+
+
+def test_round_trip():
+    xs = np.array([102980.0, 652469.0, 1240585.0])
+    ys = np.array([6847973.0, 6862035.0, 6050021.0])
+    lons, lats = lambert93_to_wgs84_arrays(xs, ys)
+    assert np.allclose(wgs84_to_lambert93_arrays(lons, lats), (xs, ys), atol=1e-3)
+    assert lambert93_to_wgs84(652469.0, 6862035.0) == pytest.approx((2.3522, 48.8566), abs=1e-5)
+
+
+def test_transformers_are_thread_local():
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(get_transformer(WGS84, LAMBERT93)))
+    thread.start()
+    thread.join()
+    assert get_transformer(WGS84, LAMBERT93) is get_transformer(WGS84, LAMBERT93)
+    assert seen[0] is not get_transformer(WGS84, LAMBERT93)
+
+
+def test_parse_points_shapes_and_errors():
+    lons, lats, ids, errors = parse_points([[2.35, 48.85], {"lon": 4.83, "lat": 45.76}, [200, 0], ["a", 1], 3])
+    assert lons[:2] == [2.35, 4.83] and lats[:2] == [48.85, 45.76]
+    assert errors == [
+        None,
+        None,
+        "Coordinates out of WGS84 range.",
+        "Coordinates must be numbers.",
+        "Expected a [lon, lat] point.",
+    ]
+    assert math.isnan(lons[2])
+
+    collection = {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "id": "a", "geometry": {"type": "Point", "coordinates": [2.35, 48.85]}},
+            {"type": "Feature", "id": "b", "geometry": {"type": "LineString", "coordinates": [[0, 0], [1, 1]]}},
+        ],
+    }
+    lons, lats, ids, errors = parse_points(collection)
+    assert ids == ["a", "b"]
+    assert errors == [None, "Expected a [lon, lat] point."]
+    with pytest.raises(ValueError):
+        parse_points({"points": []})
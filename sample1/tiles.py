@@ -0,0 +1,97 @@
+"""
+Square tiles partitioning `network_data` in both dimensions, and the router
+picking the tiles a search circle overlaps.
+
+The plane is cut into `size`-meter squares with edges at multiples of
+`size`: tile (i, j) holds the rows with i*size <= x < (i+1)*size and
+j*size <= y < (j+1)*size, in the table network_data_{i}_{j}. Only tiles
+holding rows exist. In Postgres, network_data is range-partitioned on x
+into one strip per column of tiles (network_data_x{i}), each of them
+range-partitioned on y into its tiles. Rows with negative coordinates, which
+Lambert-93 never produces for France, land in network_data_default and are
+never looked up.
+
+`partition_and_load.py` records the tiles in the CATALOG table. TileRouter
+reads it and returns every tile within `radius` of the point, measured to the
+closest point of each tile, so rows near a tile edge are read from the
+neighbouring tile and no other tile is touched.
+"""
+import numpy as np
+
+PARENT = "network_data"
+CATALOG = "network_data_tiles"
+DEFAULT_PARTITION = "network_data_default"
+# Bounds of an untiled table, as x_min, x_max, y_min, y_max
+WHOLE_PLANE = (-2**31, 2**31 - 1, -2**31, 2**31 - 1)
+
+
+def tile_name(i, j):
+    return f"{PARENT}_{i}_{j}"
+
+
+def strip_name(i):
+    return f"{PARENT}_x{i}"
+
+
+def tile_bounds(i, j, size):
+    """
+    (x_min, x_max, y_min, y_max) of tile (i, j), the maxima being excluded.
+    """
+    return i * size, (i + 1) * size, j * size, (j + 1) * size
+
+
+class TileRouter:
+    """
+    Tiles overlapping a search circle, from {table name: (x_min, x_max,
+    y_min, y_max)} with the maxima excluded.
+    """
+
+    def __init__(self, tiles):
+        self.names = list(tiles)
+        bounds = np.array(list(tiles.values()), dtype=np.float64).reshape(-1, 4)
+        self.x_min, self.x_max, self.y_min, self.y_max = bounds.T
+
+    @classmethod
+    def load(cls, cursor):
+        """
+        Read the tiles recorded by the loader. Raises
+        psycopg2.errors.UndefinedTable when the table predates them.
+        """
+        cursor.execute(f"SELECT name, x_min, x_max, y_min, y_max FROM {CATALOG} ORDER BY x_min, y_min;")
+        return cls({name: bounds for name, *bounds in cursor.fetchall()})
+
+    @classmethod
+    def untiled(cls):
+        """
+        Router sending every query to the parent table as a whole.
+        """
+        return cls({PARENT: WHOLE_PLANE})
+
+    def __len__(self):
+        return len(self.names)
+
+    def _overlapping(self, x, y, radius):
+        dx = np.maximum(np.maximum(self.x_min - x, x - self.x_max), 0)
+        dy = np.maximum(np.maximum(self.y_min - y, y - self.y_max), 0)
+        return np.flatnonzero(dx * dx + dy * dy <= radius * radius)
+
+    def route(self, x, y, radius):
+        """
+        Names of the tiles holding rows within `radius` meters of (x, y).
+        """
+        return [self.names[k] for k in self._overlapping(x, y, radius)]
+
+    def bounds(self, x, y, radius):
+        """
+        Smallest (x_min, x_max, y_min, y_max), maxima included, covering the
+        tiles of `route`, or None when no tile is in range.
+        """
+        overlapping = self._overlapping(x, y, radius)
+        if not len(overlapping):
+            return None
+        return (
+            int(self.x_min[overlapping].min()),
+            int(self.x_max[overlapping].max()) - 1,
+            int(self.y_min[overlapping].min()),
+            int(self.y_max[overlapping].max()) - 1,
+        )
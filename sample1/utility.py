@@ -1,20 +1,66 @@
+import csv
+import io
 import requests
 import psycopg2
 import logging
-from math import sqrt
+import sqlite3
+from math import ceil, floor, sqrt
 from flask import Flask
-from pyproj import Transformer
 from dotenv import load_dotenv
 from app_config import Config
+from geocache import build_geocode_cache, canonicalize_address
+from geocoder_client import GeocoderClient
+from local_geocoder import build_local_geocoder
+from metrics import cache_event, geocoder_call, geocoder_outcome, rate_limit_queue, rate_limit_wait
+from rate_limit import RateLimited, build_rate_limiter
+# Re-exported for existing callers, the transforms live in transform.py
+from transform import wgs84_to_lambert93, wgs84_to_lambert93_arrays  # noqa: F401
 
 load_dotenv()
 
 
 app = Flask(__name__)
 
-wgs84_to_lambert93_transformer = Transformer.from_crs(
-    "EPSG:4326", "EPSG:2154", always_xy=True
+geocode_cache = build_geocode_cache(
+    backend=Config.GEOCODE_CACHE_BACKEND,
+    max_size=Config.GEOCODE_CACHE_SIZE,
+    ttl=Config.GEOCODE_CACHE_TTL,
+    negative_ttl=Config.GEOCODE_CACHE_NEGATIVE_TTL,
+    sqlite_path=Config.GEOCODE_CACHE_SQLITE_PATH,
+    redis_url=Config.GEOCODE_CACHE_REDIS_URL,
 )
+geocode_cache.on_event = cache_event("geocode")
+
+# Shared by every worker so that scaling out does not exceed the API's rate limit
+rate_limiter = build_rate_limiter(
+    backend=Config.GEOCODER_RATE_LIMIT_BACKEND,
+    rate=Config.GEOCODER_RATE_LIMIT,
+    burst=Config.GEOCODER_RATE_BURST,
+    fallback_rate=Config.GEOCODER_RATE_LIMIT_FALLBACK,
+    workers=Config.GEOCODER_RATE_LIMIT_WORKERS,
+    max_wait=Config.GEOCODER_RATE_LIMIT_MAX_WAIT,
+    max_queue=Config.GEOCODER_RATE_LIMIT_MAX_QUEUE,
+    redis_url=Config.GEOCODER_RATE_LIMIT_REDIS_URL,
+)
+if rate_limiter is not None:
+    rate_limiter.on_wait = rate_limit_wait
+    rate_limiter.on_queue = rate_limit_queue
+
+geocoder = GeocoderClient(
+    Config.GEOCODER_URL,
+    timeout=Config.GEOCODER_TIMEOUT,
+    pool_size=Config.GEOCODER_POOL_SIZE,
+    retries=Config.GEOCODER_RETRIES,
+    backoff=Config.GEOCODER_RETRY_BACKOFF,
+    breaker_threshold=Config.GEOCODER_BREAKER_THRESHOLD,
+    breaker_reset=Config.GEOCODER_BREAKER_RESET,
+    hedge=Config.GEOCODER_HEDGE,
+    limiter=rate_limiter,
+    on_outcome=geocoder_outcome,
+)
+
+# Offline BAN index answering confident lookups without the API (see local_geocoder.py)
+local_geocoder = build_local_geocoder(Config.LOCAL_GEOCODER_PATH, Config.LOCAL_GEOCODER_MIN_CONFIDENCE)
 
 
 def get_db_connection():
@@ -35,37 +81,156 @@ def get_db_connection():
         raise
 
 
-def wgs84_to_lambert93(lon, lat):
+def distance_lambert93(x1, y1, x2, y2):
     """
-    Convert WGS84 (EPSG:4326) to Lambert-93 (EPSG:2154).
-    Returns (x, y).
+    Calculate the Euclidean distance in Lambert-93.
     """
-    x, y = wgs84_to_lambert93_transformer.transform(lon, lat)
-    return x, y
+    return sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
 
 
-def distance_lambert93(x1, y1, x2, y2):
+def search_bounds(x, y, radius):
     """
-    Calculate the Euclidean distance in Lambert-93.
+    Integer bounding box (x_min, x_max, y_min, y_max) of a search circle,
+    used to prefilter rows with the (x, y) indexes.
     """
-    return sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
+    return (
+        int(floor(x - radius)),
+        int(ceil(x + radius)),
+        int(floor(y - radius)),
+        int(ceil(y + radius)),
+    )
+
+
+def fetch_coordinates(address):
+    """
+    Query the French government's geocoding API.
+    Returns None when the address has no match and raises
+    requests.RequestException on transport or HTTP errors.
+    """
+    with geocoder_call("search") as call:
+        response = geocoder.get("search", "/search/", params={"q": address})
+        call["status"] = response.status_code
+    response.raise_for_status()
+    data = response.json()
+    if data["features"]:
+        coordinates = data["features"][0]["geometry"]["coordinates"]
+        return {"lon": coordinates[0], "lat": coordinates[1]}
+    return None
+
+
+def local_coordinates(address):
+    """
+    Coordinates of `address` from the local geocoder, or None when it is not
+    configured, not confident enough or unreadable, e.g. while it is rebuilt.
+    """
+    if local_geocoder is None:
+        return None
+    try:
+        with geocoder_call("local") as call:
+            call["status"], match = local_geocoder.lookup(address)
+    except (OSError, sqlite3.Error) as e:
+        logging.error(f"Local geocoder unavailable, using the API: {e}")
+        return None
+    if call["status"] != "found":
+        return None
+    return {"lon": match.lon, "lat": match.lat}
+
+
+def geocode(address):
+    """
+    Geocode with the local index, falling back to the API when it is not confident.
+    """
+    coordinates = local_coordinates(address)
+    if coordinates is not None:
+        return coordinates
+    return fetch_coordinates(address)
 
 
 def address_to_coordinates(address):
     """
-    Fetch coordinates from an address using the French government's geocoding API.
+    Fetch coordinates from an address with the local geocoder or the French
+    government's geocoding API. Results, including "no features" answers,
+    are served from `geocode_cache`. Raises RateLimited when the API call
+    would wait too long for its turn.
     """
-    url = f"https://api-adresse.data.gouv.fr/search/?q={address}"
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        if data["features"]:
-            coordinates = data["features"][0]["geometry"]["coordinates"]
-            return {"lon": coordinates[0], "lat": coordinates[1]}
-        else:
+        coordinates = geocode_cache.get_or_fetch(address, geocode)
+        if coordinates is None:
             logging.warning(f"No features found for address: {address}")
+        return coordinates
+    except RateLimited:
+        raise
     except requests.RequestException as e:
         logging.error(f"Error fetching coordinates for address '{address}': {e}")
     return None
 
+
+def fetch_coordinates_batch(addresses, chunk_size=5000):
+    """
+    Geocode many addresses with the API's CSV batch mode (/search/csv/),
+    `chunk_size` per request. Yields the answers of each chunk once it
+    completes, one {"lon", "lat"} dict or None per address, in input order.
+    Raises requests.RequestException when a chunk fails; the chunks yielded
+    before it stay valid.
+    """
+    for start in range(0, len(addresses), chunk_size):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["id", "q"])
+        for offset, address in enumerate(addresses[start:start + chunk_size]):
+            writer.writerow([offset, address])
+
+        with geocoder_call("csv") as call:
+            response = geocoder.post(
+                "csv",
+                "/search/csv/",
+                files={"data": ("addresses.csv", buffer.getvalue().encode("utf-8"), "text/csv")},
+                data={"columns": "q", "result_columns": ["latitude", "longitude"]},
+                timeout=60,
+            )
+            call["status"] = response.status_code
+        response.raise_for_status()
+        results = [None] * len(addresses[start:start + chunk_size])
+        for row in csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))):
+            if row.get("latitude") and row.get("longitude"):
+                results[int(row["id"])] = {
+                    "lon": float(row["longitude"]),
+                    "lat": float(row["latitude"]),
+                }
+        yield results
+
+
+def batch_address_to_coordinates(addresses, chunk_size=5000):
+    """
+    Geocode a list of addresses, sending only the cache misses the local
+    geocoder cannot answer upstream in bulk, once per canonical address.
+    The answers of each chunk are cached as it completes, so a failing chunk
+    only loses its own addresses.
+    Returns one {"lon", "lat"} dict or None per address, in input order.
+    """
+    results = [None] * len(addresses)
+    misses = {}
+    for i, address in enumerate(addresses):
+        found, coordinates = geocode_cache.lookup(address)
+        if not found:
+            coordinates = local_coordinates(address)
+            found = coordinates is not None
+            if found:
+                geocode_cache.store(address, coordinates)
+        if found:
+            results[i] = coordinates
+        else:
+            misses.setdefault(canonicalize_address(address), (address, []))[1].append(i)
+
+    pending = list(misses.values())
+    done = 0
+    try:
+        for chunk in fetch_coordinates_batch([address for address, _ in pending], chunk_size):
+            for (address, indexes), coordinates in zip(pending[done:], chunk):
+                geocode_cache.store(address, coordinates)
+                for i in indexes:
+                    results[i] = coordinates
+            done += len(chunk)
+    except requests.RequestException as e:
+        logging.error(f"Batch geocoding of {len(pending) - done} of {len(pending)} addresses failed: {e}")
+    return results
@@ -0,0 +1,86 @@
+"""
+EXPLAIN ANALYZE the radius query of GET /api/ over sample points.
+
+The query is the one the view builds with the ORM
+(CoverageData.objects.near around the point). Points are drawn from the table itself, where users
+actually look. Run from the sample2 directory:
+    python benchmarks/explain_range_query.py --points 500 --show 652000 6862000
+"""
+import argparse
+import os
+import statistics
+import sys
+
+import django
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "network_coverage.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from coverage.models import CoverageData  # noqa: E402
+from coverage.models import RADIUS  # noqa: E402
+
+
+def radius_query(x, y):
+    """
+    SQL and parameters of the view's range query around (x, y).
+    """
+    return CoverageData.objects.near(x, y, RADIUS).query.sql_with_params()
+
+
+def scan_nodes(plan):
+    """
+    Node types of the plan's leaves, e.g. "Index Scan on coverage_coveragedata_p3".
+    """
+    children = plan.get("Plans", [])
+    if not children:
+        return [f"{plan['Node Type']} on {plan.get('Relation Name', '?')}"]
+    return [node for child in children for node in scan_nodes(child)]
+
+
+def explain(cursor, x, y):
+    sql, params = radius_query(x, y)
+    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+    result = cursor.fetchone()[0][0]
+    plan = result["Plan"]
+    buffers = plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0)
+    return result["Execution Time"], buffers, plan["Actual Rows"], scan_nodes(plan)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=500, help="Number of sample points.")
+    parser.add_argument("--show", type=float, nargs=2, metavar=("X", "Y"), help="Print the full plan at this point.")
+    args = parser.parse_args()
+
+    with connection.cursor() as cursor:
+        if args.show:
+            sql, params = radius_query(*args.show)
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+            print("\n".join(row[0] for row in cursor.fetchall()))
+            print()
+
+        cursor.execute(
+            f"SELECT x, y FROM {CoverageData._meta.db_table} TABLESAMPLE BERNOULLI (5) REPEATABLE (42) LIMIT %s",
+            [args.points],
+        )
+        points = cursor.fetchall()
+        explain(cursor, *points[0])  # warm the cache
+        times, buffers, rows, nodes = [], [], [], set()
+        for x, y in points:
+            time_ms, point_buffers, point_rows, point_nodes = explain(cursor, x, y)
+            times.append(time_ms)
+            buffers.append(point_buffers)
+            rows.append(point_rows)
+            nodes.update(node.split(" on ")[0] for node in point_nodes)
+
+    times.sort()
+    print(f"points: {len(points)}, rows per point: median {statistics.median(rows):.0f}")
+    print(f"execution: median {statistics.median(times):.2f} ms, p95 {times[int(len(times) * 0.95)]:.2f} ms")
+    print(f"buffers: median {statistics.median(buffers):.0f}, max {max(buffers)}")
+    print(f"scans: {', '.join(sorted(nodes))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Load test of GET /api/ against a geocoder stub with a fixed latency.
+
+1. Start the stub and point the app at it:
+       python benchmarks/load_test.py stub --latency 0.2 --port 8099
+       export GEOCODER_URL=http://127.0.0.1:8099 GEOCODE_CACHE_BACKEND=memory
+2. Start the app under WSGI or ASGI, e.g.:
+       gunicorn network_coverage.wsgi --workers 1 --threads 8 --bind 127.0.0.1:8000
+       uvicorn network_coverage.asgi:application --workers 1 --port 8000
+3. Fire the requests; every address is distinct (also across runs)
+   so the geocode cache never hits:
+       python benchmarks/load_test.py run --url http://127.0.0.1:8000/api/ --requests 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+import numpy as np
+
+# The geocoder stub is shared with the end-to-end benchmarks of both apps
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "benchmarks"))
+from geocoder_stub import GeocoderStub  # noqa: E402
+
+
+async def run(url, requests, concurrency, timeout):
+    """
+    Send `requests` lookups with at most `concurrency` in flight.
+    Returns (latencies of successful requests, error count, wall time).
+    """
+    latencies = []
+    errors = 0
+    queue = iter(range(requests))
+    run_id = time.time_ns()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+
+        async def worker():
+            nonlocal errors
+            for i in queue:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url, params={"q": f"{i} rue du test {run_id} 75011 Paris"})
+                    response.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    stub = commands.add_parser("stub", help="Serve the geocoder stub.")
+    stub.add_argument("--latency", type=float, default=0.2, help="Seconds before each answer.")
+    stub.add_argument("--port", type=int, default=8099)
+    load = commands.add_parser("run", help="Run the load test.")
+    load.add_argument("--url", default="http://127.0.0.1:8000/api/")
+    load.add_argument("--requests", type=int, default=2000)
+    load.add_argument("--concurrency", type=int, default=200)
+    load.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    if args.command == "stub":
+        import uvicorn
+
+        uvicorn.run(GeocoderStub(args.latency), port=args.port, log_level="warning", lifespan="off")
+        return
+
+    latencies, errors, elapsed = asyncio.run(run(args.url, args.requests, args.concurrency, args.timeout))
+    print(f"requests: {args.requests} ({errors} errors) at concurrency {args.concurrency}")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        print(f"latency: p50 {p50:.0f} ms, p95 {p95:.0f} ms, p99 {p99:.0f} ms, max {max(latencies) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
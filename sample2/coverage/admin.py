@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import DatasetRefresh
 
-# Register your models here.
+
+@admin.register(DatasetRefresh)
+class DatasetRefreshAdmin(admin.ModelAdmin):
+    list_display = ("started_at", "status", "source", "rows", "inserted", "updated", "deleted")
+    list_filter = ("status",)
+    readonly_fields = [field.name for field in DatasetRefresh._meta.fields]
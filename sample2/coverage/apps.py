@@ -15,6 +15,27 @@ class CoverageConfig(AppConfig):
         # Connect post_migrate signal to load_data method
         post_migrate.connect(self.load_data, sender=self)
 
+        # Keep the precomputed coverage grid in line with the table
+        from .refresh import dataset_refreshed
+        dataset_refreshed.connect(self.rebuild_grid)
+        # Cached /api/ answers are versioned by refresh, read the new version now
+        dataset_refreshed.connect(self.invalidate_responses)
+
+    def rebuild_grid(self, refresh, **kwargs):
+        from django.conf import settings
+
+        if settings.COVERAGE_ENGINE != 'grid':
+            return
+        try:
+            call_command('build_coverage_grid')
+        except Exception as e:
+            logger.error(f"Failed to rebuild the coverage grid after refresh {refresh.pk}: {e}")
+
+    def invalidate_responses(self, refresh, **kwargs):
+        from .response_cache import response_cache
+
+        response_cache.invalidate()
+
     def load_data(self, **kwargs):
         # Delay importing the model until the signal is triggered
         from .models import CoverageData
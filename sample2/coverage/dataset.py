@@ -0,0 +1,89 @@
+"""
+Helpers shared by the commands and tasks that load the coverage dataset.
+"""
+import csv
+import io
+from contextlib import contextmanager
+import numpy as np
+from .snapshot import Snapshot, is_snapshot
+
+REQUIRED_COLUMNS = {"Operateur", "x", "y", "2G", "3G", "4G"}
+
+
+class MissingColumnsError(ValueError):
+    """
+    Raised when a CSV file lacks some of the required columns.
+    """
+
+
+def csv_rows(reader):
+    """
+    Convert DictReader rows into (operator, x, y, g2, g3, g4) tuples.
+    """
+    for row in reader:
+        yield (
+            row["Operateur"],
+            int(float(row["x"])),
+            int(float(row["y"])),
+            bool(int(row["2G"])),
+            bool(int(row["3G"])),
+            bool(int(row["4G"])),
+        )
+
+
+@contextmanager
+def open_rows(file_path):
+    """
+    Open a CSV or snapshot file and yield an iterator of row tuples.
+    Raises MissingColumnsError when CSV columns are missing.
+    """
+    if is_snapshot(file_path):
+        yield Snapshot(file_path).iter_rows()
+        return
+    with open(file_path, "r", encoding="utf-8") as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=';')
+        missing = REQUIRED_COLUMNS - set(reader.fieldnames or [])
+        if missing:
+            raise MissingColumnsError(f"Missing expected column(s): {', '.join(sorted(missing))}")
+        yield csv_rows(reader)
+
+
+def table_columns():
+    """
+    Return the CoverageData table as (operators, x, y, g2, g3, g4) arrays.
+    """
+    from .models import CoverageData
+
+    rows = list(CoverageData.objects.values_list("operator", "x", "y", "g2", "g3", "g4").iterator(chunk_size=10000))
+    if not rows:
+        return tuple(np.array([], dtype=dtype) for dtype in (str, np.int32, np.int32, bool, bool, bool))
+    operators, x, y, g2, g3, g4 = zip(*rows)
+    return (
+        np.array(operators, dtype=str),
+        np.array(x, dtype=np.int32),
+        np.array(y, dtype=np.int32),
+        np.array(g2, dtype=bool),
+        np.array(g3, dtype=bool),
+        np.array(g4, dtype=bool),
+    )
+
+
+def copy_chunks(rows, chunk_size):
+    """
+    Yield in-memory CSV buffers holding at most `chunk_size` rows each, ready for COPY.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count == chunk_size:
+            buffer.seek(0)
+            yield buffer
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            count = 0
+    if count:
+        buffer.seek(0)
+        yield buffer
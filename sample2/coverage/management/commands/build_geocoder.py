@@ -0,0 +1,30 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from coverage.local_geocoder import build_index, read_ban
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the local geocoder index from a BAN CSV extract, e.g. "
+        "https://adresse.data.gouv.fr/data/ban/adresses/latest/csv/adresses-75.csv.gz"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", type=str, help="BAN CSV extract (adresses-XX.csv or .csv.gz).")
+        parser.add_argument("--output", type=str, help="Path of the index (default: LOCAL_GEOCODER_PATH).")
+
+    def handle(self, *args, **options):
+        output = options["output"] or settings.LOCAL_GEOCODER_PATH
+        if not output:
+            raise CommandError("Set --output or LOCAL_GEOCODER_PATH.")
+
+        start = time.perf_counter()
+        try:
+            streets, numbers = build_index(read_ban(options["source"]), output)
+        except OSError as e:
+            raise CommandError(f"Could not build the index: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {streets} streets and {numbers} numbers into {output} "
+            f"in {time.perf_counter() - start:.1f}s."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from coverage.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Convert the network coverage CSV into a compact memory-mapped snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", type=str, help="Path to the CSV file.")
+        parser.add_argument("snapshot_path", type=str, help="Path of the snapshot to write.")
+
+    def handle(self, *args, **options):
+        try:
+            rows = build_snapshot(options["csv_path"], options["snapshot_path"])
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {options['csv_path']}")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} rows to {options['snapshot_path']}."))
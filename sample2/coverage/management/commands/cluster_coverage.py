@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from coverage.models import CoverageData
+
+XY_INDEX = "coverage_xy_idx"
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite every partition of the coverage table in (x, y) order, so the rows of one "
+        "radius query sit on a few pages. Each partition is locked while it is rewritten: "
+        "run it in a quiet period, e.g. after many dataset refreshes."
+    )
+
+    def handle(self, *args, **options):
+        table = CoverageData._meta.db_table
+        with connection.cursor() as cursor:
+            # The partitions of the (x, y) index and the partitions they index
+            cursor.execute(
+                """
+                SELECT i.indrelid::regclass::text, i.indexrelid::regclass::text
+                FROM pg_inherits h
+                JOIN pg_index i ON i.indexrelid = h.inhrelid
+                WHERE h.inhparent = %s::regclass
+                ORDER BY 1
+                """,
+                [XY_INDEX],
+            )
+            for partition, index in cursor.fetchall():
+                start = time.perf_counter()
+                cursor.execute(f"CLUSTER {partition} USING {index}")
+                self.stdout.write(f"Clustered {partition} in {time.perf_counter() - start:.2f}s.")
+            cursor.execute(f"ANALYZE {table}")
+        self.stdout.write(self.style.SUCCESS(f"{table} clustered on (x, y)."))
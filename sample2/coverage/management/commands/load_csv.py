@@ -1,53 +1,108 @@
-import csv
 from django.core.management.base import BaseCommand, CommandError
+from coverage.dataset import MissingColumnsError, copy_chunks, open_rows
 from coverage.models import CoverageData
-from django.db import transaction
+from coverage.response_cache import response_cache
+from django.db import connection, transaction
+
+STAGING_TABLE = "coverage_staging"
 
 
 class Command(BaseCommand):
-    help = "Load network coverage data from a CSV file."
+    help = "Load network coverage data from a CSV file or a binary snapshot."
 
     def add_arguments(self, parser):
-        parser.add_argument("file_path", type=str, help="Path to the CSV file.")
+        parser.add_argument("file_path", type=str, help="Path to the CSV or snapshot file.")
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Stream the file through COPY into a staging table and dedupe in the database, "
+                 "keeping memory flat regardless of file and table size.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Rows per COPY chunk in --stream mode.",
+        )
+
+    def _build_records(self, rows):
+        """
+        Build model instances for the (operator, x, y, g2, g3, g4) rows not already stored.
+        """
+        records = []
+        existing = set(CoverageData.objects.values_list('operator', 'x', 'y'))  # Preload existing records
+
+        for operator, x, y, g2, g3, g4 in rows:
+            if (operator, x, y) in existing:
+                continue
+            records.append(CoverageData(operator=operator, x=x, y=y, g2=g2, g3=g3, g4=g4))
+        return records
+
+    def _stream_load(self, rows, chunk_size):
+        """
+        COPY the rows chunk by chunk into a temporary staging table, then insert
+        the ones not already stored with a single anti-join. Like the in-memory
+        mode, rows are only deduplicated against the data present before the load.
+        Returns the number of inserted rows.
+        """
+        table = CoverageData._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            # ON COMMIT DROP does not fire when nested in an outer transaction
+            cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+            cursor.execute(
+                f"""
+                CREATE TEMPORARY TABLE {STAGING_TABLE} (
+                    operator varchar(50), x integer, y integer, g2 boolean, g3 boolean, g4 boolean
+                ) ON COMMIT DROP
+                """
+            )
+            for buffer in copy_chunks(rows, chunk_size):
+                cursor.copy_expert(
+                    f"COPY {STAGING_TABLE} (operator, x, y, g2, g3, g4) FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+            cursor.execute(f"ANALYZE {STAGING_TABLE}")
+            cursor.execute(
+                f"""
+                INSERT INTO {table} (operator, x, y, g2, g3, g4)
+                SELECT s.operator, s.x, s.y, s.g2, s.g3, s.g4
+                FROM {STAGING_TABLE} s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {table} t
+                    WHERE t.operator = s.operator AND t.x = s.x AND t.y = s.y
+                )
+                """
+            )
+            inserted = cursor.rowcount
+            cursor.execute(f"DROP TABLE {STAGING_TABLE}")
+            return inserted
+
+    def _load(self, rows, options):
+        """
+        Store the rows with the selected mode and return how many were inserted.
+        """
+        if options["stream"]:
+            return self._stream_load(rows, options["chunk_size"])
+
+        records = self._build_records(rows)
+        # Use a transaction for bulk creation
+        with transaction.atomic():
+            CoverageData.objects.bulk_create(records, batch_size=1000)
+        return len(records)
 
     def handle(self, *args, **options):
         file_path = options["file_path"]
 
         try:
-            with open(file_path, "r", encoding="utf-8") as csvfile:
-                reader = csv.DictReader(csvfile, delimiter=';')
-                required_columns = {"Operateur", "x", "y", "2G", "3G", "4G"}
-
-                # Validate header columns
-                if not required_columns.issubset(reader.fieldnames):
-                    missing = required_columns - set(reader.fieldnames)
-                    self.stdout.write(self.style.ERROR(f"Missing expected column(s): {', '.join(missing)}"))
-                    return
-
-                records = []
-                existing = set(CoverageData.objects.values_list('operator', 'x', 'y'))  # Preload existing records
-
-                for row in reader:
-                    key = (row["Operateur"], int(float(row["x"])), int(float(row["y"])))
-                    if key in existing:
-                        continue
-
-                    records.append(
-                        CoverageData(
-                            operator=row["Operateur"],
-                            x=int(float(row["x"])),
-                            y=int(float(row["y"])),
-                            g2=bool(int(row["2G"])),
-                            g3=bool(int(row["3G"])),
-                            g4=bool(int(row["4G"])),
-                        )
-                    )
-
-                # Use a transaction for bulk creation
-                with transaction.atomic():
-                    CoverageData.objects.bulk_create(records, batch_size=1000)
-
-                self.stdout.write(self.style.SUCCESS(f"Successfully loaded {len(records)} new records."))
+            with open_rows(file_path) as rows:
+                loaded = self._load(rows, options)
+            if loaded:
+                # The rows don't go through the refresh pipeline, so no new
+                # dataset version tells cached answers they are stale
+                response_cache.clear()
+            self.stdout.write(self.style.SUCCESS(f"Successfully loaded {loaded} new records."))
+        except MissingColumnsError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
         except FileNotFoundError:
             raise CommandError(f"File not found: {file_path}")
         except Exception as e:
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from coverage.refresh import refresh_dataset
+
+
+class Command(BaseCommand):
+    help = "Apply the changes of the coverage dataset to the table, skipping unchanged files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "file_path", nargs="?", type=str, help="Path to the CSV or snapshot file (default: COVERAGE_DATA_PATH)."
+        )
+        parser.add_argument("--force", action="store_true", help="Refresh even if the file is unchanged.")
+
+    def handle(self, *args, **options):
+        file_path = options["file_path"] or settings.COVERAGE_DATA_PATH
+        try:
+            refresh = refresh_dataset(file_path, force=options["force"])
+        except FileNotFoundError:
+            raise CommandError(f"File not found: {file_path}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Refresh {refresh.status}: {refresh.rows} rows, {refresh.inserted} inserted, "
+            f"{refresh.updated} updated, {refresh.deleted} deleted ({refresh.timings['total']:.2f}s)."
+        ))
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Add a `location` point generated from (x, y) with a GiST index, used by
+    the nearest-measurement queries (`<->` ordering). Django has no point
+    field without GeoDjango, so the column is not mapped on the model.
+    """
+
+    dependencies = [
+        ('coverage', '0002_datasetrefresh'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "ALTER TABLE coverage_coveragedata "
+                "ADD COLUMN location point GENERATED ALWAYS AS (point(x, y)) STORED",
+                "CREATE INDEX coverage_coveragedata_location_gist "
+                "ON coverage_coveragedata USING gist (location)",
+            ],
+            reverse_sql=[
+                "DROP INDEX coverage_coveragedata_location_gist",
+                "ALTER TABLE coverage_coveragedata DROP COLUMN location",
+            ],
+        ),
+    ]
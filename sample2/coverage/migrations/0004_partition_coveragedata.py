@@ -0,0 +1,101 @@
+from django.db import migrations, models
+
+TABLE = "coverage_coveragedata"
+
+# 250 km strips of x over the Lambert-93 extent of metropolitan France; rows
+# outside (bogus coordinates) land in the default partition
+PARTITIONS = [
+    (f"{TABLE}_p{i + 1}", lower, lower + 250000)
+    for i, lower in enumerate(range(50000, 1300000, 250000))
+]
+
+COLUMNS = "id, operator, x, y, g2, g3, g4"
+
+FORWARD_SQL = [
+    f"CREATE SEQUENCE {TABLE}_new_id_seq",
+    f"""
+    CREATE TABLE {TABLE}_new (
+        id bigint NOT NULL DEFAULT nextval('{TABLE}_new_id_seq'),
+        operator varchar(50) NOT NULL,
+        x integer NOT NULL,
+        y integer NOT NULL,
+        g2 boolean NOT NULL,
+        g3 boolean NOT NULL,
+        g4 boolean NOT NULL,
+        location point GENERATED ALWAYS AS (point(x, y)) STORED,
+        PRIMARY KEY (id, x)
+    ) PARTITION BY RANGE (x)
+    """,
+    *(
+        f"CREATE TABLE {name} PARTITION OF {TABLE}_new FOR VALUES FROM ({lower}) TO ({upper})"
+        for name, lower, upper in PARTITIONS
+    ),
+    f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE}_new DEFAULT",
+    # Copying in (x, y) order clusters every partition on its (x, y) index
+    f"INSERT INTO {TABLE}_new ({COLUMNS}) SELECT {COLUMNS} FROM {TABLE} ORDER BY x, y",
+    f"SELECT setval('{TABLE}_new_id_seq', coalesce(max(id), 0) + 1, false) FROM {TABLE}_new",
+    f"DROP TABLE {TABLE}",
+    f"ALTER TABLE {TABLE}_new RENAME TO {TABLE}",
+    f"ALTER TABLE {TABLE} RENAME CONSTRAINT {TABLE}_new_pkey TO {TABLE}_pkey",
+    f"ALTER SEQUENCE {TABLE}_new_id_seq RENAME TO {TABLE}_id_seq",
+    f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id",
+    f"CREATE INDEX {TABLE}_location_gist ON {TABLE} USING gist (location)",
+    f"ANALYZE {TABLE}",
+]
+
+REVERSE_SQL = [
+    f"""
+    CREATE TABLE {TABLE}_old (
+        id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        operator varchar(50) NOT NULL,
+        x integer NOT NULL,
+        y integer NOT NULL,
+        g2 boolean NOT NULL,
+        g3 boolean NOT NULL,
+        g4 boolean NOT NULL,
+        location point GENERATED ALWAYS AS (point(x, y)) STORED
+    )
+    """,
+    f"INSERT INTO {TABLE}_old ({COLUMNS}) OVERRIDING SYSTEM VALUE SELECT {COLUMNS} FROM {TABLE} ORDER BY id",
+    f"SELECT setval(pg_get_serial_sequence('{TABLE}_old', 'id'), coalesce(max(id), 0) + 1, false) FROM {TABLE}_old",
+    f"DROP TABLE {TABLE}",
+    f"ALTER TABLE {TABLE}_old RENAME TO {TABLE}",
+    f"ALTER TABLE {TABLE} RENAME CONSTRAINT {TABLE}_old_pkey TO {TABLE}_pkey",
+    f"CREATE INDEX {TABLE}_location_gist ON {TABLE} USING gist (location)",
+]
+
+
+class Migration(migrations.Migration):
+    """
+    Range-partition the coverage table on x and index it on (x, y).
+
+    The radius query filters on x and y ranges: partition pruning keeps it in
+    one or two strips, the composite index finds the rows, and copying them in
+    (x, y) order puts the rows of one query on a few pages (run the
+    `cluster_coverage` command to restore that order after many refreshes).
+    PostgreSQL requires the partition key in the primary key, so the table's
+    key becomes (id, x); id stays unique through its sequence and Django keeps
+    using it alone.
+    """
+
+    dependencies = [
+        ('coverage', '0003_coveragedata_location'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=FORWARD_SQL, reverse_sql=REVERSE_SQL),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql=f"CREATE INDEX coverage_xy_idx ON {TABLE} (x, y)",
+                    reverse_sql="DROP INDEX coverage_xy_idx",
+                ),
+            ],
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='coveragedata',
+                    index=models.Index(fields=['x', 'y'], name='coverage_xy_idx'),
+                ),
+            ],
+        ),
+    ]
@@ -1,9 +1,80 @@
+import math
+from django.contrib.postgres.aggregates import BoolOr
 from django.db import models
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+# Search radius of /api/ in meters
+RADIUS = 3000
+
+
+class CoverageQuerySet(models.QuerySet):
+    def near(self, x, y, radius):
+        """
+        Coverage of each operator within `radius` meters of the Lambert-93
+        point (x, y), aggregated by the database: one (operator, g2, g3, g4)
+        tuple per operator, a technology being available when any row of
+        the circle has it. The square around the circle is filtered first,
+        so the (x, y) index and the x partitions narrow the scan.
+        """
+        x, y = float(x), float(y)
+        # In float8: Python floats are sent as numeric literals, much slower to compute with
+        dx = Cast("x", FloatField()) - x
+        dy = Cast("y", FloatField()) - y
+        return (
+            self.filter(
+                x__range=(math.floor(x - radius), math.ceil(x + radius)),
+                y__range=(math.floor(y - radius), math.ceil(y + radius)),
+            )
+            .alias(distance_sq=dx * dx + dy * dy)
+            .filter(distance_sq__lte=radius ** 2)
+            .values("operator")
+            .annotate(has_2g=BoolOr("g2"), has_3g=BoolOr("g3"), has_4g=BoolOr("g4"))
+            .order_by("operator")
+            .values_list("operator", "has_2g", "has_3g", "has_4g")
+        )
+
 
 class CoverageData(models.Model):
+    """
+    One coverage measurement. The table also has a `location` point column
+    generated from (x, y) and indexed with GiST (migration 0003), queried
+    with raw SQL by the nearest mode of the API. It is range-partitioned on
+    x (migration 0004), with (id, x) as its primary key in the database.
+    """
     operator = models.CharField(max_length=50)
     x = models.IntegerField()
     y = models.IntegerField()
     g2 = models.BooleanField()
     g3 = models.BooleanField()
     g4 = models.BooleanField()
+
+    objects = CoverageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(fields=["x", "y"], name="coverage_xy_idx")]
+
+
+class DatasetRefresh(models.Model):
+    """
+    One run of the dataset refresh pipeline, with its delta stats and timings.
+    """
+    SUCCEEDED = "succeeded"
+    SKIPPED = "skipped"
+    FAILED = "failed"
+    STATUS_CHOICES = [(SUCCEEDED, "Succeeded"), (SKIPPED, "Skipped"), (FAILED, "Failed")]
+
+    source = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    rows = models.IntegerField(default=0)
+    inserted = models.IntegerField(default=0)
+    updated = models.IntegerField(default=0)
+    deleted = models.IntegerField(default=0)
+    timings = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["-started_at"]
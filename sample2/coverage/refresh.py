@@ -0,0 +1,181 @@
+"""
+Incremental refresh of the coverage table from the source dataset.
+
+A refresh fingerprints the source file and stops there when the last
+successful refresh already loaded the same content. Otherwise the file is
+COPYed into a temporary shadow table, diffed against the live table and only
+the delta (inserted, updated and deleted rows) is applied, in the same
+transaction. Readers keep seeing the previous version of the table until the
+commit and then the new one: PostgreSQL's MVCC never shows them a half-loaded
+table and row changes don't block their SELECTs, whereas renaming a shadow
+table into place needs an ACCESS EXCLUSIVE lock that queues every reader.
+Every run is recorded as a DatasetRefresh row.
+"""
+import hashlib
+import logging
+import time
+from django.db import connection, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from .dataset import copy_chunks, open_rows
+from .models import CoverageData, DatasetRefresh
+
+logger = logging.getLogger(__name__)
+
+SHADOW_TABLE = "coverage_shadow"
+DELTA_TABLE = "coverage_delta"
+
+# Arbitrary key of the advisory lock serializing concurrent refreshes
+REFRESH_LOCK_ID = 0x636F76
+
+# Sent after a refresh changed the table, with the DatasetRefresh as `refresh`
+dataset_refreshed = Signal()
+
+
+def fingerprint_file(file_path, block_size=1 << 20):
+    """
+    SHA-256 of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_shadow(cursor, rows, chunk_size):
+    cursor.execute(f"DROP TABLE IF EXISTS {SHADOW_TABLE}")
+    cursor.execute(
+        f"""
+        CREATE TEMPORARY TABLE {SHADOW_TABLE} (
+            operator varchar(50), x integer, y integer, g2 boolean, g3 boolean, g4 boolean
+        ) ON COMMIT DROP
+        """
+    )
+    for buffer in copy_chunks(rows, chunk_size):
+        cursor.copy_expert(
+            f"COPY {SHADOW_TABLE} (operator, x, y, g2, g3, g4) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    cursor.execute(f"ANALYZE {SHADOW_TABLE}")
+    cursor.execute(f"SELECT count(*) FROM {SHADOW_TABLE}")
+    return cursor.fetchone()[0]
+
+
+def _compute_delta(cursor):
+    """
+    Diff the shadow table against the live one into the delta table.
+
+    The dataset has no unique key: (operator, x, y) repeats, sometimes with
+    the exact same flags. Rows are therefore numbered within each
+    (operator, x, y) group and matched on (operator, x, y, number), which
+    makes the diff exact for multisets. A matched pair with different flags
+    is an update, an unmatched shadow row an insert, an unmatched live row a
+    delete.
+    """
+    table = CoverageData._meta.db_table
+    cursor.execute(f"DROP TABLE IF EXISTS {DELTA_TABLE}")
+    cursor.execute(
+        f"""
+        CREATE TEMPORARY TABLE {DELTA_TABLE} ON COMMIT DROP AS
+        WITH live AS (
+            SELECT id, operator, x, y, g2, g3, g4,
+                   row_number() OVER (PARTITION BY operator, x, y ORDER BY g2, g3, g4, id) AS n
+            FROM {table}
+        ),
+        shadow AS (
+            SELECT operator, x, y, g2, g3, g4,
+                   row_number() OVER (PARTITION BY operator, x, y ORDER BY g2, g3, g4) AS n
+            FROM {SHADOW_TABLE}
+        )
+        SELECT live.id, s.operator, s.x, s.y, s.g2, s.g3, s.g4,
+               CASE WHEN live.id IS NULL THEN 'insert'
+                    WHEN s.operator IS NULL THEN 'delete'
+                    ELSE 'update' END AS action
+        FROM live
+        FULL JOIN shadow s
+            ON live.operator = s.operator AND live.x = s.x AND live.y = s.y AND live.n = s.n
+        WHERE live.id IS NULL
+           OR s.operator IS NULL
+           OR (live.g2, live.g3, live.g4) IS DISTINCT FROM (s.g2, s.g3, s.g4)
+        """
+    )
+    cursor.execute(f"SELECT action, count(*) FROM {DELTA_TABLE} GROUP BY action")
+    counts = dict(cursor.fetchall())
+    return counts.get("insert", 0), counts.get("update", 0), counts.get("delete", 0)
+
+
+def _apply_delta(cursor):
+    table = CoverageData._meta.db_table
+    cursor.execute(
+        f"DELETE FROM {table} t USING {DELTA_TABLE} d WHERE d.action = 'delete' AND t.id = d.id"
+    )
+    cursor.execute(
+        f"""
+        UPDATE {table} t SET g2 = d.g2, g3 = d.g3, g4 = d.g4
+        FROM {DELTA_TABLE} d
+        WHERE d.action = 'update' AND t.id = d.id
+        """
+    )
+    cursor.execute(
+        f"""
+        INSERT INTO {table} (operator, x, y, g2, g3, g4)
+        SELECT operator, x, y, g2, g3, g4 FROM {DELTA_TABLE} WHERE action = 'insert'
+        """
+    )
+    cursor.execute(f"DROP TABLE {DELTA_TABLE}")
+    cursor.execute(f"DROP TABLE {SHADOW_TABLE}")
+
+
+def refresh_dataset(file_path, force=False, chunk_size=10000):
+    """
+    Bring the coverage table in line with `file_path` (CSV or snapshot) and
+    return the DatasetRefresh recording the run. Unchanged files are skipped
+    unless `force` is set. Errors are recorded, then raised again.
+    """
+    timings = {}
+    started = time.perf_counter()
+    refresh = DatasetRefresh(source=str(file_path), fingerprint="")
+    try:
+        refresh.fingerprint = fingerprint_file(file_path)
+        timings["fingerprint"] = time.perf_counter() - started
+
+        latest = DatasetRefresh.objects.filter(status=DatasetRefresh.SUCCEEDED).first()
+        if not force and latest is not None and latest.fingerprint == refresh.fingerprint:
+            refresh.status = DatasetRefresh.SKIPPED
+            refresh.rows = latest.rows
+            logger.info(f"Dataset {file_path} unchanged since refresh {latest.pk}, skipping")
+            return refresh
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [REFRESH_LOCK_ID])
+
+            step = time.perf_counter()
+            with open_rows(file_path) as rows:
+                refresh.rows = _load_shadow(cursor, rows, chunk_size)
+            timings["load"] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            refresh.inserted, refresh.updated, refresh.deleted = _compute_delta(cursor)
+            timings["diff"] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            _apply_delta(cursor)
+            timings["apply"] = time.perf_counter() - step
+        refresh.status = DatasetRefresh.SUCCEEDED
+        logger.info(
+            f"Dataset refreshed from {file_path}: {refresh.rows} rows, {refresh.inserted} inserted, "
+            f"{refresh.updated} updated, {refresh.deleted} deleted"
+        )
+        return refresh
+    except Exception as e:
+        refresh.status = DatasetRefresh.FAILED
+        refresh.error = str(e)
+        raise
+    finally:
+        timings["total"] = time.perf_counter() - started
+        refresh.timings = {name: round(seconds, 4) for name, seconds in timings.items()}
+        refresh.finished_at = timezone.now()
+        refresh.save()
+        if refresh.status == DatasetRefresh.SUCCEEDED and (refresh.inserted or refresh.updated or refresh.deleted):
+            dataset_refreshed.send(sender=DatasetRefresh, refresh=refresh)
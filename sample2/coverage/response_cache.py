@@ -0,0 +1,147 @@
+"""
+Cache of /api/ answers keyed on the quantized Lambert-93 cell of the point.
+
+Points less than `cell_size` meters apart mostly fall in the same cell, and
+every point of a cell gets the radius answer computed for the cell centre,
+so the answer is the same whichever point filled the cache. Nearest-mode
+answers carry distances and are only shared by the exact same point. Entries are stored
+with the dataset version (the last refresh that changed the table): once a
+refresh commits, entries written before it are simply never read again and
+expire on their own.
+
+Entries live in Django's "coverage" cache (Redis by default). A failing
+cache is skipped for `retry_after` seconds in favour of the process-local
+"coverage_local" cache, like the geocoding cache's second tier.
+
+`response_cache` is the instance configured by settings.RESPONSE_CACHE,
+shared by the views, the refresh signal handlers and the management
+commands, which can import it without loading the views' clients.
+"""
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from .models import DatasetRefresh
+
+logger = logging.getLogger(__name__)
+
+
+def make_etag(payload, status):
+    """
+    Strong ETag of an answer, stable across processes.
+    """
+    body = json.dumps([status, payload], sort_keys=True, separators=(",", ":"))
+    return '"%s"' % hashlib.sha1(body.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Versioned (payload, status, etag) entries per mode, engine and cell.
+    """
+
+    def __init__(
+        self,
+        alias="coverage",
+        fallback_alias="coverage_local",
+        cell_size=25,
+        version_ttl=5,
+        retry_after=30,
+        clock=time.monotonic,
+    ):
+        self.alias = alias
+        self.fallback_alias = fallback_alias
+        self.cell_size = cell_size
+        self.version_ttl = version_ttl
+        self.retry_after = retry_after
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._version = None
+        self._version_expires_at = 0
+        self._disabled_until = 0
+        self._lock = threading.Lock()
+
+    def cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def centre(self, cell):
+        return (cell[0] + 0.5) * self.cell_size, (cell[1] + 0.5) * self.cell_size
+
+    def locate(self, mode, engine, x, y):
+        """
+        (key, point to compute the answer for). Radius answers are shared by
+        the cell and computed for its centre; nearest answers report
+        distances from the exact point, so they are keyed on it.
+        """
+        if mode == "nearest":
+            return f"{mode}:{engine}:{x:.2f}:{y:.2f}", (x, y)
+        cell = self.cell(x, y)
+        return f"{mode}:{engine}:{self.cell_size:g}:{cell[0]}:{cell[1]}", self.centre(cell)
+
+    def version(self):
+        """
+        Dataset version: pk of the last refresh that changed the table, 0
+        before any. Read from the database at most every `version_ttl` seconds.
+        """
+        now = self.clock()
+        if self._version is None or now >= self._version_expires_at:
+            latest = (
+                DatasetRefresh.objects.filter(status=DatasetRefresh.SUCCEEDED)
+                .exclude(inserted=0, updated=0, deleted=0)
+                .values_list("pk", flat=True)
+                .first()
+            )
+            with self._lock:
+                self._version = latest or 0
+                self._version_expires_at = now + self.version_ttl
+        return self._version
+
+    def invalidate(self):
+        """
+        Forget the dataset version so the next request reads it again.
+        """
+        with self._lock:
+            self._version = None
+
+    def _call(self, method, *args, **kwargs):
+        if self.clock() >= self._disabled_until:
+            try:
+                return getattr(caches[self.alias], method)(*args, **kwargs)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    self._disabled_until = self.clock() + self.retry_after
+                logger.warning(f"Response cache unavailable, using the local cache: {e}")
+        return getattr(caches[self.fallback_alias], method)(*args, **kwargs)
+
+    def get(self, key, version):
+        entry = self._call("get", key, version=version)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, key, entry, version):
+        self._call("set", key, entry, version=version)
+
+    def clear(self):
+        """
+        Drop every entry, for changes made outside the refresh pipeline.
+        """
+        self._call("clear")
+        if self.alias != self.fallback_alias:
+            caches[self.fallback_alias].clear()
+        self.invalidate()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors, "version": self._version}
+
+
+response_cache = ResponseCache(**settings.RESPONSE_CACHE)
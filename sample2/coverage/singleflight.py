@@ -0,0 +1,99 @@
+"""
+Coalescing of concurrent identical calls ("single flight").
+
+While a call for a key is in flight, other threads asking for the same key
+wait for its outcome instead of running it again: they get the same result,
+or the same exception. Nothing is cached, the key is forgotten as soon as the
+call returns, so caching stays the job of the caller (see GeocodeCache).
+"""
+import asyncio
+import threading
+from functools import partial
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Group of calls deduplicated by key. `stats()` reports how many calls were
+    made, how many actually ran and how many were served by a call in flight.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        """
+        Return `fn(*args)`, sharing the outcome of a call already running for `key`.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            call.done.set()
+
+    async def ado(self, key, fn, *args):
+        """
+        Async version of `do` for a coroutine function: callers on the same
+        event loop await a single task. The task is shielded, so a caller
+        being cancelled (its client went away) doesn't cancel it for the others.
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = self._tasks[task_key] = loop.create_task(fn(*args))
+                task.add_done_callback(partial(self._task_done, task_key))
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _task_done(self, task_key, task):
+        with self._lock:
+            del self._tasks[task_key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller was cancelled
+            task.exception()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._in_flight) + len(self._tasks),
+            }
@@ -0,0 +1,193 @@
+"""
+Compact binary snapshot of the coverage dataset.
+
+Layout (little endian):
+    header      magic, version, operator count, row count
+    operators   one 16-byte ASCII code per operator (lookup table)
+    x, y        int32[rows]
+    operator    uint8[rows], index into the operator table
+    flags       uint8[rows], bit 0 = 2G, bit 1 = 3G, bit 2 = 4G
+
+Arrays are aligned to 64 bytes and read back with `np.memmap`, so every
+process mapping the same file shares its pages.
+
+Build a snapshot with:
+    python manage.py build_snapshot data.csv data.snapshot
+"""
+import csv
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+MAGIC = b"COVSNAP\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sHHI")
+OPERATOR_CODE_SIZE = 16
+ALIGNMENT = 64
+
+FLAG_2G = 1
+FLAG_3G = 2
+FLAG_4G = 4
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(operator_count, rows):
+    """
+    Byte offsets of the x, y, operator and flags arrays.
+    """
+    x_offset = _align(HEADER.size + operator_count * OPERATOR_CODE_SIZE)
+    y_offset = _align(x_offset + 4 * rows)
+    operator_offset = _align(y_offset + 4 * rows)
+    flags_offset = _align(operator_offset + rows)
+    return x_offset, y_offset, operator_offset, flags_offset, flags_offset + rows
+
+
+def pack_flags(g2, g3, g4):
+    """
+    Bit-pack the 2G/3G/4G columns into one byte per row.
+    """
+    return (
+        np.asarray(g2, dtype=bool) * FLAG_2G
+        | np.asarray(g3, dtype=bool) * FLAG_3G
+        | np.asarray(g4, dtype=bool) * FLAG_4G
+    ).astype(np.uint8)
+
+
+def write_snapshot(path, operators, x, y, g2, g3, g4):
+    """
+    Write the columns to `path`. The file is replaced atomically, so readers
+    that already mapped the previous version keep a consistent view.
+    """
+    operator_codes, operator_idx = np.unique(np.asarray(operators).astype(str), return_inverse=True)
+    if len(operator_codes) > 255:
+        raise ValueError("A snapshot holds at most 255 operators.")
+    rows = len(operator_idx)
+    x_offset, y_offset, operator_offset, flags_offset, size = _layout(len(operator_codes), rows)
+
+    buffer = bytearray(size)
+    HEADER.pack_into(buffer, 0, MAGIC, VERSION, len(operator_codes), rows)
+    for i, code in enumerate(operator_codes):
+        encoded = code.encode("ascii")
+        if len(encoded) > OPERATOR_CODE_SIZE:
+            raise ValueError(f"Operator code too long for a snapshot: {code}")
+        start = HEADER.size + i * OPERATOR_CODE_SIZE
+        buffer[start:start + len(encoded)] = encoded
+
+    buffer[x_offset:x_offset + 4 * rows] = np.asarray(x, dtype="<i4").tobytes()
+    buffer[y_offset:y_offset + 4 * rows] = np.asarray(y, dtype="<i4").tobytes()
+    buffer[operator_offset:operator_offset + rows] = operator_idx.astype(np.uint8).tobytes()
+    buffer[flags_offset:flags_offset + rows] = pack_flags(g2, g3, g4).tobytes()
+
+    # A temporary file of its own, so that concurrent writers never share one
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(buffer)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return rows
+
+
+def build_snapshot(csv_path, snapshot_path):
+    """
+    Convert the coverage CSV into a snapshot file.
+    """
+    operators, x, y, g2, g3, g4 = [], [], [], [], [], []
+    with open(csv_path, "r", encoding="utf-8") as csvfile:
+        for row in csv.DictReader(csvfile, delimiter=";"):
+            operators.append(row["Operateur"])
+            x.append(int(float(row["x"])))
+            y.append(int(float(row["y"])))
+            g2.append(bool(int(row["2G"])))
+            g3.append(bool(int(row["3G"])))
+            g4.append(bool(int(row["4G"])))
+    return write_snapshot(snapshot_path, operators, x, y, g2, g3, g4)
+
+
+def is_snapshot(path):
+    """
+    Check the magic bytes to tell a snapshot from a CSV file.
+    """
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _map(path, dtype, offset, rows):
+    """
+    Map one column read-only; mmap refuses empty ranges.
+    """
+    if not rows:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(rows,))
+
+
+class Snapshot:
+    """
+    Read-only, memory-mapped view of a snapshot file.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            magic, version, operator_count, rows = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a coverage snapshot.")
+            if version != VERSION:
+                raise ValueError(f"Unsupported snapshot version {version} in {path}.")
+            table = f.read(operator_count * OPERATOR_CODE_SIZE)
+
+        self.path = path
+        self.operator_codes = np.array(
+            [
+                table[i:i + OPERATOR_CODE_SIZE].rstrip(b"\x00").decode("ascii")
+                for i in range(0, len(table), OPERATOR_CODE_SIZE)
+            ]
+        )
+        x_offset, y_offset, operator_offset, flags_offset, _ = _layout(operator_count, rows)
+        self.x = _map(path, "<i4", x_offset, rows)
+        self.y = _map(path, "<i4", y_offset, rows)
+        self.operator = _map(path, np.uint8, operator_offset, rows)
+        self.flags = _map(path, np.uint8, flags_offset, rows)
+
+    def __len__(self):
+        return len(self.x)
+
+    @property
+    def operators(self):
+        return self.operator_codes[self.operator]
+
+    @property
+    def g2(self):
+        return (self.flags & FLAG_2G).astype(bool)
+
+    @property
+    def g3(self):
+        return (self.flags & FLAG_3G).astype(bool)
+
+    @property
+    def g4(self):
+        return (self.flags & FLAG_4G).astype(bool)
+
+    def iter_rows(self, chunk_size=10000):
+        """
+        Yield (operator, x, y, g2, g3, g4) tuples, converting one chunk at a time.
+        """
+        for start in range(0, len(self), chunk_size):
+            stop = start + chunk_size
+            flags = self.flags[start:stop]
+            yield from zip(
+                self.operator_codes[self.operator[start:stop]].tolist(),
+                self.x[start:stop].tolist(),
+                self.y[start:stop].tolist(),
+                (flags & FLAG_2G).astype(bool).tolist(),
+                (flags & FLAG_3G).astype(bool).tolist(),
+                (flags & FLAG_4G).astype(bool).tolist(),
+            )
@@ -1,14 +1,19 @@
 from celery import shared_task
-from django.core.management import call_command
+from django.conf import settings
+from .refresh import refresh_dataset
 
 @shared_task(bind=True)
-def reload_data(self):
+def reload_data(self, force=False):
     """
-    Celery task to reload network coverage data from CSV.
+    Celery task to refresh network coverage data from the source file.
+    Unchanged files are skipped; otherwise only the delta is applied.
     """
     try:
-        call_command('load_csv', 'data.csv')  # Replace 'data.csv' with your CSV path
-        return "Data reloaded successfully."
+        refresh = refresh_dataset(settings.COVERAGE_DATA_PATH, force=force)
+        return (
+            f"Data refresh {refresh.status}: {refresh.inserted} inserted, "
+            f"{refresh.updated} updated, {refresh.deleted} deleted."
+        )
     except Exception as e:
         self.retry(exc=e, countdown=60, max_retries=3)  # Retry up to 3 times
         return f"Failed to reload data: {e}"
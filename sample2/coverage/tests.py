@@ -1,11 +1,46 @@
+import asyncio
+import csv
+import io
 import os
 import json
-from django.test import TestCase, Client
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import requests
+from django.apps import apps
+from django.db import DatabaseError, connection
+from django.db.models.signals import post_migrate
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.core.management import call_command
 from django.core.management.base import CommandError
-from unittest.mock import patch
-from .models import CoverageData
-from .utils import wgs84_to_lambert93, get_coordinates
+from prometheus_client import REGISTRY
+from unittest.mock import Mock, patch
+from .models import CoverageData, DatasetRefresh
+from .refresh import dataset_refreshed, refresh_dataset
+from .coverage_grid import CoverageGrid
+from .transform import LAMBERT93, WGS84, get_transformer, lambert93_to_wgs84_arrays, wgs84_to_lambert93_arrays
+from .snapshot import Snapshot, build_snapshot, is_snapshot
+from .geocache import GeocodeCache, canonicalize_address
+from .geocoder_client import AsyncGeocoderClient, CircuitOpenError, GeocoderClient
+from .local_geocoder import LocalGeocoder
+from .rate_limit import LocalBucket, RateLimited, RateLimiter, build_rate_limiter
+from .singleflight import SingleFlight
+from .utils import ageocoder, wgs84_to_lambert93, get_coordinates, get_coordinates_batch, geocode_cache
+from .response_cache import response_cache
+from .views import coverage_flight, find_coverage, find_coverage_batch
+
+
+class CommittedDataTestCase(TransactionTestCase):
+    """Commits the test data, for the async view's lookups on worker threads with their own connection."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Every flush emits post_migrate, which would reload the whole CSV
+        config = apps.get_app_config("coverage")
+        post_migrate.disconnect(config.load_data, sender=config)
+        cls.addClassCleanup(post_migrate.connect, config.load_data, sender=config)
 
 
 class CoverageDataModelTest(TestCase):
@@ -23,10 +58,58 @@ class CoverageDataModelTest(TestCase):
         self.assertTrue(coverage.g2)
         self.assertFalse(coverage.g4)
 
+    def create_rows(self):
+        CoverageData.objects.all().delete()
+        for operator, x, y, g2, g3, g4 in [
+            ("20801", 652000, 6862100, True, False, False),
+            ("20801", 652000, 6864000, False, True, True),
+            # In the square around the point but 3536 m away
+            ("20810", 654500, 6864500, True, True, True),
+            # On the circle
+            ("20815", 655000, 6862000, False, False, True),
+        ]:
+            CoverageData.objects.create(operator=operator, x=x, y=y, g2=g2, g3=g3, g4=g4)
+
+    def test_near_aggregates_per_operator(self):
+        """Test near() ORs the rows of the circle into one tuple per operator."""
+        self.create_rows()
+        self.assertEqual(
+            list(CoverageData.objects.near(652000.0, 6862000.0, 3000)),
+            [("20801", True, True, True), ("20815", False, False, True)],
+        )
+
+    def test_batch_answers_like_near(self):
+        """Test the batch query and near() agree on the same point."""
+        self.create_rows()
+        [coverage] = find_coverage_batch([652000.0], [6862000.0])
+        self.assertEqual(coverage, find_coverage(652000.0, 6862000.0)[0])
+        self.assertEqual(set(coverage), {"Orange", "Free"})
+
+
+class PartitionedSchemaTest(TestCase):
+    def test_rows_are_routed_to_x_partitions(self):
+        """Test the table is range-partitioned on x and rows land in their strip."""
+        CoverageData.objects.all().delete()
+        paris = CoverageData.objects.create(operator="20801", x=652000, y=6862000, g2=True, g3=True, g4=True)
+        bogus = CoverageData.objects.create(operator="20801", x=0, y=0, g2=True, g3=True, g4=True)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id, tableoid::regclass::text FROM coverage_coveragedata ORDER BY id")
+            self.assertEqual(
+                cursor.fetchall(),
+                [(paris.pk, "coverage_coveragedata_p3"), (bogus.pk, "coverage_coveragedata_default")],
+            )
+
+    def test_cluster_coverage(self):
+        """Test every partition is clustered on its (x, y) index."""
+        out = io.StringIO()
+        call_command("cluster_coverage", stdout=out)
+        self.assertEqual(out.getvalue().count("Clustered coverage_coveragedata_"), 6)
+
 
 class GetNetworkCoverageViewTest(TestCase):
     def setUp(self):
         self.client = Client()
+        response_cache.clear()
         CoverageData.objects.create(
             operator="20801",
             x=102980,
@@ -53,6 +136,366 @@ class GetNetworkCoverageViewTest(TestCase):
         self.assertEqual(data["error"], "No address provided")
 
 
+class NearestCoverageViewTest(TestCase):
+    def setUp(self):
+        response_cache.clear()
+        CoverageData.objects.all().delete()
+        CoverageData.objects.create(operator="20801", x=652000, y=6862100, g2=True, g3=False, g4=False)
+        CoverageData.objects.create(operator="20801", x=652000, y=6862500, g2=False, g3=True, g4=True)
+        CoverageData.objects.create(operator="20810", x=654000, y=6862000, g2=True, g3=True, g4=True)
+        CoverageData.objects.create(operator="20815", x=660000, y=6862000, g2=True, g3=True, g4=True)
+
+    @patch("coverage.views.get_coordinates", return_value=(2.35, 48.85))
+    @patch("coverage.views.wgs84_to_lambert93", return_value=(652000.0, 6862000.0))
+    def test_nearest_mode(self, mock_transform, mock_get_coordinates):
+        """Test mode=nearest keeps the closest row per operator within the radius."""
+        response = self.client.get("/api/", {"q": "Paris", "mode": "nearest"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "Orange": {"2G": True, "3G": False, "4G": False, "distance": 100.0},
+                "SFR": {"2G": True, "3G": True, "4G": True, "distance": 2000.0},
+            },
+        )
+
+    def test_unknown_mode(self):
+        """Test an unknown mode is rejected."""
+        self.assertEqual(self.client.get("/api/", {"q": "Paris", "mode": "closest"}).status_code, 400)
+
+
+class AsyncNetworkCoverageViewTest(CommittedDataTestCase):
+    def setUp(self):
+        geocode_cache.clear()
+        response_cache.clear()
+        CoverageData.objects.all().delete()
+        CoverageData.objects.create(operator="20801", x=652000, y=6862000, g2=True, g3=True, g4=False)
+        self.geocoder_calls = []
+        client = httpx.AsyncClient(transport=httpx.MockTransport(self.geocoder))
+        patcher = patch.object(ageocoder, "http_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def geocoder(self, request):
+        """Local stand-in for api-adresse."""
+        address = request.url.params["q"]
+        self.geocoder_calls.append(address)
+        if address == "broken":
+            return httpx.Response(503)
+        if address == "nowhere":
+            return httpx.Response(200, json={"features": []})
+        return httpx.Response(200, json={"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]})
+
+    async def test_async_view(self):
+        """Test the async view geocodes once and answers like the sync one."""
+        for _ in range(2):
+            response = await self.async_client.get("/api/async", {"q": "42 rue papernest 75011 Paris"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {"Orange": {"2G": True, "3G": True, "4G": False}})
+        self.assertEqual(self.geocoder_calls, ["42 rue papernest 75011 Paris"])
+
+    async def test_async_view_errors(self):
+        """Test the async view maps geocoder answers to the same statuses."""
+        self.assertEqual((await self.async_client.get("/api/async")).status_code, 400)
+        self.assertEqual((await self.async_client.get("/api/async", {"q": "nowhere"})).status_code, 404)
+        self.assertEqual((await self.async_client.get("/api/async", {"q": "broken"})).status_code, 400)
+
+    async def test_concurrent_requests_are_coalesced(self):
+        """Test simultaneous requests for one address share the geocoder call and the lookup."""
+        lookups = coverage_flight.stats()["executions"]
+        responses = await asyncio.gather(
+            *(self.async_client.get("/api/async", {"q": "42 rue papernest 75011 Paris"}) for _ in range(5))
+        )
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        self.assertEqual(self.geocoder_calls, ["42 rue papernest 75011 Paris"])
+        self.assertEqual(coverage_flight.stats()["executions"], lookups + 1)
+
+    async def test_lookups_run_in_parallel(self):
+        """Test lookups of different points do not queue on the thread reserved for sync code."""
+        barrier = threading.Barrier(2, timeout=5)
+
+        def lookup(x, y, mode):
+            barrier.wait()
+            return {}, 200, '"empty"'
+
+        with patch("coverage.views.wgs84_to_lambert93", side_effect=[(652000.0, 6862000.0), (700000.0, 6600000.0)]):
+            with patch("coverage.views.cached_coverage", side_effect=lookup):
+                responses = await asyncio.gather(
+                    self.async_client.get("/api/async", {"q": "1 rue papernest 75011 Paris"}),
+                    self.async_client.get("/api/async", {"q": "2 rue papernest 75011 Paris"}),
+                )
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        response_cache.clear()
+        CoverageData.objects.all().delete()
+        CoverageData.objects.create(operator="20801", x=652000, y=6862000, g2=True, g3=False, g4=False)
+        self.csv_file_path = os.path.join(os.path.dirname(__file__), "test_response_cache.csv")
+
+    def tearDown(self):
+        if os.path.exists(self.csv_file_path):
+            os.remove(self.csv_file_path)
+
+    @patch("coverage.views.get_coordinates", return_value=(2.35, 48.85))
+    @patch("coverage.views.wgs84_to_lambert93", return_value=(652001.0, 6862001.0))
+    def test_validators_and_not_modified(self, mock_transform, mock_get_coordinates):
+        """Test answers carry an ETag and Cache-Control, and revalidate with a 304."""
+        response = self.client.get("/api/", {"q": "Paris"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "public, max-age=300")
+        etag = response["ETag"]
+        revalidated = self.client.get("/api/", {"q": "Paris"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated["ETag"], etag)
+        self.assertEqual(self.client.get("/api/", {"q": "Paris"}, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    @patch("coverage.views.get_coordinates", return_value=(2.35, 48.85))
+    def test_nearby_points_share_an_answer(self, mock_get_coordinates):
+        """Test points of one cell are answered once, for the cell centre."""
+        with patch("coverage.views.find_coverage", wraps=find_coverage) as mock_find, \
+                patch("coverage.views.wgs84_to_lambert93", side_effect=[(652001.0, 6862001.0), (652020.0, 6862009.0)]):
+            first = self.client.get("/api/", {"q": "Paris"})
+            second = self.client.get("/api/", {"q": "Paris"})
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first["ETag"], second["ETag"])
+        mock_find.assert_called_once_with(652012.5, 6862012.5, "radius")
+
+    @patch("coverage.views.get_coordinates", return_value=(2.35, 48.85))
+    @patch("coverage.views.wgs84_to_lambert93", return_value=(652001.0, 6862001.0))
+    def test_refresh_invalidates_answers(self, mock_transform, mock_get_coordinates):
+        """Test answers cached before a refresh that changed the data are not served after it."""
+        before = self.client.get("/api/", {"q": "Paris"})
+        self.assertEqual(before.json(), {"Orange": {"2G": True, "3G": False, "4G": False}})
+        with open(self.csv_file_path, "w") as f:
+            f.write("Operateur;x;y;2G;3G;4G\n20801;652000;6862000;1;1;1\n")
+        refresh_dataset(self.csv_file_path)
+        after = self.client.get("/api/", {"q": "Paris"}, HTTP_IF_NONE_MATCH=before["ETag"])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual(after.json(), {"Orange": {"2G": True, "3G": True, "4G": True}})
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        geocode_cache.clear()
+        response_cache.clear()
+        CoverageData.objects.all().delete()
+        CoverageData.objects.create(operator="20801", x=652000, y=6862000, g2=True, g3=True, g4=False)
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    @patch("coverage.utils.geocoder.session.request")
+    def test_lookup_stages_are_measured(self, mock_get):
+        """Test /metrics reports the stages, geocoder calls, queries and cache hits of a lookup."""
+        mock_get.return_value = Mock(
+            status_code=200, json=Mock(return_value={"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]})
+        )
+        stages = ("geocode", "transform", "lookup", "serialize")
+        counters = {
+            **{("coverage_stage_duration_seconds_count", ("stage", name)): 2 for name in stages},
+            ("coverage_geocoder_request_duration_seconds_count", ("endpoint", "search"), ("status", "200")): 1,
+            ("coverage_cache_events_total", ("cache", "geocode"), ("event", "misses")): 1,
+            ("coverage_cache_events_total", ("cache", "geocode"), ("event", "hits")): 1,
+            ("coverage_cache_events_total", ("cache", "response"), ("event", "misses")): 1,
+            ("coverage_cache_events_total", ("cache", "response"), ("event", "hits")): 1,
+            ("coverage_db_query_duration_seconds_count", ("query", "radius")): 1,
+            ("coverage_db_query_rows_sum", ("query", "radius")): 1,
+            ("coverage_db_connection_wait_seconds_count",): 1,
+        }
+        before = {key: self.sample(key[0], **dict(key[1:])) for key in counters}
+
+        for _ in range(2):
+            self.assertEqual(self.client.get("/api/", {"q": "1 rue des metriques"}).status_code, 200)
+
+        for key, increment in counters.items():
+            self.assertEqual(self.sample(key[0], **dict(key[1:])), before[key] + increment, key)
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"coverage_stage_duration_seconds_bucket", response.content)
+
+
+@override_settings(PROFILE_ALLOWED_CLIENTS=["127.0.0.1"])
+@patch("coverage.views.get_coordinates", return_value=(2.35, 48.85))
+@patch("coverage.views.wgs84_to_lambert93", return_value=(652000.0, 6862000.0))
+class ProfilingTest(CommittedDataTestCase):
+    def setUp(self):
+        response_cache.clear()
+        CoverageData.objects.all().delete()
+        CoverageData.objects.create(operator="20801", x=652000, y=6862100, g2=True, g3=False, g4=False)
+
+    def test_profiled_request(self, mock_transform, mock_get_coordinates):
+        """Test an allowed client gets the stages, functions and query plan next to the answer."""
+        self.client.get("/api/", {"q": "Paris"})  # cached answers must not hide the query
+        response = self.client.get("/api/", {"q": "Paris"}, HTTP_X_COVERAGE_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", response)
+        data = response.json()
+        self.assertEqual(data["response"], {"Orange": {"2G": True, "3G": False, "4G": False}})
+        profile = data["profile"]
+        self.assertEqual(set(profile["stages_ms"]), {"geocode", "transform", "lookup", "serialize"})
+        self.assertTrue(any("get_network_coverage" in f["function"] for f in profile["functions"]))
+        [query] = profile["queries"]
+        self.assertEqual(query["query"], "radius")
+        self.assertEqual(query["relations"], ["coverage_coveragedata_p3"])
+
+    def test_nearest_mode_plan(self, mock_transform, mock_get_coordinates):
+        """Test the nearest query is explained with the partitions it reads."""
+        response = self.client.get("/api/", {"q": "Paris", "mode": "nearest", "profile": "1"})
+        [query] = response.json()["profile"]["queries"]
+        self.assertEqual(query["query"], "nearest")
+        self.assertIn("coverage_coveragedata_p3", query["relations"])
+        self.assertTrue(any("Index Scan" in line for line in query["plan"]))
+
+    @override_settings(PROFILE_ALLOWED_CLIENTS=["10.0.0.0/8"])
+    def test_other_clients_are_not_profiled(self, mock_transform, mock_get_coordinates):
+        """Test the profile flag is ignored for clients outside PROFILE_ALLOWED_CLIENTS."""
+        response = self.client.get("/api/", {"q": "Paris", "profile": "1"})
+        self.assertEqual(response.json(), {"Orange": {"2G": True, "3G": False, "4G": False}})
+
+    async def test_async_view(self, mock_transform, mock_get_coordinates):
+        """Test the async view is profiled like the sync one."""
+        with patch("coverage.views.aget_coordinates", return_value=(2.35, 48.85)):
+            response = await self.async_client.get("/api/async", {"q": "Paris", "profile": "1"})
+        data = response.json()
+        self.assertEqual(data["response"], {"Orange": {"2G": True, "3G": False, "4G": False}})
+        self.assertEqual([query["query"] for query in data["profile"]["queries"]], ["radius"])
+
+
+class BatchNetworkCoverageViewTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        geocode_cache.clear()
+
+    def batch_geocoder(self, method, url, files, data, timeout):
+        """Local stand-in for api-adresse's CSV batch mode."""
+        known = {"Paris": ("48.8566", "2.3522"), "Lyon": ("45.7578", "4.8320")}
+        rows = list(csv.DictReader(io.StringIO(files["data"][1].decode("utf-8"))))
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["id", "q", "latitude", "longitude"])
+        for row in rows:
+            writer.writerow([row["id"], row["q"], *known.get(row["q"], ("", ""))])
+        response = Mock()
+        response.content = output.getvalue().encode("utf-8")
+        return response
+
+    def post(self, payload):
+        return self.client.post("/api/batch", json.dumps(payload), content_type="application/json")
+
+    @patch("coverage.utils.geocoder.session.request")
+    def test_batch_results_in_input_order(self, mock_post):
+        """Test per-item results and errors come back in input order."""
+        mock_post.side_effect = self.batch_geocoder
+        response = self.post({"addresses": ["Lyon", "", "Atlantis", "Paris"]})
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([r["address"] for r in results], ["Lyon", "", "Atlantis", "Paris"])
+        self.assertIn("Orange", results[0]["coverage"])
+        self.assertEqual(results[1]["error"], "No address provided")
+        self.assertIn("No coordinates found", results[2]["error"])
+        self.assertIn("Orange", results[3]["coverage"])
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch("coverage.utils.geocoder.session.request")
+    def test_batch_sends_each_canonical_address_once(self, mock_post):
+        """Test addresses differing only in case and punctuation are geocoded once."""
+        mock_post.side_effect = self.batch_geocoder
+        response = self.post(["Paris", " PARIS,"])
+        results = json.loads(response.content)["results"]
+        self.assertIn("Orange", results[0]["coverage"])
+        self.assertEqual(results[1]["coverage"], results[0]["coverage"])
+        self.assertEqual(mock_post.call_count, 1)
+        upload = mock_post.call_args.kwargs["files"]["data"][1].decode("utf-8")
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(upload)))), 1)
+
+    @patch("coverage.utils.geocoder.session.request")
+    def test_completed_chunks_are_cached_when_a_later_one_fails(self, mock_post):
+        """Test a failing chunk does not discard the answers of the chunks before it."""
+        calls = []
+
+        def geocoder(*args, **kwargs):
+            calls.append(1)
+            if len(calls) > 1:
+                raise requests.ConnectionError("connection reset")
+            return self.batch_geocoder(*args, **kwargs)
+
+        mock_post.side_effect = geocoder
+        results = get_coordinates_batch(["Lyon", "Paris"], chunk_size=1)
+        self.assertEqual(results, [[4.832, 45.7578], None])
+        self.assertEqual(geocode_cache.lookup("lyon"), (True, [4.832, 45.7578]))
+        self.assertEqual(geocode_cache.lookup("Paris"), (False, None))
+
+    @patch("coverage.views.find_coverage_batch", side_effect=DatabaseError("connection lost"))
+    @patch("coverage.utils.geocoder.session.request")
+    def test_batch_database_error_answers_500(self, mock_post, mock_find):
+        """Test a failing coverage query answers 500 with a JSON error."""
+        mock_post.side_effect = self.batch_geocoder
+        response = self.post(["Lyon"])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(json.loads(response.content), {"error": "Internal server error"})
+
+    def test_batch_invalid_payload(self):
+        """Test the batch endpoint rejects anything but a list of addresses."""
+        self.assertEqual(self.post({"addresses": "Paris"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/batch").status_code, 405)
+
+    @override_settings(BATCH_MAX_ADDRESSES=1)
+    def test_batch_too_many_addresses(self):
+        """Test the batch size limit."""
+        self.assertEqual(self.post(["Paris", "Lyon"]).status_code, 413)
+
+
+class CoordinatesNetworkCoverageViewTest(TestCase):
+    def post(self, payload):
+        return self.client.post("/api/coordinates", json.dumps(payload), content_type="application/json")
+
+    def read_lines(self, response):
+        return [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+    @override_settings(COORDINATES_CHUNK_SIZE=2)
+    def test_points_stream_in_input_order(self):
+        """Test one NDJSON line per point, errors included, across chunks."""
+        response = self.post([[2.3522, 48.8566], [2.3522, 95], {"lon": 2.3522, "lat": 48.8566}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = self.read_lines(response)
+        self.assertEqual([line["index"] for line in lines], [0, 1, 2])
+        self.assertIn("Orange", lines[0]["coverage"])
+        self.assertEqual(lines[1]["error"], "Coordinates out of WGS84 range.")
+        self.assertEqual(lines[2]["coverage"], lines[0]["coverage"])
+
+    def test_feature_collection(self):
+        """Test GeoJSON features are answered with their id."""
+        collection = {
+            "type": "FeatureCollection",
+            "features": [
+                {"type": "Feature", "id": "a", "geometry": {"type": "Point", "coordinates": [2.3522, 48.8566]}},
+                {"type": "Feature", "id": "b", "geometry": {"type": "Point", "coordinates": [-5.0, 46.0]}},
+            ],
+        }
+        lines = self.read_lines(self.post(collection))
+        self.assertEqual([line["id"] for line in lines], ["a", "b"])
+        self.assertIn("Orange", lines[0]["coverage"])
+        self.assertEqual(lines[1]["error"], "No coverage data found for the given location")
+
+    def test_points_outside_lambert93(self):
+        """Test poles and points far from France are per-point errors that keep the stream going."""
+        lines = self.read_lines(self.post([[0, -90], [2.3522, 48.8566], [-30.0, 40.0]]))
+        self.assertEqual([line["index"] for line in lines], [0, 1, 2])
+        self.assertEqual(lines[0]["error"], "Coordinates outside the Lambert-93 area.")
+        self.assertIn("Orange", lines[1]["coverage"])
+        self.assertEqual(lines[2]["error"], "Coordinates outside the Lambert-93 area.")
+
+    @override_settings(COORDINATES_MAX_POINTS=1)
+    def test_invalid_payloads(self):
+        """Test payloads that are not lists of points, empty or too large are rejected."""
+        self.assertEqual(self.post({"points": []}).status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([[2.35, 48.85], [2.35, 48.85]]).status_code, 413)
+
+
 class LoadCSVCommandTest(TestCase):
     def setUp(self):
         self.csv_file_path = os.path.join(os.path.dirname(__file__), "test_data.csv")
@@ -67,20 +510,511 @@ class LoadCSVCommandTest(TestCase):
         call_command("load_csv", self.csv_file_path)
         self.assertEqual(CoverageData.objects.count(), 77148 )
 
+    def test_load_csv_stream_mode(self):
+        """Test --stream dedupes against the table in the database."""
+        with open(self.csv_file_path, "w") as f:
+            f.write(
+                "Operateur;x;y;2G;3G;4G\n"
+                "20801;102980;6847973;1;1;0\n"  # already loaded
+                "20815;1;2;0;1;1\n"
+                "20815;1;2;0;1;1\n"
+                "20820;3.0;4.0;1;0;0\n"
+            )
+        count = CoverageData.objects.count()
+        call_command("load_csv", self.csv_file_path, "--stream", "--chunk-size", "2")
+        self.assertEqual(CoverageData.objects.count(), count + 3)
+        self.assertEqual(CoverageData.objects.filter(operator="20815", x=1, y=2, g4=True).count(), 2)
+        self.assertTrue(CoverageData.objects.filter(operator="20820", x=3, y=4, g2=True, g3=False).exists())
+
+        call_command("load_csv", self.csv_file_path, "--stream")
+        self.assertEqual(CoverageData.objects.count(), count + 3)
+
     def test_load_csv_file_not_found(self):
         """Test load_csv with a non-existent file."""
         with self.assertRaises(CommandError):
             call_command("load_csv", "non_existent.csv")
 
 
+class RefreshDatasetTest(TestCase):
+    def setUp(self):
+        self.csv_file_path = os.path.join(os.path.dirname(__file__), "test_refresh.csv")
+        CoverageData.objects.all().delete()
+        CoverageData.objects.create(operator="20801", x=1, y=2, g2=True, g3=False, g4=False)
+        CoverageData.objects.create(operator="20801", x=1, y=2, g2=True, g3=False, g4=False)
+        CoverageData.objects.create(operator="20810", x=5, y=6, g2=True, g3=True, g4=False)
+        CoverageData.objects.create(operator="20815", x=7, y=8, g2=False, g3=False, g4=True)
+
+    def tearDown(self):
+        os.remove(self.csv_file_path)
+
+    def write(self, *lines):
+        with open(self.csv_file_path, "w") as f:
+            f.write("Operateur;x;y;2G;3G;4G\n" + "".join(line + "\n" for line in lines))
+
+    def rows(self):
+        return sorted(CoverageData.objects.values_list("operator", "x", "y", "g2", "g3", "g4"))
+
+    def test_refresh_applies_delta(self):
+        """Test inserted, updated and deleted rows, duplicates included."""
+        self.write(
+            "20801;1;2;1;0;0",  # one of the two duplicates removed
+            "20810;5;6;1;1;1",  # 4G added
+            "20820;9;10;0;1;0",  # new
+        )
+        received = []
+        handler = lambda sender, refresh, **kwargs: received.append(refresh)
+        dataset_refreshed.connect(handler)
+        try:
+            refresh = refresh_dataset(self.csv_file_path)
+        finally:
+            dataset_refreshed.disconnect(handler)
+        self.assertEqual(refresh.status, DatasetRefresh.SUCCEEDED)
+        self.assertEqual((refresh.rows, refresh.inserted, refresh.updated, refresh.deleted), (3, 1, 1, 2))
+        self.assertEqual(
+            self.rows(),
+            [("20801", 1, 2, True, False, False), ("20810", 5, 6, True, True, True), ("20820", 9, 10, False, True, False)],
+        )
+        self.assertEqual(set(refresh.timings), {"fingerprint", "load", "diff", "apply", "total"})
+        self.assertEqual(received, [refresh])
+
+    def test_unchanged_file_is_skipped(self):
+        """Test a second refresh of the same file does not touch the table."""
+        self.write("20801;1;2;1;0;0")
+        refresh_dataset(self.csv_file_path)
+        CoverageData.objects.create(operator="20815", x=7, y=8, g2=False, g3=False, g4=True)
+        self.assertEqual(refresh_dataset(self.csv_file_path).status, DatasetRefresh.SKIPPED)
+        self.assertEqual(CoverageData.objects.count(), 2)
+
+        forced = refresh_dataset(self.csv_file_path, force=True)
+        self.assertEqual((forced.status, forced.deleted), (DatasetRefresh.SUCCEEDED, 1))
+        self.assertEqual(DatasetRefresh.objects.count(), 3)
+
+    def test_failed_refresh_is_recorded(self):
+        """Test errors leave the table untouched and are recorded."""
+        self.write("20801;1;not-a-number;1;0;0")
+        with self.assertRaises(ValueError):
+            refresh_dataset(self.csv_file_path)
+        self.assertEqual(CoverageData.objects.count(), 4)
+        self.assertEqual(DatasetRefresh.objects.get().status, DatasetRefresh.FAILED)
+
+
+class CoverageGridTest(TestCase):
+    def setUp(self):
+        response_cache.clear()
+        self.grid_path = os.path.join(os.path.dirname(__file__), "test_coverage.grid")
+        self.csv_file_path = os.path.join(os.path.dirname(__file__), "test_grid.csv")
+        CoverageData.objects.all().delete()
+        CoverageData.objects.create(operator="20801", x=652000, y=6862000, g2=True, g3=False, g4=False)
+        CoverageData.objects.create(operator="20801", x=653000, y=6862000, g2=False, g3=False, g4=True)
+        CoverageData.objects.create(operator="20810", x=660000, y=6862000, g2=True, g3=True, g4=True)
+
+    def tearDown(self):
+        for path in (self.grid_path, self.csv_file_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_build_coverage_grid(self):
+        """Test the grid ORs the flags of the rows within the radius."""
+        call_command("build_coverage_grid", "--output", self.grid_path, stdout=io.StringIO())
+        grid = CoverageGrid.open(self.grid_path)
+        self.assertEqual(grid.lookup(652100, 6862100), {"20801": (True, False, True)})
+        self.assertEqual(grid.lookup(658000, 6862000), {"20810": (True, True, True)})
+        self.assertEqual(grid.lookup(656000, 6862000), {})
+        self.assertIsNone(grid.lookup(600000, 6862000))
+
+    @patch("coverage.views.get_coordinates", return_value=(2.35, 48.85))
+    @patch("coverage.views.wgs84_to_lambert93", return_value=(652100.0, 6862100.0))
+    def test_grid_engine_answers_api(self, mock_transform, mock_get_coordinates):
+        """Test /api/ answers from the grid alone."""
+        call_command("build_coverage_grid", "--output", self.grid_path, stdout=io.StringIO())
+        with override_settings(COVERAGE_ENGINE="grid", COVERAGE_GRID_PATH=self.grid_path):
+            CoverageData.objects.all().delete()  # the grid alone answers
+            response = self.client.get("/api/", {"q": "Paris"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {"Orange": {"2G": True, "3G": False, "4G": True}})
+
+    def test_refresh_rebuilds_grid(self):
+        """Test a dataset refresh rebuilds the grid of the grid engine."""
+        with open(self.csv_file_path, "w") as f:
+            f.write("Operateur;x;y;2G;3G;4G\n20815;652000;6862000;0;1;0\n")
+        with override_settings(COVERAGE_ENGINE="grid", COVERAGE_GRID_PATH=self.grid_path):
+            refresh_dataset(self.csv_file_path)
+        self.assertEqual(CoverageGrid.open(self.grid_path).lookup(652000, 6862000), {"20815": (False, True, False)})
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.csv_file_path = os.path.join(os.path.dirname(__file__), "test_snapshot.csv")
+        self.snapshot_path = os.path.join(os.path.dirname(__file__), "test_data.snapshot")
+        with open(self.csv_file_path, "w") as f:
+            f.write("Operateur;x;y;2G;3G;4G\n20801;1;2;1;0;1\n20815;3;4;0;1;0\n")
+
+    def tearDown(self):
+        for path in (self.csv_file_path, self.snapshot_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_build_snapshot_round_trip(self):
+        """Test the snapshot keeps every column and packs the flags."""
+        self.assertEqual(build_snapshot(self.csv_file_path, self.snapshot_path), 2)
+        self.assertTrue(is_snapshot(self.snapshot_path))
+        self.assertFalse(is_snapshot(self.csv_file_path))
+        snapshot = Snapshot(self.snapshot_path)
+        self.assertEqual(list(snapshot.operator_codes), ["20801", "20815"])
+        self.assertEqual(list(snapshot.flags), [0b101, 0b010])
+        self.assertEqual(
+            list(snapshot.iter_rows(chunk_size=1)),
+            [("20801", 1, 2, True, False, True), ("20815", 3, 4, False, True, False)],
+        )
+
+    def test_load_csv_from_snapshot(self):
+        """Test the load_csv command reads snapshots directly."""
+        call_command("build_snapshot", self.csv_file_path, self.snapshot_path)
+        count = CoverageData.objects.count()
+        call_command("load_csv", self.snapshot_path)
+        self.assertEqual(CoverageData.objects.count(), count + 2)
+        self.assertTrue(CoverageData.objects.filter(operator="20815", x=3, y=4, g3=True).exists())
+
+
+class GeocodeCacheTest(TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def stub_geocoder(self, address):
+        """Local stand-in for api-adresse."""
+        self.calls.append(address)
+        return None if address == "nowhere" else [2.0, 48.0]
+
+    def test_canonicalized_addresses_share_an_entry(self):
+        """Test repeat addresses are served from the cache."""
+        cache = GeocodeCache()
+        self.assertEqual(cache.get_or_fetch("10 Rue de l'Église Paris", self.stub_geocoder), [2.0, 48.0])
+        self.assertEqual(cache.get_or_fetch("10 rue de l eglise, PARIS", self.stub_geocoder), [2.0, 48.0])
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(canonicalize_address(" 10 Rue  de l'Église "), "10 rue de l eglise")
+
+    def test_negative_caching_and_counters(self):
+        """Test "no features" answers are cached and counted."""
+        cache = GeocodeCache(max_size=1)
+        cache.get_or_fetch("nowhere", self.stub_geocoder)
+        cache.get_or_fetch("nowhere", self.stub_geocoder)
+        cache.get_or_fetch("Paris", self.stub_geocoder)
+        self.assertEqual(self.calls, ["nowhere", "Paris"])
+        stats = cache.stats()
+        self.assertEqual(stats["negative_hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["evictions"], 1)
+
+
+class FakeGeocoderHandler(BaseHTTPRequestHandler):
+    """Local stand-in for api-adresse answering from the server's script of (status, delay)."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        status, delay = self.server.script.pop(0) if self.server.script else (200, 0)
+        time.sleep(delay)
+        body = b'{"features": [{"geometry": {"coordinates": [2.3522, 48.8566]}}]}'
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class GeocoderClientTest(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGeocoderHandler)
+        self.server.daemon_threads = True
+        self.server.script = []
+        self.server.connections = set()
+        threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True).start()
+        self.outcomes = []
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def make_client(self, **kwargs):
+        return GeocoderClient(
+            f"http://127.0.0.1:{self.server.server_address[1]}",
+            backoff=0.001,
+            on_outcome=lambda endpoint, outcome: self.outcomes.append(outcome),
+            **kwargs,
+        )
+
+    def test_retries_over_one_connection(self):
+        """Test 5xx answers are retried over the same keep-alive connection."""
+        client = self.make_client(retries=2)
+        self.server.script = [(503, 0), (500, 0)]
+        self.assertEqual(client.get("search", "/search/").status_code, 200)
+        self.assertEqual(client.get("search", "/search/").status_code, 200)
+        self.assertEqual(self.outcomes, ["retry", "retry", "success", "success"])
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_circuit_breaker_fails_fast(self):
+        """Test the client stops calling an upstream that keeps failing."""
+        client = self.make_client(retries=0, breaker_threshold=2)
+        self.server.script = [(502, 0), (502, 0)]
+        client.get("search", "/search/")
+        client.get("search", "/search/")
+        with self.assertRaises(CircuitOpenError):
+            client.get("search", "/search/")
+        self.assertEqual(self.outcomes, ["error", "error", "circuit_open"])
+
+    def test_probe_refused_by_the_limiter_is_released(self):
+        """Test a half-open probe refused by the rate limiter lets the next call probe."""
+        limiter = RateLimiter(LocalBucket(0.001, 1), max_wait=0)
+        client = self.make_client(retries=0, breaker_threshold=1, breaker_reset=0.05, limiter=limiter)
+        self.server.script = [(502, 0)]
+        client.get("search", "/search/")
+        time.sleep(0.06)
+        with self.assertRaises(RateLimited):
+            client.get("search", "/search/")
+        client.limiter = None
+        self.assertEqual(client.get("search", "/search/").status_code, 200)
+        self.assertEqual(client.breaker.state, "closed")
+        self.assertEqual(self.outcomes, ["error", "rate_limited", "success"])
+
+    def async_get(self, client):
+        """GET /search/ with an AsyncGeocoderClient over `client`; returns (response, seconds)."""
+
+        async def call():
+            async_client = AsyncGeocoderClient(client)
+            start = time.perf_counter()
+            try:
+                response = await async_client.get("search", "/search/")
+            finally:
+                await async_client.http_client().aclose()
+            return response, time.perf_counter() - start
+
+        return asyncio.run(call())
+
+    def test_async_client_shares_the_breaker(self):
+        """Test the async client retries, and opens the circuit of the client it wraps."""
+        client = self.make_client(retries=1, breaker_threshold=1)
+        self.server.script = [(503, 0), (503, 0)]
+        response, _ = self.async_get(client)
+        self.assertEqual(response.status_code, 503)
+        with self.assertRaises(CircuitOpenError):
+            client.get("search", "/search/")
+        self.assertEqual(self.outcomes, ["retry", "error", "circuit_open"])
+
+    def test_async_slow_call_is_hedged(self):
+        """Test the async client hedges on the latencies of the client it wraps."""
+        client = self.make_client(hedge=True)
+        for _ in range(20):
+            client.get("search", "/search/")
+        self.server.script = [(200, 1)]
+        # The losing request is cancelled, its answer finds the connection closed
+        self.server.handle_error = lambda request, client_address: None
+        response, elapsed = self.async_get(client)
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(self.outcomes[-3:], ["hedge", "hedge_won", "success"])
+
+    def test_slow_call_is_hedged(self):
+        """Test a call slower than the recent p95 is answered by a second request."""
+        client = self.make_client(hedge=True)
+        for _ in range(20):
+            client.get("search", "/search/")
+        self.server.script = [(200, 1)]
+        start = time.perf_counter()
+        self.assertEqual(client.get("search", "/search/").status_code, 200)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(self.outcomes[-3:], ["hedge", "hedge_won", "success"])
+
+
+class RateLimitTest(TestCase):
+    def setUp(self):
+        geocode_cache.clear()
+        response_cache.clear()
+        CoverageData.objects.all().delete()
+        CoverageData.objects.create(operator="20801", x=652000, y=6862000, g2=True, g3=True, g4=False)
+
+    def exhausted_limiter(self):
+        """A limiter whose only token is taken, admitting nothing for a long while."""
+        limiter = RateLimiter(LocalBucket(0.001, 1), max_wait=0)
+        limiter.reserve("search")
+        return limiter
+
+    def test_free_token_has_no_wait(self):
+        """Test a free token is admitted without a wait rounded up from zero."""
+        bucket = LocalBucket(0.001, 1, clock=lambda: 205.450578076638)
+        self.assertEqual(bucket.reserve(0), (True, 0.0))
+
+    def test_bursts_wait_for_their_turn(self):
+        """Test calls beyond the burst sleep until their token instead of failing."""
+        sleeps = []
+        limiter = RateLimiter(LocalBucket(10, 2), sleep=sleeps.append)
+        for _ in range(4):
+            limiter.acquire("search")
+        self.assertEqual(len(sleeps), 2)
+        self.assertAlmostEqual(sleeps[0], 0.1, places=2)
+        self.assertAlmostEqual(sleeps[1], 0.2, places=2)
+        self.assertEqual(limiter.depth, 0)
+
+    def test_unreachable_redis_falls_back_to_the_process_bucket(self):
+        """Test the limiter keeps this process to its share of the rate while Redis is down."""
+        limiter = build_rate_limiter(backend="redis", rate=10, burst=4, workers=4, redis_url="redis://127.0.0.1:1/0")
+        self.assertEqual(limiter.reserve("search"), 0)
+        self.assertAlmostEqual(limiter.reserve("search"), 0.4, places=2)
+
+    def test_fallback_rate_overrides_the_share(self):
+        """Test an explicit fallback rate replaces the share of one worker."""
+        limiter = build_rate_limiter(backend="redis", rate=10, burst=1, fallback_rate=10, redis_url="redis://127.0.0.1:1/0")
+        self.assertEqual(limiter.reserve("search"), 0)
+        self.assertAlmostEqual(limiter.reserve("search"), 0.1, places=2)
+
+    @patch("coverage.utils.geocoder.session.request")
+    def test_refused_lookup_answers_503(self, mock_get):
+        """Test a lookup refused by the rate limit is not sent and tells when to retry."""
+        with patch("coverage.utils.geocoder.limiter", self.exhausted_limiter()):
+            response = self.client.get("/api/", {"q": "1 rue du quota"})
+        self.assertEqual(response.status_code, 503)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        mock_get.assert_not_called()
+
+    async def test_async_view_shares_the_rate_limit(self):
+        """Test the async view waits for the same limiter before calling the API."""
+        with patch("coverage.utils.geocoder.limiter", self.exhausted_limiter()):
+            response = await self.async_client.get("/api/async", {"q": "1 rue du quota"})
+        self.assertEqual(response.status_code, 503)
+
+
+class LocalGeocoderTest(TestCase):
+    def setUp(self):
+        geocode_cache.clear()
+        self.csv_file_path = os.path.join(os.path.dirname(__file__), "test_ban.csv")
+        self.index_path = os.path.join(os.path.dirname(__file__), "test_geocoder.sqlite3")
+        with open(self.csv_file_path, "w") as f:
+            f.write("numero;rep;nom_voie;code_postal;nom_commune;lon;lat\n")
+            for number in range(1, 11):
+                f.write(f"{number};;Rue de la Roquette;75011;Paris;{2.37 + number * 1e-4:.4f};48.855\n")
+                f.write(f"{number};;Rue de la Paix;75002;Paris;2.331;48.869\n")
+                f.write(f"{number};;Rue de la Paix;69001;Lyon;4.835;45.764\n")
+        call_command("build_geocoder", self.csv_file_path, "--output", self.index_path, stdout=io.StringIO())
+
+    def tearDown(self):
+        for path in (self.csv_file_path, self.index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_lookup_statuses(self):
+        """Test confident, ambiguous and unknown addresses."""
+        geocoder = LocalGeocoder(self.index_path)
+        status, match = geocoder.lookup("5 Rue de la Roquette 75011 Paris")
+        self.assertEqual(status, "found")
+        self.assertAlmostEqual(match.lon, 2.3705)
+        self.assertEqual(geocoder.lookup("5 rue de la paix")[0], "low_confidence")
+        self.assertEqual(geocoder.lookup("5 impasse inconnue")[0], "not_found")
+
+    def test_build_geocoder_requires_an_output(self):
+        """Test the command refuses to run without --output or LOCAL_GEOCODER_PATH."""
+        with self.assertRaises(CommandError):
+            call_command("build_geocoder", self.csv_file_path)
+
+    @patch("coverage.utils.geocoder.session.request")
+    def test_confident_answers_skip_the_api(self, mock_get):
+        """Test get_coordinates only calls the API when the local answer is not confident."""
+        mock_get.return_value.json.return_value = {"features": [{"geometry": {"coordinates": [4.8, 45.7]}}]}
+        with patch("coverage.utils.local_geocoder", LocalGeocoder(self.index_path)):
+            self.assertEqual(get_coordinates("5 rue de la Roquette Paris"), [2.3705, 48.855])
+            mock_get.assert_not_called()
+            self.assertEqual(get_coordinates("5 rue de la Paix"), [4.8, 45.7])
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("coverage.utils.geocoder.session.request")
+    def test_removed_index_falls_back_to_the_api(self, mock_get):
+        """Test get_coordinates uses the API when the local index disappears mid-flight."""
+        mock_get.return_value.json.return_value = {"features": [{"geometry": {"coordinates": [2.37, 48.85]}}]}
+        with patch("coverage.utils.local_geocoder", LocalGeocoder(self.index_path)):
+            os.remove(self.index_path)
+            self.assertEqual(get_coordinates("5 rue de la Roquette Paris"), [2.37, 48.85])
+        self.assertEqual(mock_get.call_count, 1)
+
+
+class SingleFlightTest(TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        """Test threads asking for the same key wait for the call in flight."""
+        flight = SingleFlight()
+        release = threading.Event()
+        executions = []
+        results = []
+
+        def lookup():
+            executions.append(1)
+            release.wait(5)
+            return "coverage"
+
+        threads = [threading.Thread(target=lambda: results.append(flight.do("key", lookup))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        while flight.stats()["calls"] < 4:
+            release.wait(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["coverage"] * 4)
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(flight.stats(), {"calls": 4, "executions": 1, "coalesced": 3, "in_flight": 0})
+
+    def test_async_callers_share_one_task(self):
+        """Test coroutines awaiting the same key share one task, errors included."""
+        flight = SingleFlight()
+        executions = []
+
+        async def lookup(value):
+            executions.append(value)
+            await asyncio.sleep(0.01)
+            if value is None:
+                raise ValueError("geocoder down")
+            return value
+
+        async def scenario():
+            results = await asyncio.gather(*(flight.ado("a", lookup, 1) for _ in range(3)))
+            errors = await asyncio.gather(*(flight.ado("b", lookup, None) for _ in range(2)), return_exceptions=True)
+            return results, errors
+
+        results, errors = asyncio.run(scenario())
+        self.assertEqual(results, [1, 1, 1])
+        self.assertEqual([str(e) for e in errors], ["geocoder down"] * 2)
+        self.assertEqual(executions, [1, None])
+        self.assertEqual(flight.stats(), {"calls": 5, "executions": 2, "coalesced": 3, "in_flight": 0})
+
+
+class TransformTest(TestCase):
+    def test_arrays_round_trip(self):
+        """Test the array transforms in both directions."""
+        xs, ys = wgs84_to_lambert93_arrays([2.3522, 5.3698], [48.8566, 43.2965])
+        self.assertEqual((round(xs[0]), round(ys[0])), (652469, 6862035))
+        self.assertEqual(wgs84_to_lambert93(5.3698, 43.2965), (xs[1], ys[1]))
+        lons, lats = lambert93_to_wgs84_arrays(xs, ys)
+        self.assertAlmostEqual(lons[0], 2.3522)
+        self.assertAlmostEqual(lats[1], 43.2965)
+
+    def test_transformers_are_thread_local(self):
+        """Test every thread gets its own transformer."""
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(get_transformer(WGS84, LAMBERT93)))
+        thread.start()
+        thread.join()
+        self.assertIs(get_transformer(WGS84, LAMBERT93), get_transformer(WGS84, LAMBERT93))
+        self.assertIsNot(seen[0], get_transformer(WGS84, LAMBERT93))
+
+
 class UtilsTest(TestCase):
+    def setUp(self):
+        geocode_cache.clear()
     def test_wgs84_to_lambert93(self):
         """Test WGS84 to Lambert93 coordinate conversion."""
         x, y = wgs84_to_lambert93(2.0, 48.0)
         self.assertIsInstance(x, float)
         self.assertIsInstance(y, float)
 
-    @patch("coverage.utils.requests.get")
+    @patch("coverage.utils.geocoder.session.request")
     def test_get_coordinates_success(self, mock_get):
         """Test successful geocoding."""
         mock_get.return_value.json.return_value = {
@@ -89,7 +1023,7 @@ class UtilsTest(TestCase):
         coordinates = get_coordinates("Paris")
         self.assertEqual(coordinates, [2.0, 48.0])
 
-    @patch("coverage.utils.requests.get")
+    @patch("coverage.utils.geocoder.session.request")
     def test_get_coordinates_failure(self, mock_get):
         """Test geocoding failure."""
         mock_get.return_value.json.return_value = {"features": []}
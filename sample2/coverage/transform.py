@@ -0,0 +1,137 @@
+"""
+Coordinate transforms between WGS84 (EPSG:4326) and Lambert-93 (EPSG:2154).
+
+pyproj `Transformer` objects must not be shared between threads, so every
+thread gets its own instances, created on first use. The `*_arrays`
+functions convert whole NumPy arrays in a single PROJ call and should be
+preferred for anything larger than a handful of points.
+"""
+import math
+import threading
+import numpy as np
+from pyproj import Transformer
+
+WGS84 = "EPSG:4326"
+LAMBERT93 = "EPSG:2154"
+# Area of use of Lambert-93 (mainland France and Corsica, offshore included)
+# as x_min, x_max, y_min, y_max in meters
+LAMBERT93_BOUNDS = (-378306, 1320650, 6005281, 7235613)
+
+_local = threading.local()
+
+
+def get_transformer(source, target):
+    """
+    Return this thread's (lon, lat)-ordered transformer from `source` to `target`.
+    """
+    transformers = getattr(_local, "transformers", None)
+    if transformers is None:
+        transformers = _local.transformers = {}
+    transformer = transformers.get((source, target))
+    if transformer is None:
+        transformer = transformers[(source, target)] = Transformer.from_crs(source, target, always_xy=True)
+    return transformer
+
+
+def _transform_arrays(source, target, xs, ys):
+    x, y = get_transformer(source, target).transform(
+        np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64)
+    )
+    return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+
+
+def wgs84_to_lambert93(lon, lat):
+    """
+    Convert WGS84 (EPSG:4326) to Lambert-93 (EPSG:2154).
+    Returns (x, y).
+    """
+    return get_transformer(WGS84, LAMBERT93).transform(lon, lat)
+
+
+def wgs84_to_lambert93_arrays(lons, lats):
+    """
+    Convert arrays of WGS84 coordinates to Lambert-93 in one call.
+    Returns (x, y) NumPy arrays.
+    """
+    return _transform_arrays(WGS84, LAMBERT93, lons, lats)
+
+
+def lambert93_to_wgs84(x, y):
+    """
+    Convert Lambert-93 (EPSG:2154) to WGS84 (EPSG:4326).
+    Returns (lon, lat).
+    """
+    return get_transformer(LAMBERT93, WGS84).transform(x, y)
+
+
+def lambert93_to_wgs84_arrays(xs, ys):
+    """
+    Convert arrays of Lambert-93 coordinates to WGS84 in one call, e.g. to
+    precompute GPS coordinates for the whole dataset.
+    Returns (lon, lat) NumPy arrays.
+    """
+    return _transform_arrays(LAMBERT93, WGS84, xs, ys)
+
+
+def _point(lon, lat):
+    """
+    Error message for invalid WGS84 coordinates, or None.
+    """
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (lon, lat)):
+        return "Coordinates must be numbers."
+    if not (math.isfinite(lon) and math.isfinite(lat) and -180 <= lon <= 180 and -90 <= lat <= 90):
+        return "Coordinates out of WGS84 range."
+    return None
+
+
+def parse_points(payload):
+    """
+    Read the WGS84 points of a JSON array of [lon, lat] pairs or
+    {"lon", "lat"} objects, or of a GeoJSON FeatureCollection of Points.
+    Returns (lons, lats, ids, errors) lists with one entry per point: invalid
+    points get NaN coordinates and an error message, so the whole list can
+    go through one `wgs84_to_lambert93_arrays` call. `ids` holds the GeoJSON
+    feature ids. Raises ValueError when the payload has neither shape.
+    """
+    if isinstance(payload, dict) and payload.get("type") == "FeatureCollection":
+        items = payload.get("features")
+        if not isinstance(items, list):
+            raise ValueError("A FeatureCollection needs a list of features.")
+    elif isinstance(payload, list):
+        items = payload
+    else:
+        raise ValueError("Provide a list of [lon, lat] points or a GeoJSON FeatureCollection.")
+
+    lons, lats, ids, errors = [], [], [], []
+    for item in items:
+        feature_id = None
+        if isinstance(item, dict) and item.get("type") == "Feature":
+            feature_id = item.get("id")
+            geometry = item.get("geometry") or {}
+            item = geometry.get("coordinates") if geometry.get("type") == "Point" else None
+        if isinstance(item, dict):
+            item = [item.get("lon"), item.get("lat")]
+        if isinstance(item, list) and len(item) >= 2:
+            error = _point(item[0], item[1])
+        else:
+            error = "Expected a [lon, lat] point."
+        lons.append(float(item[0]) if error is None else math.nan)
+        lats.append(float(item[1]) if error is None else math.nan)
+        ids.append(feature_id)
+        errors.append(error)
+    return lons, lats, ids, errors
+
+
+def lambert93_errors(xs, ys, errors):
+    """
+    `errors` of `parse_points` with the points whose Lambert-93 projection
+    is not finite, such as the poles, or falls outside LAMBERT93_BOUNDS
+    marked invalid as well.
+    """
+    x_min, x_max, y_min, y_max = LAMBERT93_BOUNDS
+    xs, ys = np.asarray(xs), np.asarray(ys)
+    inside = np.isfinite(xs) & np.isfinite(ys) & (xs >= x_min) & (xs <= x_max) & (ys >= y_min) & (ys <= y_max)
+    return [
+        "Coordinates outside the Lambert-93 area." if error is None and not ok else error
+        for error, ok in zip(errors, inside)
+    ]
@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path
-from .views import get_network_coverage
+from .views import aget_network_coverage, batch_network_coverage, coordinates_network_coverage, get_network_coverage
 
 urlpatterns = [
-    path('', get_network_coverage, name='network_coverage'),
+    path('', aget_network_coverage if settings.ASYNC_VIEWS else get_network_coverage, name='network_coverage'),
+    path('async', aget_network_coverage, name='network_coverage_async'),
+    path('batch', batch_network_coverage, name='network_coverage_batch'),
+    path('coordinates', coordinates_network_coverage, name='network_coverage_coordinates'),
 ]
@@ -1,35 +1,210 @@
+import csv
+import io
+import logging
+import sqlite3
+import httpx
 import requests
-from pyproj import Transformer
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from requests.exceptions import HTTPError
+from .geocache import build_geocode_cache, canonicalize_address
+from .geocoder_client import AsyncGeocoderClient, GeocoderClient
+from .local_geocoder import build_local_geocoder
+from .metrics import cache_event, geocoder_call, geocoder_outcome, rate_limit_queue, rate_limit_wait
+from .rate_limit import RateLimited, build_rate_limiter
+# Re-exported for existing callers, the transforms live in coverage.transform
+from .transform import wgs84_to_lambert93, wgs84_to_lambert93_arrays  # noqa: F401
 
-wgs84_to_lambert93_transformer = Transformer.from_crs(
-    "EPSG:4326", "EPSG:2154", always_xy=True
+logger = logging.getLogger(__name__)
+
+geocode_cache = build_geocode_cache(**settings.GEOCODE_CACHE)
+geocode_cache.on_event = cache_event("geocode")
+
+# Shared by every worker so that scaling out does not exceed the API's rate limit
+rate_limiter = build_rate_limiter(**settings.GEOCODER_RATE_LIMIT)
+if rate_limiter is not None:
+    rate_limiter.on_wait = rate_limit_wait
+    rate_limiter.on_queue = rate_limit_queue
+
+geocoder = GeocoderClient(
+    settings.GEOCODER_URL, limiter=rate_limiter, on_outcome=geocoder_outcome, **settings.GEOCODER_CLIENT
 )
+# Used by the async view, with the circuit breaker and settings of `geocoder`
+ageocoder = AsyncGeocoderClient(geocoder, max_connections=settings.GEOCODER_MAX_CONNECTIONS)
+
+# Offline BAN index answering confident lookups without the API (see coverage.local_geocoder)
+local_geocoder = build_local_geocoder(settings.LOCAL_GEOCODER_PATH, settings.LOCAL_GEOCODER_MIN_CONFIDENCE)
+
+def fetch_coordinates(address):
+    """
+    Query the external geocoding API. Returns None when the address has no match.
+    """
+    with geocoder_call("search") as call:
+        response = geocoder.get("search", "/search/", params={"q": address})
+        call["status"] = response.status_code
+    response.raise_for_status()
+    data = response.json()
+    if data["features"]:
+        return data["features"][0]["geometry"]["coordinates"]
+    return None
+
+def local_coordinates(address):
+    """
+    [lon, lat] of `address` from the local geocoder, or None when it is not
+    configured, not confident enough or unreadable, e.g. while it is rebuilt.
+    """
+    if local_geocoder is None:
+        return None
+    try:
+        with geocoder_call("local") as call:
+            call["status"], match = local_geocoder.lookup(address)
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"Local geocoder unavailable, using the API: {e}")
+        return None
+    if call["status"] != "found":
+        return None
+    return [match.lon, match.lat]
 
-def wgs84_to_lambert93(lon, lat):
+def geocode(address):
     """
-    Convert WGS84 (EPSG:4326) to Lambert-93 (EPSG:2154).
-    Returns (x, y).
+    Geocode with the local index, falling back to the API when it is not confident.
     """
-    x, y = wgs84_to_lambert93_transformer.transform(lon, lat)
-    return x, y
+    coordinates = local_coordinates(address)
+    if coordinates is not None:
+        return coordinates
+    return fetch_coordinates(address)
 
 def get_coordinates(address):
     """
-    Get WGS84 coordinates for a given address using an external geocoding API.
+    Get WGS84 coordinates for a given address with the local geocoder or an
+    external geocoding API. Results, including "no match" answers, are
+    served from `geocode_cache`. Raises RateLimited when the API call would
+    wait too long for its turn.
     """
     if not address or not isinstance(address, str) or len(address.strip()) == 0:
         raise ValueError("Invalid address provided. Address must be a non-empty string.")
 
-    url = f"https://api-adresse.data.gouv.fr/search/?q={address}"
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        if data["features"]:
-            return data["features"][0]["geometry"]["coordinates"]
-        return None
+        return geocode_cache.get_or_fetch(address, geocode)
+    except RateLimited:
+        raise
     except HTTPError:
         raise ValueError(f"Error fetching coordinates for address '{address}'")
     except Exception:
-        raise ValueError(f"Unexpected error occurred while fetching coordinates for address '{address}'")
\ No newline at end of file
+        raise ValueError(f"Unexpected error occurred while fetching coordinates for address '{address}'")
+
+async def afetch_coordinates(address):
+    """
+    Async version of `fetch_coordinates`, through the loop's connection pool.
+    """
+    with geocoder_call("search") as call:
+        response = await ageocoder.get("search", "/search/", params={"q": address})
+        call["status"] = response.status_code
+    response.raise_for_status()
+    data = response.json()
+    if data["features"]:
+        return data["features"][0]["geometry"]["coordinates"]
+    return None
+
+async def _cache_call(method, *args):
+    # The second tier does blocking network I/O, keep it off the event loop
+    if geocode_cache.second_tier is None:
+        return method(*args)
+    return await sync_to_async(method, thread_sensitive=False)(*args)
+
+async def aget_coordinates(address):
+    """
+    Async version of `get_coordinates`, sharing `geocode_cache`. Concurrent
+    misses for the same address on this event loop await one geocoder call.
+    """
+    if not address or not isinstance(address, str) or len(address.strip()) == 0:
+        raise ValueError("Invalid address provided. Address must be a non-empty string.")
+
+    found, coordinates = await _cache_call(geocode_cache.lookup, address)
+    if found:
+        return coordinates
+    try:
+        return await geocode_cache.flight.ado(canonicalize_address(address), _afetch_and_store, address)
+    except RateLimited:
+        raise
+    except httpx.HTTPStatusError:
+        raise ValueError(f"Error fetching coordinates for address '{address}'")
+    except Exception:
+        raise ValueError(f"Unexpected error occurred while fetching coordinates for address '{address}'")
+
+async def _afetch_and_store(address):
+    found, coordinates = geocode_cache.lru.get(canonicalize_address(address))
+    if found:
+        return coordinates
+    # Local lookups take well under a millisecond, like the LRU
+    coordinates = local_coordinates(address)
+    if coordinates is None:
+        coordinates = await afetch_coordinates(address)
+    await _cache_call(geocode_cache.store, address, coordinates)
+    return coordinates
+
+def fetch_coordinates_batch(addresses, chunk_size=5000):
+    """
+    Geocode many addresses with the API's CSV batch mode (/search/csv/),
+    `chunk_size` per request. Yields the answers of each chunk once it
+    completes, one [lon, lat] pair or None per address, in input order.
+    Raises requests.RequestException when a chunk fails; the chunks yielded
+    before it stay valid.
+    """
+    for start in range(0, len(addresses), chunk_size):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["id", "q"])
+        for offset, address in enumerate(addresses[start:start + chunk_size]):
+            writer.writerow([offset, address])
+
+        with geocoder_call("csv") as call:
+            response = geocoder.post(
+                "csv",
+                "/search/csv/",
+                files={"data": ("addresses.csv", buffer.getvalue().encode("utf-8"), "text/csv")},
+                data={"columns": "q", "result_columns": ["latitude", "longitude"]},
+                timeout=60,
+            )
+            call["status"] = response.status_code
+        response.raise_for_status()
+        results = [None] * len(addresses[start:start + chunk_size])
+        for row in csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))):
+            if row.get("latitude") and row.get("longitude"):
+                results[int(row["id"])] = [float(row["longitude"]), float(row["latitude"])]
+        yield results
+
+def get_coordinates_batch(addresses, chunk_size=5000):
+    """
+    Geocode a list of addresses, sending only the cache misses the local
+    geocoder cannot answer upstream in bulk, once per canonical address.
+    The answers of each chunk are cached as it completes, so a failing chunk
+    only loses its own addresses.
+    Returns one [lon, lat] pair or None per address, in input order.
+    """
+    results = [None] * len(addresses)
+    misses = {}
+    for i, address in enumerate(addresses):
+        found, coordinates = geocode_cache.lookup(address)
+        if not found:
+            coordinates = local_coordinates(address)
+            found = coordinates is not None
+            if found:
+                geocode_cache.store(address, coordinates)
+        if found:
+            results[i] = coordinates
+        else:
+            misses.setdefault(canonicalize_address(address), (address, []))[1].append(i)
+
+    pending = list(misses.values())
+    done = 0
+    try:
+        for chunk in fetch_coordinates_batch([address for address, _ in pending], chunk_size):
+            for (address, indexes), coordinates in zip(pending[done:], chunk):
+                geocode_cache.store(address, coordinates)
+                for i in indexes:
+                    results[i] = coordinates
+            done += len(chunk)
+    except requests.RequestException as e:
+        logger.error(f"Batch geocoding of {len(pending) - done} of {len(pending)} addresses failed: {e}")
+    return results
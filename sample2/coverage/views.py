@@ -1,45 +1,518 @@
-from django.http import JsonResponse
-from .models import CoverageData
-from .utils import get_coordinates, wgs84_to_lambert93
+import asyncio
+import functools
+import json
+import logging
+import math
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .coverage_grid import GridFile, decode
+from .metrics import CACHE_EVENTS, DB_CONNECTION_WAIT_SECONDS, db_query, render as render_metrics, stage
+from .models import RADIUS, CoverageData
+from .profiling import HEADER, QUERY_FLAG, RequestProfile, current_profile, profiling_requested, record_query
+from .rate_limit import RateLimited
+from .response_cache import make_etag, response_cache
+from .singleflight import SingleFlight
+from .transform import lambert93_errors, parse_points, wgs84_to_lambert93, wgs84_to_lambert93_arrays
+from .utils import aget_coordinates, get_coordinates, get_coordinates_batch
 
-def get_network_coverage(request):
-    operator_mapping = {
-        "20801": "Orange",
-        "20810": "SFR",
-        "20820": "Bouygues",
-        "20815": "Free",
+logger = logging.getLogger(__name__)
+
+OPERATOR_MAPPING = {
+    "20801": "Orange",
+    "20810": "SFR",
+    "20820": "Bouygues",
+    "20815": "Free",
+}
+
+# One set-based query for every point of a batch, answering like
+# CoverageData.objects.near: the rows within RADIUS of the point, found
+# through the square around it, OR-ed per operator.
+BATCH_COVERAGE_SQL = f"""
+    SELECT p.idx, c.operator, bool_or(c.g2), bool_or(c.g3), bool_or(c.g4)
+    FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[], %s::int[], %s::float8[], %s::float8[])
+         AS p(idx, x_min, x_max, y_min, y_max, px, py)
+    JOIN {CoverageData._meta.db_table} c
+      ON c.x BETWEEN p.x_min AND p.x_max AND c.y BETWEEN p.y_min AND p.y_max
+     AND (c.x - p.px) ^ 2 + (c.y - p.py) ^ 2 <= %s
+    GROUP BY p.idx, c.operator
+"""
+
+# Nearest measurement of each operator within RADIUS, read with one GiST KNN
+# probe per operator. The radius is checked outside the LATERAL: filtering
+# inside it would make the index scan walk every row of an operator that has
+# none in range. The wide x window only lets the planner prune the table's x
+# partitions; any row within RADIUS is inside it.
+NEAREST_PRUNE_WINDOW = 20000
+
+NEAREST_COVERAGE_SQL = f"""
+    SELECT o.operator, n.g2, n.g3, n.g4, n.distance
+    FROM unnest(%s::varchar[]) AS o(operator)
+    CROSS JOIN LATERAL (
+        SELECT c.g2, c.g3, c.g4, c.location <-> point(%s, %s) AS distance
+        FROM {CoverageData._meta.db_table} c
+        WHERE c.operator = o.operator AND c.x BETWEEN %s AND %s
+        ORDER BY c.location <-> point(%s, %s)
+        LIMIT 1
+    ) n
+    WHERE n.distance <= %s
+    ORDER BY n.distance, o.operator
+"""
+
+QUERY_MODES = ("radius", "nearest")
+
+# Concurrent cache misses for the same cell share one coverage lookup;
+# coverage_flight.stats() counts the lookups saved
+coverage_flight = SingleFlight()
+
+# Opened grid files by path, reopened by GridFile when they are rebuilt
+_grid_files = {}
+
+
+def get_coverage_grid():
+    """
+    The precomputed coverage grid when COVERAGE_ENGINE is "grid", or None
+    when another engine is configured or the grid is unusable.
+    """
+    if settings.COVERAGE_ENGINE != "grid":
+        return None
+    path = settings.COVERAGE_GRID_PATH
+    grid_file = _grid_files.setdefault(path, GridFile(path))
+    try:
+        grid = grid_file.get()
+    except (OSError, ValueError) as e:
+        logger.error(f"Coverage grid unavailable, using the range scan: {e}")
+        return None
+    if grid.radius != RADIUS:
+        logger.error(f"Coverage grid built for a {grid.radius:g} m radius instead of {RADIUS} m, ignoring it")
+        return None
+    return grid
+
+
+def grid_response(coverage):
+    """
+    Map a grid answer {operator code: (g2, g3, g4)} to the response format.
+    """
+    return {
+        OPERATOR_MAPPING.get(code, f"Unknown (Code={code})"): {"2G": g2, "3G": g3, "4G": g4}
+        for code, (g2, g3, g4) in coverage.items()
+    }
+
+
+def ensure_db_connection():
+    """
+    Open the thread's database connection if needed, measuring the wait
+    separately from the queries.
+    """
+    with DB_CONNECTION_WAIT_SECONDS.time():
+        connection.ensure_connection()
+
+
+def find_nearest_coverage(x, y):
+    """
+    The nearest measurement of each known operator within RADIUS, as
+    {operator name: {"2G", "3G", "4G", "distance"}} with distances in meters.
+    """
+    params = [
+        list(OPERATOR_MAPPING), x, y,
+        math.floor(x - NEAREST_PRUNE_WINDOW), math.ceil(x + NEAREST_PRUNE_WINDOW),
+        x, y, RADIUS,
+    ]
+    record_query("nearest", NEAREST_COVERAGE_SQL, params)
+    ensure_db_connection()
+    with connection.cursor() as cursor, db_query("nearest") as rows:
+        cursor.execute(NEAREST_COVERAGE_SQL, params)
+        rows.extend(cursor.fetchall())
+    return {
+        OPERATOR_MAPPING.get(operator, f"Unknown (Code={operator})"): {
+            "2G": g2,
+            "3G": g3,
+            "4G": g4,
+            "distance": round(distance, 1),
+        }
+        for operator, g2, g3, g4, distance in rows
     }
 
+
+def find_coverage(x, y, mode="radius"):
+    """
+    Coverage around a Lambert-93 point as a (payload, status) pair, shared by
+    the sync and async views.
+    """
+    if mode == "nearest":
+        response = find_nearest_coverage(x, y)
+    else:
+        # One cell read answers points inside the grid: every operator and
+        # technology found within RADIUS meters of the cell centre
+        grid = get_coverage_grid()
+        coverage = grid.lookup(x, y) if grid is not None else None
+        if coverage is not None:
+            response = grid_response(coverage)
+        else:
+            # One row per operator, aggregated by the database
+            queryset = CoverageData.objects.near(x, y, RADIUS)
+            if current_profile() is not None:
+                record_query("radius", *queryset.query.sql_with_params())
+            ensure_db_connection()
+            with db_query("radius") as rows:
+                rows.extend(queryset)
+            response = {
+                OPERATOR_MAPPING.get(operator, f"Unknown (Code={operator})"): {"2G": g2, "3G": g3, "4G": g4}
+                for operator, g2, g3, g4 in rows
+            }
+
+    if not response:
+        return {"error": "No coverage data found for the given location"}, 404
+    return response, 200
+
+
+def cached_coverage(x, y, mode="radius"):
+    """
+    (payload, status, etag) of the point from the response cache, computed
+    with `find_coverage` on a miss (for the cell centre in radius mode).
+    """
+    key, point = response_cache.locate(mode, settings.COVERAGE_ENGINE, x, y)
+    if current_profile() is not None:
+        # Profiled requests always run the lookup, to show its query plan
+        payload, status = find_coverage(*point, mode)
+        return payload, status, make_etag(payload, status)
+    version = response_cache.version()
+    entry = response_cache.get(key, version)
+    CACHE_EVENTS.labels("response", "misses" if entry is None else "hits").inc()
+    if entry is None:
+        entry = coverage_flight.do((key, version), _fill_response_cache, key, version, point, mode)
+    return entry
+
+
+def _fill_response_cache(key, version, point, mode):
+    payload, status = find_coverage(*point, mode)
+    entry = (payload, status, make_etag(payload, status))
+    response_cache.set(key, entry, version)
+    return entry
+
+
+def _acached_coverage(x, y, mode):
+    # Runs on a worker thread of its own, whose connection the request
+    # signals never reach: recycle it like they do for the request thread
+    close_old_connections()
+    try:
+        return cached_coverage(x, y, mode)
+    finally:
+        close_old_connections()
+
+
+def coverage_response(request, entry):
+    """
+    JsonResponse of a cached answer with its HTTP validators, or a 304 when
+    the client's If-None-Match already names it.
+    """
+    payload, status, etag = entry
+    response = JsonResponse(payload, status=status)
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=settings.RESPONSE_CACHE_MAX_AGE)
+    return get_conditional_response(request, etag=etag, response=response)
+
+
+def explain_queries(profile):
+    with connection.cursor() as cursor:
+        profile.explain(cursor)
+
+
+def profiled_response(request, response, profile):
+    """
+    Log the profile report and return it next to the answer, as
+    {"response": ..., "profile": ...}.
+    """
+    report = profile.report()
+    logger.info(f"Profile of {request.method} {request.get_full_path()}: {json.dumps(report)}")
+    if response.get("Content-Type") == "application/json" and response.status_code != 304:
+        response.content = json.dumps({"response": json.loads(response.content), "profile": report})
+        # The body is no longer the cached answer the validators describe
+        del response["ETag"]
+        response["Cache-Control"] = "no-store"
+    return response
+
+
+def profiled(view):
+    """
+    Run the view under a RequestProfile when a client of
+    PROFILE_ALLOWED_CLIENTS asks for it (see coverage.profiling).
+    """
+
+    def requested(request):
+        return profiling_requested(
+            request.headers.get(HEADER),
+            request.GET.get(QUERY_FLAG),
+            request.META.get("REMOTE_ADDR"),
+            settings.PROFILE_ALLOWED_CLIENTS,
+        )
+
+    if asyncio.iscoroutinefunction(view):
+
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not requested(request):
+                return await view(request, *args, **kwargs)
+            with RequestProfile() as profile:
+                response = await view(request, *args, **kwargs)
+            await sync_to_async(explain_queries)(profile)
+            return profiled_response(request, response, profile)
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not requested(request):
+            return view(request, *args, **kwargs)
+        with RequestProfile() as profile:
+            response = view(request, *args, **kwargs)
+        explain_queries(profile)
+        return profiled_response(request, response, profile)
+
+    return wrapper
+
+
+def parse_coverage_request(request):
+    """
+    Return (address, mode, error response) from the query string.
+    """
     address = request.GET.get("q")
     if not address:
-        return JsonResponse({"error": "No address provided"}, status=400)
+        return None, None, JsonResponse({"error": "No address provided"}, status=400)
+    mode = request.GET.get("mode", "radius")
+    if mode not in QUERY_MODES:
+        return None, None, JsonResponse(
+            {"error": f"Unknown mode, use one of: {', '.join(QUERY_MODES)}"}, status=400
+        )
+    return address, mode, None
+
+
+def rate_limited_response(error):
+    """
+    503 telling the client when the geocoder rate limit admits calls again.
+    """
+    response = JsonResponse({"error": "Too many geocoding requests, try again later"}, status=503)
+    response["Retry-After"] = str(math.ceil(error.retry_after))
+    return response
+
+
+@profiled
+def get_network_coverage(request):
+    address, mode, error = parse_coverage_request(request)
+    if error:
+        return error
 
     try:
-        coordinates = get_coordinates(address)
+        with stage("geocode"):
+            coordinates = get_coordinates(address)
         if not coordinates:
             return JsonResponse({"error": f"No coordinates found for address '{address}'"}, status=404)
 
-        lon, lat = coordinates
-        x, y = wgs84_to_lambert93(lon, lat)
-        RADIUS = 3000
+        with stage("transform"):
+            lon, lat = coordinates
+            x, y = wgs84_to_lambert93(lon, lat)
+        with stage("lookup"):
+            entry = cached_coverage(x, y, mode)
+        with stage("serialize"):
+            return coverage_response(request, entry)
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+@profiled
+async def aget_network_coverage(request):
+    """
+    Async version of `get_network_coverage` for ASGI servers. The geocoder
+    call only awaits the network, so one process keeps as many of them in
+    in flight as GEOCODER_MAX_CONNECTIONS allows; the lookups run in a pool
+    of worker threads with a connection each, rather than one after the
+    other on the thread Django reserves for sync code.
+    """
+    address, mode, error = parse_coverage_request(request)
+    if error:
+        return error
 
-        nearby_coverage = CoverageData.objects.filter(
-            x__range=(x - RADIUS, x + RADIUS),
-            y__range=(y - RADIUS, y + RADIUS),
+    try:
+        with stage("geocode"):
+            coordinates = await aget_coordinates(address)
+        if not coordinates:
+            return JsonResponse({"error": f"No coordinates found for address '{address}'"}, status=404)
+
+        with stage("transform"):
+            lon, lat = coordinates
+            x, y = wgs84_to_lambert93(lon, lat)
+        with stage("lookup"):
+            entry = await sync_to_async(_acached_coverage, thread_sensitive=False)(x, y, mode)
+        with stage("serialize"):
+            return coverage_response(request, entry)
+    except RateLimited as e:
+        return rate_limited_response(e)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+
+def find_coverage_batch(xs, ys):
+    """
+    Resolve the coverage of many Lambert-93 points with grid lookups when the
+    grid engine is configured, and a single query for the other points.
+    Returns one {operator name: {"2G", "3G", "4G"}} dict per point.
+    """
+    responses = [{} for _ in range(len(xs))]
+    pending = list(range(len(xs)))
+    grid = get_coverage_grid()
+    if grid is not None:
+        pending = []
+        for i, bits in enumerate(grid.lookup_bits(xs, ys)):
+            if bits >= 0:
+                responses[i] = grid_response(decode(bits, grid.operator_codes))
+            else:
+                pending.append(i)
+    if not pending:
+        return responses
+    params = [
+        pending,
+        [math.floor(xs[i] - RADIUS) for i in pending],
+        [math.ceil(xs[i] + RADIUS) for i in pending],
+        [math.floor(ys[i] - RADIUS) for i in pending],
+        [math.ceil(ys[i] + RADIUS) for i in pending],
+        [float(xs[i]) for i in pending],
+        [float(ys[i]) for i in pending],
+        RADIUS ** 2,
+    ]
+    record_query("batch", BATCH_COVERAGE_SQL, params)
+    ensure_db_connection()
+    with connection.cursor() as cursor, db_query("batch") as rows:
+        cursor.execute(BATCH_COVERAGE_SQL, params)
+        rows.extend(cursor.fetchall())
+    for idx, operator, g2, g3, g4 in rows:
+        operator_name = OPERATOR_MAPPING.get(operator, f"Unknown (Code={operator})")
+        responses[idx][operator_name] = {"2G": g2, "3G": g3, "4G": g4}
+    return responses
+
+
+@csrf_exempt
+@require_POST
+@profiled
+def batch_network_coverage(request):
+    """
+    Resolve the coverage of a list of addresses.
+    Body: {"addresses": [...]} or a bare JSON list. Results keep the input order.
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    addresses = payload.get("addresses") if isinstance(payload, dict) else payload
+    if not isinstance(addresses, list) or not addresses:
+        return JsonResponse({"error": "Provide a non-empty list of addresses"}, status=400)
+    if len(addresses) > settings.BATCH_MAX_ADDRESSES:
+        return JsonResponse(
+            {"error": f"Too many addresses, the limit is {settings.BATCH_MAX_ADDRESSES}"}, status=413
         )
 
-        response = {}
-        for coverage in nearby_coverage:
-            operator_name = operator_mapping.get(coverage.operator, f"Unknown (Code={coverage.operator})")
-            response[operator_name] = {
-                "2G": coverage.g2,
-                "3G": coverage.g3,
-                "4G": coverage.g4,
-            }
+    results = [{"address": address} for address in addresses]
+    valid = [i for i, address in enumerate(addresses) if isinstance(address, str) and address.strip()]
+    for i in set(range(len(addresses))) - set(valid):
+        results[i]["error"] = "No address provided"
+
+    coordinates = get_coordinates_batch([addresses[i] for i in valid])
+    located = []
+    for i, coords in zip(valid, coordinates):
+        if coords:
+            located.append((i, coords))
+        else:
+            results[i]["error"] = f"No coordinates found for address '{addresses[i]}'"
+
+    if located:
+        xs, ys = wgs84_to_lambert93_arrays(
+            [coords[0] for _, coords in located], [coords[1] for _, coords in located]
+        )
+        try:
+            coverage_per_point = find_coverage_batch(xs, ys)
+        except DatabaseError as e:
+            logger.error(f"Coverage query failed: {e}")
+            return JsonResponse({"error": "Internal server error"}, status=500)
+        for (i, _), coverage in zip(located, coverage_per_point):
+            if coverage:
+                results[i]["coverage"] = coverage
+            else:
+                results[i]["error"] = "No coverage data found for the given location"
 
-        if not response:
-            return JsonResponse({"error": "No coverage data found for the given location"}, status=404)
+    return JsonResponse({"results": results})
 
-        return JsonResponse(response)
+
+def coverage_lines(xs, ys, ids, errors):
+    """
+    NDJSON lines answering POST /api/coordinates, in input order. Points are
+    resolved COORDINATES_CHUNK_SIZE at a time, so the first lines go out
+    before the last chunk is queried. A database error ends the stream with
+    an error line.
+    """
+    chunk_size = settings.COORDINATES_CHUNK_SIZE
+    for start in range(0, len(xs), chunk_size):
+        end = min(start + chunk_size, len(xs))
+        valid = [i for i in range(start, end) if errors[i] is None]
+        try:
+            with stage("lookup"):
+                coverage = dict(zip(valid, find_coverage_batch(xs[valid], ys[valid]) if valid else []))
+        except DatabaseError as e:
+            logger.error(f"Coverage query failed: {e}")
+            yield json.dumps({"error": "Internal server error"}) + "\n"
+            return
+        with stage("serialize"):
+            lines = []
+            for i in range(start, end):
+                line = {"index": i}
+                if ids[i] is not None:
+                    line["id"] = ids[i]
+                if errors[i] is not None:
+                    line["error"] = errors[i]
+                elif coverage[i]:
+                    line["coverage"] = coverage[i]
+                else:
+                    line["error"] = "No coverage data found for the given location"
+                lines.append(json.dumps(line) + "\n")
+        yield "".join(lines)
+
+
+@csrf_exempt
+@require_POST
+def coordinates_network_coverage(request):
+    """
+    Resolve the coverage of WGS84 points without geocoding them.
+    Body: a JSON list of [lon, lat] pairs or {"lon", "lat"} objects, or a
+    GeoJSON FeatureCollection of Points. Streams one NDJSON line per point.
+    """
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    try:
+        lons, lats, ids, errors = parse_points(payload)
     except ValueError as e:
         return JsonResponse({"error": str(e)}, status=400)
+    if not lons:
+        return JsonResponse({"error": "Provide at least one point"}, status=400)
+    if len(lons) > settings.COORDINATES_MAX_POINTS:
+        return JsonResponse(
+            {"error": f"Too many points, the limit is {settings.COORDINATES_MAX_POINTS}"}, status=413
+        )
+
+    with stage("transform"):
+        xs, ys = wgs84_to_lambert93_arrays(lons, lats)
+        errors = lambert93_errors(xs, ys, errors)
+    return StreamingHttpResponse(coverage_lines(xs, ys, ids, errors), content_type="application/x-ndjson")
+
+
+def prometheus_metrics(request):
+    """
+    Prometheus exposition of the metrics of every worker (see coverage.metrics).
+    """
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
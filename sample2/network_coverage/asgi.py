@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'network_coverage.settings')
+# Under ASGI, /api/ is served by the async view (see coverage.views)
+os.environ.setdefault('ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
@@ -133,6 +133,112 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Source file of the weekly dataset refresh (CSV or snapshot)
+COVERAGE_DATA_PATH = env('COVERAGE_DATA_PATH', default=os.path.join(BASE_DIR, 'data.csv'))
+
+# "database" answers /api/ with a range scan, "grid" with a lookup in the
+# precomputed coverage grid, rebuilt after every dataset refresh
+COVERAGE_ENGINE = env('COVERAGE_ENGINE', default='database')
+COVERAGE_GRID_PATH = env('COVERAGE_GRID_PATH', default=os.path.join(BASE_DIR, 'coverage.grid'))
+COVERAGE_GRID_CELL_SIZE = env.float('COVERAGE_GRID_CELL_SIZE', default=250)
+
+GEOCODER_URL = env('GEOCODER_URL', default='https://api-adresse.data.gouv.fr')
+
+# Client of the sync geocoder calls (see coverage.geocoder_client): keep-alive
+# pool, retries with jitter, circuit breaker and optional hedged requests
+GEOCODER_CLIENT = {
+    'timeout': env.float('GEOCODER_TIMEOUT', default=5),
+    'pool_size': env.int('GEOCODER_POOL_SIZE', default=10),
+    'retries': env.int('GEOCODER_RETRIES', default=2),
+    'backoff': env.float('GEOCODER_RETRY_BACKOFF', default=0.1),
+    'breaker_threshold': env.int('GEOCODER_BREAKER_THRESHOLD', default=5),
+    'breaker_reset': env.float('GEOCODER_BREAKER_RESET', default=30),
+    'hedge': env.bool('GEOCODER_HEDGE', default=False),
+}
+
+# Rate limit of the geocoder calls shared by every worker (see
+# coverage.rate_limit): calls per second (0 disables it) and burst. Calls
+# wait for their turn up to max_wait seconds, max_queue at most per process.
+# While Redis is unreachable each process allows fallback_rate calls per
+# second; 0 gives it its share of the limit among `workers` processes
+GEOCODER_RATE_LIMIT = {
+    'backend': env('GEOCODER_RATE_LIMIT_BACKEND', default='redis'),
+    'rate': env.float('GEOCODER_RATE_LIMIT', default=40),
+    'burst': env.int('GEOCODER_RATE_BURST', default=40),
+    'fallback_rate': env.float('GEOCODER_RATE_LIMIT_FALLBACK', default=0),
+    'workers': env.int('GEOCODER_RATE_LIMIT_WORKERS', default=4),
+    'max_wait': env.float('GEOCODER_RATE_LIMIT_MAX_WAIT', default=5),
+    'max_queue': env.int('GEOCODER_RATE_LIMIT_MAX_QUEUE', default=100),
+    'redis_url': env('GEOCODER_RATE_LIMIT_REDIS_URL', default='redis://localhost:6379/1'),
+}
+
+# Offline BAN index built by `manage.py build_geocoder`, tried before the
+# API; answers below the confidence threshold go to the API
+LOCAL_GEOCODER_PATH = env('LOCAL_GEOCODER_PATH', default='')
+LOCAL_GEOCODER_MIN_CONFIDENCE = env.float('LOCAL_GEOCODER_MIN_CONFIDENCE', default=0.7)
+
+# Concurrent geocoder connections per event loop for the async view
+GEOCODER_MAX_CONNECTIONS = env.int('GEOCODER_MAX_CONNECTIONS', default=100)
+
+# Serve /api/ with the async view; asgi.py turns it on by default
+ASYNC_VIEWS = env.bool('ASYNC_VIEWS', default=False)
+
+# Largest list of addresses accepted by POST /api/batch
+BATCH_MAX_ADDRESSES = env.int('BATCH_MAX_ADDRESSES', default=10000)
+
+# Largest list of points accepted by POST /api/coordinates, and the number of
+# points resolved per query while its answer streams out
+COORDINATES_MAX_POINTS = env.int('COORDINATES_MAX_POINTS', default=50000)
+COORDINATES_CHUNK_SIZE = env.int('COORDINATES_CHUNK_SIZE', default=5000)
+
+# Addresses or CIDR blocks allowed to profile their requests with the
+# X-Coverage-Profile header (see coverage.profiling)
+PROFILE_ALLOWED_CLIENTS = env.list('PROFILE_ALLOWED_CLIENTS', default=[])
+
+# Geocoding cache: in-process LRU in front of a shared second tier
+# ("redis", "sqlite" or "memory" for none)
+GEOCODE_CACHE = {
+    'backend': env('GEOCODE_CACHE_BACKEND', default='redis'),
+    'max_size': env.int('GEOCODE_CACHE_SIZE', default=10000),
+    'ttl': env.int('GEOCODE_CACHE_TTL', default=86400),
+    'negative_ttl': env.int('GEOCODE_CACHE_NEGATIVE_TTL', default=3600),
+    'sqlite_path': env('GEOCODE_CACHE_SQLITE_PATH', default=os.path.join(BASE_DIR, 'geocode_cache.sqlite3')),
+    'redis_url': env('GEOCODE_CACHE_REDIS_URL', default='redis://localhost:6379/1'),
+}
+
+# Cache of /api/ answers: points in the same RESPONSE_CACHE_CELL_SIZE cell
+# share one answer, computed for the cell centre. The "coverage" cache is
+# Redis ("locmem" keeps it in the process); while Redis fails the
+# process-local "coverage_local" cache is used instead
+RESPONSE_CACHE_BACKEND = env('RESPONSE_CACHE_BACKEND', default='redis')
+RESPONSE_CACHE = {
+    'cell_size': env.float('RESPONSE_CACHE_CELL_SIZE', default=25),
+    'version_ttl': env.float('RESPONSE_CACHE_VERSION_TTL', default=5),
+}
+RESPONSE_CACHE_TTL = env.int('RESPONSE_CACHE_TTL', default=86400)
+# Seconds clients and proxies may reuse an answer before revalidating it
+RESPONSE_CACHE_MAX_AGE = env.int('RESPONSE_CACHE_MAX_AGE', default=300)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'coverage': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': env('RESPONSE_CACHE_REDIS_URL', default='redis://localhost:6379/2'),
+        'TIMEOUT': RESPONSE_CACHE_TTL,
+        'OPTIONS': {'socket_connect_timeout': 0.2, 'socket_timeout': 0.2},
+    },
+    'coverage_local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'coverage_local',
+        'TIMEOUT': RESPONSE_CACHE_TTL,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+if RESPONSE_CACHE_BACKEND == 'locmem':
+    CACHES['coverage'] = CACHES['coverage_local']
+
 CELERY_BROKER_URL = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
@@ -16,8 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from coverage.views import prometheus_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('coverage.urls')),  # Include coverage app URLs
+    path('metrics', prometheus_metrics, name='metrics'),
 ]
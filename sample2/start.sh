@@ -4,5 +4,14 @@ echo "Running migrations..."
 python manage.py makemigrations --noinput
 python manage.py migrate --noinput
 
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    # Metrics files left by a previous run would be added to the new samples
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 echo "Starting server..."
+if [ "$SERVER" = "asgi" ]; then
+    exec uvicorn network_coverage.asgi:application --host 0.0.0.0 --port 8000
+fi
 exec python manage.py runserver 0.0.0.0:8000